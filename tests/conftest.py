@@ -0,0 +1,25 @@
+# tests/conftest.py
+"""
+Shared fixtures for the AIGrader service tests.
+"""
+
+import pytest
+
+from website import create_app
+from website.models import db
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    Testing application with its own SQLite file, inside an app context.
+
+    A file database (rather than ``:memory:``) lets services that open
+    their own connection see the same tables as the session.
+    """
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,190 @@
+# tests/test_classroom_import.py
+"""
+Tests for the incremental sync watermark and the bulk submission upsert
+of the Google Classroom importer.
+"""
+
+import json
+from concurrent.futures import Future
+from datetime import datetime
+
+import pytest
+
+from website.models import Assignment, Class, ClassroomSyncState, Submission, SubmissionAttachment, db
+from website.services import classroom_import
+from website.services.classroom_import import (
+    ClassroomImporter, EXTRACTION_FAILED_TEXT, attachment_text, extraction_failed,
+    parse_update_time, placeholder_email, process_drive_file, save_submissions
+)
+
+
+@pytest.fixture
+def assignment(app):
+    cls = Class(name='Biology')
+    db.session.add(cls)
+    db.session.flush()
+    assignment = Assignment(name='Essay', question='Explain osmosis.', class_id=cls.id)
+    db.session.add(assignment)
+    db.session.commit()
+    return assignment
+
+
+def test_process_drive_file_reports_failures_as_none(monkeypatch):
+    def broken_service(*args):
+        raise ConnectionError("Drive unavailable")
+
+    monkeypatch.setattr(classroom_import, 'google_service', broken_service)
+
+    assert process_drive_file(None, 'f1', 'essay.pdf') is None
+
+
+def classroom_submission(user_id, update_time, file_id=None):
+    submission = {'userId': user_id, 'updateTime': update_time, 'assignmentSubmission': {'text': "answer"}}
+    if file_id:
+        submission['assignmentSubmission']['attachments'] = [{'driveFile': {'id': file_id, 'title': f"{file_id}.pdf"}}]
+    return submission
+
+
+@pytest.fixture
+def importer(monkeypatch):
+    """Importer reading one page of three submissions; the 'broken' file fails to extract."""
+    pages = [[
+        classroom_submission('u1', '2024-03-01T10:00:00Z', 'good'),
+        classroom_submission('u2', '2024-03-02T10:00:00Z', 'broken'),
+        classroom_submission('u3', '2024-03-03T10:00:00Z'),
+    ]]
+    monkeypatch.setattr(classroom_import, 'iter_student_submission_pages', lambda *args: iter(pages))
+    monkeypatch.setattr(classroom_import, 'process_drive_file',
+                        lambda credentials, file_id, title: None if file_id == 'broken' else "text")
+    monkeypatch.setattr(ClassroomImporter, '_service', lambda self: None)
+    importer = ClassroomImporter(credentials=None)
+    importer.pages = pages
+    return importer
+
+
+def roster():
+    future = Future()
+    future.set_result({
+        user_id: {'name': {'fullName': user_id.upper()}, 'emailAddress': f"{user_id}@school.edu"}
+        for user_id in ('u1', 'u2', 'u3')
+    })
+    return future
+
+
+def test_failed_extraction_is_flagged():
+    future = Future()
+    future.set_result(None)
+    result = classroom_import.process_submission(
+        None, None, classroom_submission('u1', None, 'f1'), roster().result(), 'course', {'f1': future}
+    )
+
+    assert extraction_failed(result)
+    assert EXTRACTION_FAILED_TEXT in result[2]
+
+
+def test_watermark_stops_below_failed_submission(importer):
+    rows, latest, skipped = importer.fetch_submissions('course', 'work', roster())
+
+    assert len(rows) == 3 and skipped == 0
+    assert [extraction_failed(item) for item in rows] == [False, True, False]
+    assert latest == parse_update_time('2024-03-01T10:00:00Z')
+
+
+def test_watermark_advances_to_newest_without_failures(importer):
+    importer.pages[0][1]['assignmentSubmission'].pop('attachments')
+
+    _, latest, _ = importer.fetch_submissions('course', 'work', roster())
+
+    assert latest == parse_update_time('2024-03-03T10:00:00Z')
+
+
+def test_watermark_skips_unchanged_and_retries_failed(importer):
+    since = parse_update_time('2024-03-01T10:00:00Z')
+
+    rows, latest, skipped = importer.fetch_submissions('course', 'work', roster(), since)
+
+    assert skipped == 1
+    assert [item[1] for item in rows] == ['u2@school.edu', 'u3@school.edu']
+    assert latest == since
+
+
+def test_save_sync_state_never_moves_watermark_back(assignment):
+    item = {'id': 'work', 'updateTime': '2024-03-01T00:00:00Z'}
+    states = {}
+    newer, older = datetime(2024, 3, 5), datetime(2024, 3, 1)
+
+    ClassroomImporter.save_sync_state(assignment.class_id, assignment.id, item, newer, states)
+    ClassroomImporter.save_sync_state(assignment.class_id, assignment.id, item, older, states)
+
+    [state] = ClassroomSyncState.query.all()
+    assert state.submissions_updated_at == newer
+    assert state.assignment_id == assignment.id
+
+
+def row(name, email, answer, files=None):
+    return (name, email, answer, json.dumps({'files': []}), files)
+
+
+def attachment(file_id, text):
+    return {'file_name': f"{file_id}.pdf", 'file_id': file_id, 'text': text}
+
+
+def submissions_of(assignment):
+    return {submission.student_email: submission for submission in
+            Submission.query.filter_by(assignment_id=assignment.id)}
+
+
+def test_save_submissions_inserts_then_updates_by_email(assignment):
+    assert save_submissions(assignment.id, [
+        row('Ada', 'ada@school.edu', "first"),
+        row('Ben', 'ben@school.edu', "first"),
+    ]) == 2
+    graded = submissions_of(assignment)['ada@school.edu']
+    graded.grade = 90
+    db.session.commit()
+
+    assert save_submissions(assignment.id, [
+        row('Ada', 'ada@school.edu', "second"),
+        row('Cy', 'cy@school.edu', "first"),
+    ]) == 2
+
+    saved = submissions_of(assignment)
+    assert sorted(saved) == ['ada@school.edu', 'ben@school.edu', 'cy@school.edu']
+    assert saved['ada@school.edu'].student_answer == "second"
+    assert saved['ada@school.edu'].grade == 90  # Updates leave grades alone
+    assert saved['cy@school.edu'].grade == 0
+
+
+def test_save_submissions_matches_legacy_placeholder_by_name(assignment):
+    db.session.add(Submission(student_name='Dee', student_email='student_1700000000@placeholder.edu',
+                              student_answer="old", assignment_id=assignment.id))
+    db.session.commit()
+
+    save_submissions(assignment.id, [row('Dee', placeholder_email('user-4'), "new")])
+
+    [submission] = submissions_of(assignment).values()
+    assert submission.student_email == placeholder_email('user-4')
+    assert submission.student_answer == "new"
+
+
+def test_save_submissions_syncs_attachments(assignment):
+    save_submissions(assignment.id, [
+        row('Ada', 'ada@school.edu', "a", [attachment('f1', "one"), attachment('f2', "two")]),
+    ])
+    submission = submissions_of(assignment)['ada@school.edu']
+    assert attachment_text(submission, 'f1') == "one"
+
+    save_submissions(assignment.id, [
+        row('Ada', 'ada@school.edu', "a", [attachment('f1', "changed")]),
+        row('Ben', 'ben@school.edu', "b", None),  # None leaves attachments untouched
+    ])
+
+    db.session.expire_all()
+    stored = {item.file_id: item.text for item in SubmissionAttachment.query}
+    assert stored == {'f1': "changed"}
+
+
+def test_placeholder_email_is_stable():
+    assert placeholder_email('user-1') == placeholder_email('user-1')
+    assert placeholder_email('user-1') != placeholder_email('user-2')
+    assert placeholder_email('user-1').endswith('@placeholder.edu')
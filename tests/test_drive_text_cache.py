@@ -0,0 +1,63 @@
+# tests/test_drive_text_cache.py
+"""
+Tests for revision matching, eviction and session isolation of the Drive
+text cache.
+"""
+
+from datetime import datetime, timedelta
+
+from website.models import Class, DriveTextCacheEntry, db
+from website.services.drive_text_cache import DriveTextCache, file_revision
+
+
+def test_file_revision_prefers_content_checksum():
+    assert file_revision({'md5Checksum': 'abc', 'version': '3'}) == "md5:abc"
+    assert file_revision({'version': '3', 'modifiedTime': 't'}) == "v:3:t"
+    assert file_revision({}) is None
+
+
+def test_hit_requires_matching_revision(app):
+    cache = DriveTextCache()
+    cache.set('f1', 'md5:a', 'application/pdf', "text")
+
+    assert cache.get('f1', 'md5:a') == "text"
+    assert cache.get('f1', 'md5:b') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_set_overwrites_previous_revision(app):
+    cache = DriveTextCache()
+    cache.set('f1', 'md5:a', 'application/pdf', "old")
+    cache.set('f1', 'md5:b', 'application/pdf', "new")
+
+    assert cache.get('f1', 'md5:b') == "new"
+    assert DriveTextCacheEntry.query.count() == 1
+
+
+def test_evict_removes_entries_unused_for_max_age(app):
+    cache = DriveTextCache(max_age=60)
+    cache.set('old', 'md5:a', None, "text")
+    cache.set('new', 'md5:a', None, "text")
+    db.session.query(DriveTextCacheEntry).filter_by(file_id='old').update(
+        {'last_used_at': datetime.utcnow() - timedelta(seconds=120)}
+    )
+    db.session.commit()
+
+    assert cache.evict() == 1
+    assert [entry.file_id for entry in DriveTextCacheEntry.query] == ['new']
+
+
+def test_cache_leaves_callers_session_alone(app):
+    cache = DriveTextCache()
+    cls = Class(name='Before')
+    db.session.add(cls)
+    db.session.commit()
+    cls.name = 'Pending'
+
+    cache.set('f1', 'md5:a', None, "text")
+    assert cache.get('f1', 'md5:a') == "text"
+
+    # The pending change was neither committed nor expired by the cache
+    assert cls in db.session.dirty
+    db.session.rollback()
+    assert db.session.get(Class, cls.id).name == 'Before'
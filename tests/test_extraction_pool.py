@@ -0,0 +1,61 @@
+# tests/test_extraction_pool.py
+"""
+Tests for job timeouts and pool restarts in the text extraction pool.
+
+Jobs are plain ``time.sleep`` calls so worker processes need nothing from
+the test module.
+"""
+
+import time
+
+import pytest
+
+from website.services.extraction_pool import ExtractionTimeout, TextExtractionPool
+
+
+@pytest.fixture
+def pool():
+    pool = TextExtractionPool(processes=1, timeout=1, memory_limit=0)
+    yield pool
+    if pool._executor is not None:
+        pool._reset(pool._executor, terminate=True)
+
+
+def test_timeout_counts_from_job_start(pool):
+    # Three queued jobs: the last waits ~1.2s in total but runs only 0.4s
+    started = time.monotonic()
+
+    assert pool.map(time.sleep, [(0.4,), (0.4,), (0.4,)]) == [None, None, None]
+    assert time.monotonic() - started >= 1.2
+
+
+def test_job_exceeding_timeout_fails_without_losing_its_worker(pool):
+    pool.run(time.sleep, 0)  # Start the worker before timing
+    executor = pool._executor
+    started = time.monotonic()
+
+    with pytest.raises(ExtractionTimeout):
+        pool.run(time.sleep, 5)
+
+    assert time.monotonic() - started < 3
+    assert pool._executor is executor
+    assert pool.run(time.sleep, 0) is None
+
+
+def test_per_call_timeout_overrides_default(pool):
+    with pytest.raises(ExtractionTimeout):
+        pool.run(time.sleep, 2, timeout=0.5)
+    assert pool.run(time.sleep, 1.5, timeout=3) is None
+
+
+def test_jobs_lost_to_a_restart_are_retried(pool):
+    job = pool._submit(time.sleep, (0.2,), pool.timeout)
+    queued = pool._submit(time.sleep, (0.2,), pool.timeout)
+    executor = job[0]
+
+    # Another caller's hung job forces the pool to be torn down
+    pool._reset(executor, terminate=True)
+
+    assert pool._result(job, time.sleep, (0.2,), pool.timeout) is None
+    assert pool._result(queued, time.sleep, (0.2,), pool.timeout) is None
+    assert pool._executor is not executor
@@ -0,0 +1,107 @@
+# tests/test_grading_cache.py
+"""
+Tests for grading cache TTL expiry, LRU eviction and session isolation.
+"""
+
+from datetime import datetime, timedelta
+
+from website.models import Class, GradingCacheEntry, db
+from website.services.grading_cache import GradingCache
+from website.services.grading_pipeline import (
+    FALLBACK_FLAG, error_result, is_cacheable_result, parse_grading_response
+)
+
+RESULT = {'grade': "88/100", 'feedback': "Well argued"}
+
+
+def age_entry(key, **ages):
+    """Move an entry's timestamps into the past, bypassing the cache."""
+    values = {column: datetime.utcnow() - timedelta(seconds=seconds) for column, seconds in ages.items()}
+    db.session.query(GradingCacheEntry).filter_by(key=key).update(values)
+    db.session.commit()
+
+
+def test_make_key_normalizes_whitespace():
+    assert GradingCache.make_key('fp', " an\n answer ") == GradingCache.make_key('fp', "an answer")
+    assert GradingCache.make_key('fp', "an answer") != GradingCache.make_key('other', "an answer")
+
+
+def test_unparseable_response_is_flagged_and_not_cacheable():
+    result = parse_grading_response("Nice work overall, I would give this 64/100.")
+
+    assert result['grade'] == "64/100"
+    assert result[FALLBACK_FLAG] is True
+    assert not is_cacheable_result(result)
+
+
+def test_error_result_is_not_cacheable():
+    result = error_result(RuntimeError("boom"))
+
+    assert result['grade'] == "Error"
+    assert not is_cacheable_result(result)
+
+
+def test_set_then_get_counts_hits(app):
+    cache = GradingCache(ttl=3600)
+
+    assert cache.get('k') is None
+    cache.set('k', RESULT, 'model')
+    assert cache.get('k') == RESULT
+
+    entry = db.session.get(GradingCacheEntry, 'k')
+    assert entry.hit_count == 1
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_set_overwrites_existing_entry(app):
+    cache = GradingCache(ttl=3600)
+    cache.set('k', RESULT)
+    cache.set('k', {'grade': "50/100"})
+
+    assert cache.get('k') == {'grade': "50/100"}
+    assert GradingCacheEntry.query.count() == 1
+
+
+def test_expired_entry_is_a_miss_and_removed(app):
+    cache = GradingCache(ttl=60)
+    cache.set('k', RESULT)
+    age_entry('k', created_at=120)
+
+    assert cache.get('k') is None
+    assert db.session.get(GradingCacheEntry, 'k') is None
+
+
+def test_evict_removes_expired_then_least_recently_used(app):
+    cache = GradingCache(ttl=60, max_entries=2)
+    for key in ('old', 'a', 'b', 'c'):
+        cache.set(key, RESULT)
+    age_entry('old', created_at=120)
+    age_entry('a', last_used_at=30)
+    age_entry('b', last_used_at=10)
+
+    assert cache.evict() == 2
+    assert sorted(entry.key for entry in GradingCacheEntry.query) == ['b', 'c']
+
+
+def test_disabled_cache_stores_nothing(app):
+    cache = GradingCache(enabled=False)
+    cache.set('k', RESULT)
+
+    assert cache.get('k') is None
+    assert GradingCacheEntry.query.count() == 0
+
+
+def test_cache_leaves_callers_session_alone(app):
+    cache = GradingCache(ttl=3600)
+    cls = Class(name='Before')
+    db.session.add(cls)
+    db.session.commit()
+    cls.name = 'Pending'
+
+    cache.set('k', RESULT)
+    assert cache.get('k') == RESULT
+
+    # The pending change was neither committed nor expired by the cache
+    assert cls in db.session.dirty
+    db.session.rollback()
+    assert db.session.get(Class, cls.id).name == 'Before'
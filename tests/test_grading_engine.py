@@ -0,0 +1,103 @@
+# tests/test_grading_engine.py
+"""
+Tests for the bounded grading window of the batch grading engine.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from website.services.grading_engine import BatchGradingEngine
+
+
+class ConcurrencyProbe:
+    """Grading function that records how many calls run at once."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, payload):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        if payload == 'fail':
+            raise ValueError("grading failed")
+        return payload * 2
+
+
+@pytest.fixture
+def engine():
+    engine = BatchGradingEngine(pool_size=3, max_concurrency=4)
+    yield engine
+    engine.shutdown()
+
+
+def test_window_bounds_calls_in_flight(engine):
+    probe = ConcurrencyProbe()
+    results = list(engine.run([(i, i) for i in range(20)], probe))
+
+    assert sorted(key for key, _, _ in results) == list(range(20))
+    assert all(result == key * 2 and error is None for key, result, error in results)
+    assert probe.peak == 3
+
+
+def test_pool_size_override_is_capped_by_global_limit(engine):
+    probe = ConcurrencyProbe()
+    list(engine.run([(i, i) for i in range(20)], probe, pool_size=10))
+
+    assert probe.peak == 4
+
+
+def test_concurrent_jobs_share_global_cap(engine):
+    probe = ConcurrencyProbe()
+
+    def job(offset):
+        list(engine.run([(offset + i, i) for i in range(12)], probe))
+
+    threads = [threading.Thread(target=job, args=(offset,)) for offset in (0, 100, 200)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert probe.peak <= engine.max_concurrency
+
+
+def test_errors_are_yielded_per_task(engine):
+    results = {key: (result, error) for key, result, error in engine.run(
+        [('ok', 2), ('bad', 'fail')], ConcurrencyProbe(delay=0)
+    )}
+
+    assert results['ok'] == (4, None)
+    assert results['bad'][0] is None
+    assert isinstance(results['bad'][1], ValueError)
+
+
+def test_async_grade_fn_uses_async_window():
+    engine = BatchGradingEngine(pool_size=2, max_concurrency=2, async_pool_size=5)
+    active = 0
+    peak = 0
+
+    async def grade(payload):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        return payload
+
+    try:
+        results = list(engine.run([(i, i) for i in range(15)], grade))
+    finally:
+        engine.shutdown()
+
+    assert sorted(result for _, result, _ in results) == list(range(15))
+    assert peak == 5
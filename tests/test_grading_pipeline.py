@@ -0,0 +1,264 @@
+# tests/test_grading_pipeline.py
+"""
+Tests for prompt compilation, response parsing, prompt packing and
+packed-call retries in the grading pipeline.
+"""
+
+import json
+
+import pytest
+
+from website.services import grading_cache, grading_engine, grading_pipeline, rate_limiter
+from website.services.grading_pipeline import (
+    CompiledPrompt, GradingPipeline, RESULT_KEYS, UnusableResultError,
+    is_usable_result, numeric_grade, parse_grading_response, parse_packed_response
+)
+
+
+class HTTPError(Exception):
+    """Inference error carrying an HTTP response, like requests' HTTPError."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type('Response', (), {'status_code': status_code, 'headers': headers or {}})()
+
+
+class DictCache:
+    """In-memory stand-in for the grading cache."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, result, model_name=None):
+        self.entries[key] = result
+
+
+class ScriptedEngine:
+    """Grading engine that answers each request from a test-supplied function."""
+
+    use_async = False
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+
+    def run(self, requests, grade_fn):
+        for request_key, payload in requests:
+            self.requests.append(request_key)
+            try:
+                yield request_key, self.respond(request_key, payload), None
+            except Exception as e:
+                yield request_key, None, e
+
+
+def packed_response(count, start_grade=80):
+    return json.dumps([{'id': i + 1, 'grade': f"{start_grade + i}/100", 'feedback': f"answer {i + 1}"}
+                       for i in range(count)])
+
+
+def single_response(grade=90):
+    return json.dumps({key: 'x' for key in RESULT_KEYS} | {'grade': f"{grade}/100"})
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = DictCache()
+    monkeypatch.setattr(grading_cache, '_grading_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    policy = rate_limiter.RetryPolicy(rate_limiter.AdaptiveRateLimiter(), base_delay=0, max_delay=0)
+    monkeypatch.setattr(rate_limiter, '_retry_policy', policy)
+    monkeypatch.setattr(grading_pipeline.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def use_engine(monkeypatch, respond):
+    engine = ScriptedEngine(respond)
+    monkeypatch.setattr(grading_engine, '_grading_engine', engine)
+    return engine
+
+
+def test_parse_valid_json_response():
+    result = parse_grading_response('```json\n{"grade": 85, "feedback": "Good"}\n```')
+
+    assert result['grade'] == "85/100"
+    assert result['feedback'] == "Good"
+    assert set(RESULT_KEYS) <= set(result)
+
+
+def test_parse_json_object_surrounded_by_text():
+    result = parse_grading_response('Here you go: {"grade": "77/100", "feedback": "f"} Thanks!')
+
+    assert result['grade'] == "77/100"
+
+
+def test_numeric_grade():
+    assert numeric_grade({'grade': "72/100"}) == 72
+    assert numeric_grade({'grade': 55}) == 55
+    assert numeric_grade({'grade': "n/a", 'feedback': "no score"}) is None
+    assert numeric_grade({'grade': "n/a"}, default=0) == 0
+
+
+def test_fallback_and_gradeless_results_are_not_usable():
+    assert is_usable_result(parse_grading_response('{"grade": "72/100", "feedback": "f"}'))
+    assert not is_usable_result(parse_grading_response("I would grade this 40/100"))
+    assert not is_usable_result(parse_grading_response('{"grade": "n/a", "feedback": "f"}'))
+
+
+def test_parse_packed_response_maps_ids_and_skips_missing():
+    response = json.dumps([{'id': 2, 'grade': 60}, {'id': '1', 'grade': "90/100"}, {'id': 9, 'grade': 10}])
+
+    results = parse_packed_response(response, 3)
+
+    assert set(results) == {0, 1}
+    assert results[0]['grade'] == "90/100"
+    assert results[1]['grade'] == "60/100"
+
+
+@pytest.mark.parametrize('response', ["not json", "[1, 2]", '{"grade": 50}'])
+def test_parse_packed_response_rejects_unusable_responses(response):
+    with pytest.raises(ValueError):
+        parse_packed_response(response, 2)
+
+
+def test_packed_and_single_cache_keys_differ():
+    compiled = CompiledPrompt("Question?", {'Accuracy': 50}, model_name='model')
+
+    assert compiled.cache_key("answer") != compiled.cache_key("answer", packed=True)
+    assert compiled.cache_key("an   answer") == compiled.cache_key("an answer")
+
+
+def test_render_appends_answer_to_shared_prefix():
+    compiled = CompiledPrompt("Explain osmosis.", {'Accuracy': 50})
+
+    assert compiled.render("Water moves.").startswith(compiled.prefix)
+    assert compiled.render("Water moves.").endswith("Water moves.")
+
+
+def test_fingerprint_changes_with_rubric():
+    assert CompiledPrompt("Q", {'a': 1}).fingerprint != CompiledPrompt("Q", {'a': 2}).fingerprint
+    assert CompiledPrompt("Q", {'a': 1}).fingerprint == CompiledPrompt("Q", {'a': 1}).fingerprint
+
+
+def test_pack_groups_short_answers_by_prompt():
+    pipeline = GradingPipeline('model', pack_size=2, pack_max_chars=10)
+    first = CompiledPrompt("Q1")
+    second = CompiledPrompt("Q2")
+    pending = [
+        ('a', first, "short"),
+        ('b', first, "short"),
+        ('c', first, "short"),
+        ('d', first, "a much longer answer"),
+        ('e', second, "short"),
+    ]
+
+    requests = pipeline._pack(pending)
+    kinds = sorted((kind, tuple(item[0] for item in target) if kind == 'packed' else target)
+                   for (kind, target), _ in requests)
+
+    assert kinds == [('packed', ('a', 'b')), ('single', 'c'), ('single', 'd'), ('single', 'e')]
+    packed_prompt = next(payload[0] for (kind, _), payload in requests if kind == 'packed')
+    assert "[id: 1]\nshort" in packed_prompt and "[id: 2]\nshort" in packed_prompt
+
+
+def test_run_caches_packed_results_under_packed_key(monkeypatch, cache, sleeps):
+    engine = use_engine(monkeypatch, lambda request_key, payload: packed_response(2))
+    pipeline = GradingPipeline('model', packing_enabled=True, pack_size=2)
+    compiled = pipeline.compile("Q")
+
+    results = {key: result for key, result, error in pipeline.run([('a', compiled, "x"), ('b', compiled, "y")])}
+
+    assert [kind for kind, _ in engine.requests] == ['packed']
+    assert results['a']['grade'] == "80/100" and results['b']['grade'] == "81/100"
+    assert compiled.cache_key("x", packed=True) in cache.entries
+    assert compiled.cache_key("x") not in cache.entries
+
+    # A later packed run is served from the packed entries without a call
+    engine.requests.clear()
+    assert len(list(pipeline.run([('a', compiled, "x"), ('b', compiled, "y")]))) == 2
+    assert engine.requests == []
+
+
+def test_run_regrades_answers_missing_from_packed_response(monkeypatch, cache, sleeps):
+    def respond(request_key, payload):
+        return packed_response(1) if request_key[0] == 'packed' else single_response(55)
+
+    engine = use_engine(monkeypatch, respond)
+    pipeline = GradingPipeline('model', packing_enabled=True, pack_size=2)
+    compiled = pipeline.compile("Q")
+
+    results = {key: result for key, result, error in pipeline.run([('a', compiled, "x"), ('b', compiled, "y")])}
+
+    assert [kind for kind, _ in engine.requests] == ['packed', 'single']
+    assert results['a']['grade'] == "80/100"
+    assert results['b']['grade'] == "55/100"
+
+
+def test_throttled_pack_is_retried_as_a_unit(monkeypatch, cache, sleeps):
+    calls = []
+
+    def respond(request_key, payload):
+        calls.append(request_key[0])
+        if len(calls) == 1:
+            raise HTTPError(429, {'Retry-After': '3'})
+        return packed_response(2)
+
+    use_engine(monkeypatch, respond)
+    pipeline = GradingPipeline('model', packing_enabled=True, pack_size=2)
+    compiled = pipeline.compile("Q")
+
+    results = list(pipeline.run([('a', compiled, "x"), ('b', compiled, "y")]))
+
+    assert calls == ['packed', 'packed']
+    assert sleeps == [3]
+    assert all(error is None for _, _, error in results)
+
+
+def test_pack_failing_every_retry_reports_the_error(monkeypatch, cache, sleeps):
+    def respond(request_key, payload):
+        raise HTTPError(503)
+
+    engine = use_engine(monkeypatch, respond)
+    pipeline = GradingPipeline('model', packing_enabled=True, pack_size=2)
+    compiled = pipeline.compile("Q")
+
+    results = list(pipeline.run([('a', compiled, "x"), ('b', compiled, "y")]))
+
+    assert [kind for kind, _ in engine.requests] == ['packed'] * (grading_pipeline.PACK_RETRIES + 1)
+    assert sorted(key for key, _, _ in results) == ['a', 'b']
+    assert all(result is None and isinstance(error, HTTPError) for _, result, error in results)
+    assert cache.entries == {}
+
+
+def test_fallback_results_are_reported_as_errors(monkeypatch, cache, sleeps):
+    use_engine(monkeypatch, lambda request_key, payload: "I would grade this 40/100")
+    pipeline = GradingPipeline('model')
+    compiled = pipeline.compile("Q")
+
+    [(key, result, error)] = pipeline.run([('a', compiled, "x")])
+
+    assert result is None and isinstance(error, UnusableResultError)
+    assert cache.entries == {}
+
+
+def test_unusable_packed_entry_is_regraded_singly(monkeypatch, cache, sleeps):
+    def respond(request_key, payload):
+        if request_key[0] == 'single':
+            return single_response(65)
+        return json.dumps([{'id': 1, 'grade': "80/100"}, {'id': 2, 'grade': "n/a"}])
+
+    engine = use_engine(monkeypatch, respond)
+    pipeline = GradingPipeline('model', packing_enabled=True, pack_size=2)
+    compiled = pipeline.compile("Q")
+
+    results = {key: result for key, result, error in pipeline.run([('a', compiled, "x"), ('b', compiled, "y")])}
+
+    assert [kind for kind, _ in engine.requests] == ['packed', 'single']
+    assert results['b']['grade'] == "65/100"
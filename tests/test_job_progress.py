@@ -0,0 +1,31 @@
+# tests/test_job_progress.py
+"""
+Tests for the bounded grading job event stream.
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from website.services import job_progress
+from website.services.job_progress import JobProgressRegistry, stream_job_events
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = JobProgressRegistry()
+    monkeypatch.setattr(job_progress, '_job_progress', registry)
+    return registry
+
+
+def test_stream_ends_at_max_duration_despite_long_heartbeat(registry):
+    registry.publish('job', 'processing', 1, 10)
+    events = stream_job_events(SimpleNamespace(id='job'), last_version=0, heartbeat=60, max_duration=0.5)
+    started = time.monotonic()
+
+    messages = list(events)
+
+    assert time.monotonic() - started < 2
+    assert messages[0].startswith("id: 1\nevent: progress\n")
+    assert messages[1:] == [": keepalive\n\n"]
@@ -0,0 +1,173 @@
+# tests/test_rate_limiter.py
+"""
+Tests for Retry-After handling, backoff and the adaptive rate limiter.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from website.services import rate_limiter
+from website.services.rate_limiter import (
+    AdaptiveRateLimiter, RetryPolicy, backoff_countdown, is_retryable, is_throttled, retry_after_from
+)
+
+
+class HTTPError(Exception):
+    """Inference error carrying an HTTP response, like requests' HTTPError."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type('Response', (), {'status_code': status_code, 'headers': headers or {}})()
+
+
+class RecordingLimiter(AdaptiveRateLimiter):
+    """Limiter that never waits and records throttle signals."""
+
+    def __init__(self):
+        super().__init__(rate=1000, burst=1000)
+        self.throttles = []
+
+    def on_throttle(self, retry_after=None):
+        self.throttles.append(retry_after)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def test_retry_after_seconds():
+    assert retry_after_from(HTTPError(429, {'Retry-After': '7'})) == 7
+
+
+def test_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    wait = retry_after_from(HTTPError(503, {'Retry-After': format_datetime(retry_at, usegmt=True)}))
+
+    assert 25 <= wait <= 30
+
+
+@pytest.mark.parametrize('error', [
+    HTTPError(429),
+    HTTPError(429, {'Retry-After': 'soon'}),
+    ValueError("no response"),
+])
+def test_retry_after_missing_or_invalid(error):
+    assert retry_after_from(error) is None
+
+
+def test_retry_after_in_the_past_is_zero():
+    retry_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+
+    assert retry_after_from(HTTPError(429, {'Retry-After': format_datetime(retry_at, usegmt=True)})) == 0
+
+
+def test_error_classification():
+    assert is_retryable(HTTPError(429)) and is_throttled(HTTPError(429))
+    assert is_retryable(HTTPError(502)) and not is_throttled(HTTPError(502))
+    assert not is_retryable(HTTPError(400))
+    assert is_retryable(TimeoutError()) and is_retryable(ConnectionError())
+    assert not is_retryable(ValueError())
+
+
+def test_delay_never_undercuts_retry_after():
+    policy = RetryPolicy(RecordingLimiter(), base_delay=1, max_delay=10)
+
+    for attempt in range(5):
+        assert 0 <= policy.delay(attempt) <= 10
+        assert 20 <= policy.delay(attempt, retry_after=20) <= 21
+
+
+def test_backoff_countdown_honours_retry_after():
+    assert backoff_countdown(0, HTTPError(429, {'Retry-After': '600'}), base=60) == 600
+    assert 30 <= backoff_countdown(0, base=60) <= 60
+
+
+def test_call_retries_throttled_requests_after_retry_after(sleeps):
+    limiter = RecordingLimiter()
+    policy = RetryPolicy(limiter, max_retries=3, base_delay=0, max_delay=0)
+    responses = [HTTPError(429, {'Retry-After': '4'}), HTTPError(502), 'ok']
+
+    def call():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert policy.call(call) == 'ok'
+    assert limiter.throttles == [4]
+    assert sleeps == [4, 0]
+
+
+def test_call_gives_up_on_non_retryable_errors(sleeps):
+    policy = RetryPolicy(RecordingLimiter(), max_retries=3)
+
+    with pytest.raises(ValueError):
+        policy.call(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+    assert sleeps == []
+
+
+def test_call_gives_up_after_max_retries(sleeps):
+    policy = RetryPolicy(RecordingLimiter(), max_retries=2, base_delay=0, max_delay=0)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise HTTPError(503)
+
+    with pytest.raises(HTTPError):
+        policy.call(call)
+    assert len(attempts) == 3
+
+
+def test_call_async_honours_retry_after(monkeypatch):
+    limiter = RecordingLimiter()
+    policy = RetryPolicy(limiter, max_retries=2, base_delay=0, max_delay=0)
+    waits = []
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(rate_limiter.asyncio, 'sleep', fake_sleep)
+    responses = [HTTPError(429, {'Retry-After': '2'}), 'ok']
+
+    async def call():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert asyncio.run(policy.call_async(call)) == 'ok'
+    assert limiter.throttles == [2]
+    assert waits == [2]
+
+
+def test_throttle_halves_rate_and_pauses_for_retry_after():
+    limiter = AdaptiveRateLimiter(rate=10, burst=5)
+
+    limiter.on_throttle(retry_after=30)
+
+    assert limiter.rate == 5
+    assert 29 <= limiter._try_acquire() <= 30
+
+
+def test_successes_raise_rate_back_to_maximum():
+    limiter = AdaptiveRateLimiter(rate=10, burst=5)
+    limiter.on_throttle()
+
+    for _ in range(rate_limiter.INCREASE_EVERY * 100):
+        limiter.on_success()
+
+    assert limiter.rate == limiter.max_rate
+
+
+def test_bucket_allows_burst_then_waits():
+    limiter = AdaptiveRateLimiter(rate=1, burst=3)
+
+    assert [limiter._try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert limiter._try_acquire() > 0
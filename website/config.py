@@ -5,6 +5,7 @@ Provides environment-based configuration for different deployment scenarios.
 """
 
 import os
+import tempfile
 
 
 class Config:
@@ -31,6 +32,7 @@ class Config:
     
     # Google OAuth
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
+    GOOGLE_CREDENTIALS_TTL = int(os.getenv('GOOGLE_CREDENTIALS_TTL', 3600))  # Seconds a user's parsed credentials are reused
     
     # Caching Configuration
     CACHE_TYPE = os.getenv('CACHE_TYPE', 'SimpleCache')
@@ -51,6 +53,66 @@ class Config:
     ITEMS_PER_PAGE = int(os.getenv('ITEMS_PER_PAGE', 20))
     MAX_ITEMS_PER_PAGE = int(os.getenv('MAX_ITEMS_PER_PAGE', 100))
 
+    # Batch Grading
+    GRADING_POOL_SIZE = int(os.getenv('GRADING_POOL_SIZE', 8))  # In-flight calls per job
+    GRADING_MAX_CONCURRENCY = int(os.getenv('GRADING_MAX_CONCURRENCY', 16))  # In-flight calls per process
+    GRADING_BACKEND = os.getenv('GRADING_BACKEND', 'thread')  # 'thread' or 'async'
+    GRADING_ASYNC_POOL_SIZE = int(os.getenv('GRADING_ASYNC_POOL_SIZE', 32))  # In-flight coroutines per job
+    
+    # Grading Result Cache
+    GRADING_CACHE_ENABLED = os.getenv('GRADING_CACHE_ENABLED', 'true').lower() == 'true'
+    GRADING_CACHE_TTL = int(os.getenv('GRADING_CACHE_TTL', 30 * 24 * 3600))  # 30 days
+    GRADING_CACHE_MAX_ENTRIES = int(os.getenv('GRADING_CACHE_MAX_ENTRIES', 50000))
+    
+    # Prompt Packing (several short answers per model call)
+    GRADING_PACKING_ENABLED = os.getenv('GRADING_PACKING_ENABLED', 'false').lower() == 'true'
+    GRADING_PACK_SIZE = int(os.getenv('GRADING_PACK_SIZE', 10))  # Answers per packed call
+    GRADING_PACK_MAX_CHARS = int(os.getenv('GRADING_PACK_MAX_CHARS', 500))  # Longest answer eligible for packing
+    
+    # Grading Job Status Streams
+    GRADING_STREAM_HEARTBEAT = int(os.getenv('GRADING_STREAM_HEARTBEAT', 15))  # Seconds between keep-alives
+    GRADING_STREAM_POLL_INTERVAL = int(os.getenv('GRADING_STREAM_POLL_INTERVAL', 2))  # DB fallback for out-of-process jobs
+    GRADING_STREAM_MAX_DURATION = int(os.getenv('GRADING_STREAM_MAX_DURATION', 25))  # Short so sync workers are freed; browser reconnects
+    
+    # Grading Job Progress
+    JOB_PROGRESS_BACKEND = os.getenv('JOB_PROGRESS_BACKEND', 'memory')  # 'memory' or 'redis'
+    JOB_PROGRESS_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    GRADING_WRITE_BATCH_SIZE = int(os.getenv('GRADING_WRITE_BATCH_SIZE', 25))  # Graded submissions per commit
+    GRADING_WRITE_INTERVAL = float(os.getenv('GRADING_WRITE_INTERVAL', 5))  # Max seconds between commits
+    
+    # Google Classroom Import
+    CLASSROOM_IMPORT_WORKERS = int(os.getenv('CLASSROOM_IMPORT_WORKERS', 8))  # Coursework items fetched at once
+    CLASSROOM_ATTACHMENT_WORKERS = int(os.getenv('CLASSROOM_ATTACHMENT_WORKERS', 8))  # Drive files downloaded at once
+    CLASSROOM_IMPORT_RUNNER = os.getenv('CLASSROOM_IMPORT_RUNNER', 'thread')  # 'thread' or 'celery'
+    EXTRACTION_PROCESSES = int(os.getenv('EXTRACTION_PROCESSES', min(4, os.cpu_count() or 1)))  # Worker processes for document parsing
+    EXTRACTION_TIMEOUT = int(os.getenv('EXTRACTION_TIMEOUT', 60))  # Seconds per document; 0 disables
+    EXTRACTION_MEMORY_LIMIT = int(os.getenv('EXTRACTION_MEMORY_LIMIT', 1024 * 1024 * 1024))  # Bytes per worker process; 0 disables
+    PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 50))  # Pages read per PDF; 0 reads all
+    PDF_MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', 200000))  # Characters kept per PDF; 0 is unlimited
+    PDF_PAGES_PER_CHUNK = int(os.getenv('PDF_PAGES_PER_CHUNK', 10))  # Pages per parallel extraction job
+    OCR_BACKENDS = os.getenv('OCR_BACKENDS', 'vision')  # Comma-separated, tried in order: vision, tesseract
+    OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'eng')  # Tesseract language code(s)
+    OCR_DPI = int(os.getenv('OCR_DPI', 300))  # Resolution PDF pages are rendered at for OCR
+    OCR_PAGE_CACHE_DIR = os.getenv('OCR_PAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'aigrader-ocr-pages'))
+    OCR_PAGE_CACHE_MAX_AGE = int(os.getenv('OCR_PAGE_CACHE_MAX_AGE', 24 * 3600))  # Seconds rendered pages are kept since last use
+    VISION_BATCH_SIZE = int(os.getenv('VISION_BATCH_SIZE', 16))  # Images per Vision batch request; 16 at most
+    CLASSROOM_ROSTER_TTL = int(os.getenv('CLASSROOM_ROSTER_TTL', 600))  # Seconds a course roster is reused; 0 disables
+    CLASSROOM_PAGE_SIZE = int(os.getenv('CLASSROOM_PAGE_SIZE', 100))  # Items requested per list page
+    DRIVE_TEXT_CACHE_ENABLED = os.getenv('DRIVE_TEXT_CACHE_ENABLED', 'true').lower() == 'true'
+    DRIVE_TEXT_CACHE_MAX_AGE = int(os.getenv('DRIVE_TEXT_CACHE_MAX_AGE', 180 * 24 * 3600))  # Evict after 180 days unused
+    DRIVE_MAX_FILE_SIZE = int(os.getenv('DRIVE_MAX_FILE_SIZE', 50 * 1024 * 1024))  # Larger attachments are skipped; 0 disables
+    DRIVE_DOWNLOAD_CHUNK_SIZE = int(os.getenv('DRIVE_DOWNLOAD_CHUNK_SIZE', 4 * 1024 * 1024))
+    
+    # Inference Rate Limiting & Retries
+    AI_RATE_LIMIT_BACKEND = os.getenv('AI_RATE_LIMIT_BACKEND', 'memory')  # 'memory' or 'redis'
+    AI_RATE_LIMIT_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    AI_RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv('AI_RATE_LIMIT_REDIS_TIMEOUT', 0.5))  # Seconds per Redis call before the local bucket is used
+    AI_RATE_LIMIT_PER_SECOND = float(os.getenv('AI_RATE_LIMIT_PER_SECOND', 5))  # Ceiling; lowered on 429s
+    AI_RATE_LIMIT_BURST = int(os.getenv('AI_RATE_LIMIT_BURST', 10))
+    AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 5))
+    AI_BACKOFF_BASE = float(os.getenv('AI_BACKOFF_BASE', 1.0))  # Seconds before the first retry
+    AI_BACKOFF_MAX = float(os.getenv('AI_BACKOFF_MAX', 60))  # Cap on a single backoff delay
+
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -78,6 +140,12 @@ class ProductionConfig(Config):
     # Use Redis for rate limiting in production
     RATELIMIT_STORAGE_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     
+    # Share job progress between web and Celery worker processes
+    JOB_PROGRESS_BACKEND = os.getenv('JOB_PROGRESS_BACKEND', 'redis')
+    
+    # Share the inference rate limit between all web and worker processes
+    AI_RATE_LIMIT_BACKEND = os.getenv('AI_RATE_LIMIT_BACKEND', 'redis')
+    
     # PostgreSQL pool settings for production
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
@@ -95,6 +163,8 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     CACHE_TYPE = 'SimpleCache'
     RATELIMIT_ENABLED = False
+    GRADING_CACHE_ENABLED = False
+    DRIVE_TEXT_CACHE_ENABLED = False
 
 
 # Configuration mapping
@@ -284,15 +284,17 @@ class GradingJob(db.Model):
         }
     
     def update_progress(self, processed_count, commit=True):
-        """Update the job progress."""
+        """Update the job progress and notify status streams."""
         self.processed_submissions = processed_count
         self.updated_at = datetime.utcnow()
         
-        if self.processed_submissions >= self.total_submissions:
-            self.status = 'completed'
+        # Only complete() marks the job finished, so streams see the results with it
+        if self.status == 'queued':
+            self.status = 'processing'
         
         if commit:
             db.session.commit()
+        self.publish_progress()
     
     def complete(self, results_data, commit=True):
         """Mark job as completed with results."""
@@ -303,6 +305,7 @@ class GradingJob(db.Model):
         
         if commit:
             db.session.commit()
+        self.publish_progress()
     
     def fail(self, error_message, commit=True):
         """Mark job as failed with error message."""
@@ -312,6 +315,231 @@ class GradingJob(db.Model):
         
         if commit:
             db.session.commit()
+        self.publish_progress()
+    
+    def requeue(self, error_message, commit=True):
+        """Mark a failed job as queued again because it will be retried."""
+        self.status = 'queued'
+        self.error_message = error_message
+        self.updated_at = datetime.utcnow()
+        
+        if commit:
+            db.session.commit()
+        self.publish_progress()
+    
+    def publish_progress(self):
+        """Push the current progress to anyone streaming this job's status."""
+        from .services.job_progress import get_job_progress
+        get_job_progress().publish_job(self)
+
+
+class ImportJob(db.Model):
+    """
+    Model to track status and progress of background Google Classroom imports.
+    """
+    __tablename__ = 'import_jobs'
+    
+    id = db.Column(db.String(36), primary_key=True)  # UUID format
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id', name='fk_import_job_class'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_import_job_user'), nullable=False)
+    
+    # Link to the class being imported into
+    class_ref = db.relationship('Class', backref=db.backref('import_jobs', lazy=True))
+    
+    # Job status tracking
+    status = db.Column(db.String(20), default='queued')  # queued, processing, completed, failed
+    total_assignments = db.Column(db.Integer, default=0)
+    processed_assignments = db.Column(db.Integer, default=0)
+    total_files = db.Column(db.Integer, default=0)
+    processed_files = db.Column(db.Integer, default=0)
+    imported_submissions = db.Column(db.Integer, default=0)
+    
+    # Results and error data
+    results = db.Column(db.Text)  # JSON string containing the import summary
+    error_message = db.Column(db.Text)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __init__(self, class_id, user_id, job_id=None, status='queued'):
+        """Initialize a new import job."""
+        import uuid
+        self.id = job_id or str(uuid.uuid4())
+        self.class_id = class_id
+        self.user_id = user_id
+        self.status = status
+        self.total_assignments = 0
+        self.processed_assignments = 0
+        self.total_files = 0
+        self.processed_files = 0
+        self.imported_submissions = 0
+    
+    def to_dict(self):
+        """Convert job to dictionary for JSON serialization."""
+        return {
+            'id': self.id,
+            'class_id': self.class_id,
+            'status': self.status,
+            'total_assignments': self.total_assignments,
+            'processed_assignments': self.processed_assignments,
+            'total_files': self.total_files,
+            'processed_files': self.processed_files,
+            'imported_submissions': self.imported_submissions,
+            'results': json.loads(self.results) if self.results else None,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'complete': self.status in ['completed', 'failed']
+        }
+    
+    def update_progress(self, counts, commit=True):
+        """
+        Update the job progress and notify status streams.
+        
+        Args:
+            counts: Dictionary with any of total_assignments, processed_assignments,
+                    total_files, processed_files and imported_submissions
+            commit: Whether to commit the session
+        """
+        for field in ('total_assignments', 'processed_assignments', 'total_files',
+                      'processed_files', 'imported_submissions'):
+            if field in counts:
+                setattr(self, field, counts[field])
+        self.updated_at = datetime.utcnow()
+        
+        if self.status == 'queued':
+            self.status = 'processing'
+        
+        if commit:
+            db.session.commit()
+        self.publish_progress()
+    
+    def complete(self, summary, commit=True):
+        """Mark job as completed with the import summary."""
+        self.status = 'completed'
+        self.processed_assignments = self.total_assignments
+        self.results = summary if isinstance(summary, str) else json.dumps(summary)
+        self.updated_at = datetime.utcnow()
+        
+        if commit:
+            db.session.commit()
+        self.publish_progress()
+    
+    def fail(self, error_message, commit=True):
+        """Mark job as failed with error message."""
+        self.status = 'failed'
+        self.error_message = error_message
+        self.updated_at = datetime.utcnow()
+        
+        if commit:
+            db.session.commit()
+        self.publish_progress()
+    
+    def publish_progress(self):
+        """Push the current progress to anyone polling this job's status."""
+        from .services.import_jobs import publish_import_progress
+        publish_import_progress(self.id, self.status, self.to_counts(), self.error_message,
+                                self.class_ref.owner_id if self.class_ref else None)
+    
+    def to_counts(self):
+        """Get the job's progress counters."""
+        return {
+            'total_assignments': self.total_assignments or 0,
+            'processed_assignments': self.processed_assignments or 0,
+            'total_files': self.total_files or 0,
+            'processed_files': self.processed_files or 0,
+            'imported_submissions': self.imported_submissions or 0
+        }
+
+
+class ClassroomSyncState(db.Model):
+    """
+    Incremental sync watermark for one Google Classroom coursework item of
+    an imported class.
+    """
+    __tablename__ = 'classroom_sync_state'
+    __table_args__ = (
+        db.UniqueConstraint('class_id', 'coursework_id', name='uq_sync_state_coursework'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id', name='fk_sync_state_class'), nullable=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id', name='fk_sync_state_assignment'), index=True)
+    coursework_id = db.Column(db.String(150), nullable=False)
+    
+    # Classroom updateTime values seen at the last successful sync
+    coursework_updated_at = db.Column(db.DateTime)
+    submissions_updated_at = db.Column(db.DateTime)  # Newest imported submission
+    
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class SubmissionAttachment(db.Model):
+    """
+    Text extracted from one Google Drive attachment of an imported submission.
+    """
+    __tablename__ = 'submission_attachment'
+    __table_args__ = (
+        db.Index('ix_submission_attachment_file', 'submission_id', 'file_id', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id', name='fk_attachment_submission'), nullable=False)
+    file_id = db.Column(db.String(128), nullable=False)  # Drive file ID
+    file_name = db.Column(db.String(500))
+    text = db.Column(db.Text)
+    size = db.Column(db.Integer)  # Length of the extracted text in characters
+    text_hash = db.Column(db.String(64))  # SHA-256 hex digest of the text
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    submission = db.relationship('Submission', backref=db.backref('attachments', lazy=True, cascade='all, delete-orphan'))
+    
+    @staticmethod
+    def delete_for_assignment(assignment_id):
+        """
+        Delete the attachments of every submission of an assignment.
+        Bulk submission deletes bypass the ORM cascade, so call this first.
+        """
+        submission_ids = db.session.query(Submission.id).filter(Submission.assignment_id == assignment_id)
+        return SubmissionAttachment.query.filter(
+            SubmissionAttachment.submission_id.in_(submission_ids.scalar_subquery())
+        ).delete(synchronize_session=False)
+
+
+class GradingCacheEntry(db.Model):
+    """
+    Cached AI grading result keyed on a hash of everything that shapes the
+    model output (question, normalized answer, rubric, model and prompt version).
+    """
+    __tablename__ = 'grading_cache'
+    
+    key = db.Column(db.String(64), primary_key=True)  # SHA-256 hex digest
+    model_name = db.Column(db.String(150))
+    result = db.Column(db.Text)  # JSON string containing the grading result
+    hit_count = db.Column(db.Integer, default=0)
+    
+    # Timestamps used for TTL and least-recently-used eviction
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class DriveTextCacheEntry(db.Model):
+    """
+    Text extracted from a Google Drive file, keyed on the file ID and tied
+    to the revision it was extracted from.
+    """
+    __tablename__ = 'drive_text_cache'
+    
+    file_id = db.Column(db.String(128), primary_key=True)
+    revision = db.Column(db.String(128), nullable=False)  # md5Checksum, or version and modifiedTime
+    mime_type = db.Column(db.String(150))
+    text = db.Column(db.Text)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
 # Add security utility function
 def check_resource_access(resource, redirect_endpoint='views.dashboard'):
     """
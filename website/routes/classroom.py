@@ -8,7 +8,7 @@ from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 
 from . import views
-from ..models import Class, Assignment, Submission, Rubric, db, check_resource_access
+from ..models import Class, Assignment, Submission, Rubric, ImportJob, ClassroomSyncState, SubmissionAttachment, db, check_resource_access
 from ..utils.validators import validate_class_name, validate_text_field
 
 
@@ -94,8 +94,13 @@ def delete_class(class_id):
         # Delete associated assignments and their submissions
         for assignment in cls.assignments:
             # Delete all submissions for this assignment
+            SubmissionAttachment.delete_for_assignment(assignment.id)
             Submission.query.filter_by(assignment_id=assignment.id).delete()
             
+        # Delete import history and sync watermarks for this class
+        ImportJob.query.filter_by(class_id=class_id).delete()
+        ClassroomSyncState.query.filter_by(class_id=class_id).delete()
+            
         # Delete all assignments for this class
         Assignment.query.filter_by(class_id=class_id).delete()
             
@@ -175,7 +180,11 @@ def delete_assignment(assignment_id):
         return redirect(url_for('views.dashboard'))
     
     try:
+        # Forget the sync watermark so a refresh imports the assignment again
+        ClassroomSyncState.query.filter_by(assignment_id=assignment_id).delete()
+        
         # Delete all submissions for this assignment
+        SubmissionAttachment.delete_for_assignment(assignment_id)
         Submission.query.filter_by(assignment_id=assignment_id).delete()
         
         # Delete the assignment
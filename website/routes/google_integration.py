@@ -9,12 +9,13 @@ import json
 import logging
 from flask import render_template, redirect, url_for, flash, request, jsonify, session
 from flask_login import login_required, current_user
-import google.oauth2.credentials
 import google_auth_oauthlib.flow
-import googleapiclient.discovery
 
 from . import views
-from ..models import Class, GoogleClass, Assignment, Submission, Rubric, db, check_resource_access
+from ..models import GoogleClass, Submission, Rubric, db, check_resource_access
+from ..services.classroom_import import attachment_text, google_credentials_for_user, iter_items, iter_students
+from ..services.import_jobs import start_import_job, load_import_job_status
+from ..services.google_clients import google_service
 
 logger = logging.getLogger(__name__)
 
@@ -36,53 +37,7 @@ def get_google_credentials():
     Helper function to get refreshed Google credentials.
     Returns None if credentials are not available or refresh fails.
     """
-    if not current_user.google_tokens:
-        logger.warning("No Google tokens found for user")
-        return None
-    
-    try:
-        token_data = json.loads(current_user.google_tokens)
-        
-        # Check if we have all required fields for refreshing
-        required_fields = ['refresh_token', 'token_uri', 'client_id', 'client_secret']
-        missing_fields = [field for field in required_fields if field not in token_data or not token_data[field]]
-        
-        if missing_fields:
-            logger.warning(f"Missing required fields for token refresh: {', '.join(missing_fields)}")
-            return None
-        
-        credentials = google.oauth2.credentials.Credentials(
-            token=token_data.get('token'),
-            refresh_token=token_data.get('refresh_token'),
-            token_uri=token_data.get('token_uri'),
-            client_id=token_data.get('client_id'),
-            client_secret=token_data.get('client_secret'),
-            scopes=token_data.get('scopes')
-        )
-        
-        # Force refresh if token is expired
-        if not credentials.valid:
-            logger.info("Token expired, attempting to refresh")
-            import google.auth.transport.requests
-            auth_request = google.auth.transport.requests.Request()
-            credentials.refresh(auth_request)
-            
-            # Update stored token
-            current_user.google_tokens = json.dumps({
-                'token': credentials.token,
-                'refresh_token': credentials.refresh_token,
-                'token_uri': credentials.token_uri,
-                'client_id': credentials.client_id,
-                'client_secret': credentials.client_secret,
-                'scopes': credentials.scopes
-            })
-            db.session.commit()
-            logger.info("Token refreshed successfully")
-        
-        return credentials
-    except Exception as e:
-        logger.error(f"Error refreshing credentials: {str(e)}")
-        return None
+    return google_credentials_for_user(current_user)
 
 
 @views.route('/import-google-classroom', endpoint='import_google_classroom')
@@ -178,9 +133,8 @@ def select_google_class():
         return redirect(url_for('views.import_google_classroom'))
     
     try:
-        service = googleapiclient.discovery.build('classroom', 'v1', credentials=credentials)
-        results = service.courses().list(teacherId='me', courseStates=['ACTIVE']).execute()
-        classes = results.get('courses', [])
+        service = google_service('classroom', 'v1', credentials)
+        classes = list(iter_items(service.courses(), 'courses', teacherId='me', courseStates=['ACTIVE']))
         
         return render_template('select_google_class.html', classes=classes, user=current_user)
     except Exception as e:
@@ -204,16 +158,21 @@ def select_rubric(class_id):
                 name=class_name or f"Google Class {class_id}",
                 level=level,
                 owner_id=current_user.id,
-                google_class_id=class_id
+                google_classroom_id=class_id,
+                rubric_id=rubric_id
             )
             db.session.add(new_class)
             db.session.commit()
             
-            # Import assignments
-            import_assignments_from_google(new_class.id)
+            # Import assignments in the background
+            job = import_assignments_from_google(new_class.id)
+            if not job:
+                flash('Google Classroom class created, but its assignments could not be imported. '
+                      'Reconnect your Google account and refresh the class.', 'warning')
+                return redirect(url_for('views.view_class', class_id=new_class.id))
             
-            flash('Google Classroom class imported successfully!', 'success')
-            return redirect(url_for('views.view_class', class_id=new_class.id))
+            flash('Google Classroom class created. Assignments are being imported in the background.', 'success')
+            return redirect(url_for('views.view_class', class_id=new_class.id, import_job=job.id))
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error importing class: {e}")
@@ -226,7 +185,7 @@ def select_rubric(class_id):
         return redirect(url_for('views.import_google_classroom'))
     
     try:
-        service = googleapiclient.discovery.build('classroom', 'v1', credentials=credentials)
+        service = google_service('classroom', 'v1', credentials)
         course = service.courses().get(id=class_id).execute()
         class_name = course.get('name', f"Google Class {class_id}")
     except Exception as e:
@@ -243,66 +202,69 @@ def select_rubric(class_id):
                          rubrics=rubrics)
 
 
-@views.route('/refresh-google-assignments/<int:class_id>', methods=['POST'])
+@views.route('/refresh-google-assignments/<int:class_id>', methods=['GET', 'POST'])
 @login_required
 def refresh_google_assignments(class_id):
-    """Refresh assignments from Google Classroom."""
+    """
+    Start refreshing assignments from Google Classroom in the background.
+    Only submissions changed since the last import are processed unless
+    ``full=1`` is given. Returns the import job ID for tracking progress.
+    """
     cls = GoogleClass.query.get_or_404(class_id)
     
     if not check_resource_access(cls):
         return jsonify({'error': 'Permission denied'}), 403
     
     try:
-        import_assignments_from_google(class_id)
-        return jsonify({'success': True, 'message': 'Assignments refreshed'})
+        job = import_assignments_from_google(class_id, full_sync=request.args.get('full') == '1')
+        if not job:
+            return jsonify({
+                'success': False,
+                'message': 'Authentication expired',
+                'redirect': url_for('views.import_google_classroom')
+            }), 401
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'message': 'Assignment import started'
+        }), 202
     except Exception as e:
         logger.error(f"Error refreshing assignments: {e}")
         return jsonify({'error': str(e)}), 500
 
 
-def import_assignments_from_google(class_id):
+@views.route('/import-job-status/<job_id>')
+@login_required
+def import_job_status(job_id):
     """
-    Helper function to import assignments from Google Classroom.
+    Route to check the status of a background Google Classroom import.
+    Returns JSON with assignment and file progress and, once finished,
+    the import summary.
+    """
+    payload, status_code = load_import_job_status(job_id)
+    response = jsonify(payload)
+    response.status_code = status_code
+    if status_code == 200 and payload.get('version'):
+        response.set_etag(f"{job_id}-{payload['version']}")
+        return response.make_conditional(request)
+    return response
+
+
+def import_assignments_from_google(class_id, full_sync=False):
+    """
+    Helper function to start a background import of assignments and
+    submissions from Google Classroom.
+    Returns the ImportJob, or None if the class or credentials are unavailable.
     """
     cls = GoogleClass.query.get(class_id)
-    if not cls or not cls.google_class_id:
-        return False
+    if not cls or not cls.google_classroom_id:
+        return None
     
-    credentials = get_google_credentials()
-    if not credentials:
-        return False
+    # Refresh the stored token now so the background job starts with a valid one
+    if not get_google_credentials():
+        return None
     
-    try:
-        service = googleapiclient.discovery.build('classroom', 'v1', credentials=credentials)
-        
-        # Get coursework
-        courseworks = service.courses().courseWork().list(
-            courseId=cls.google_class_id
-        ).execute().get('courseWork', [])
-        
-        for coursework in courseworks:
-            # Check if assignment already exists
-            existing = Assignment.query.filter_by(
-                class_id=class_id,
-                name=coursework.get('title')
-            ).first()
-            
-            if not existing:
-                new_assignment = Assignment(
-                    name=coursework.get('title', 'Untitled'),
-                    question=coursework.get('description', 'No description'),
-                    class_id=class_id,
-                    rubric_id=None  # Can be set later
-                )
-                db.session.add(new_assignment)
-        
-        db.session.commit()
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error importing assignments: {e}")
-        db.session.rollback()
-        return False
+    return start_import_job(cls, current_user, full_sync)
 
 
 @views.route('/get-google-classroom-students/<int:class_id>')
@@ -319,10 +281,8 @@ def get_google_classroom_students(class_id):
         return jsonify({'error': 'Google credentials not available'}), 401
     
     try:
-        service = googleapiclient.discovery.build('classroom', 'v1', credentials=credentials)
-        students = service.courses().students().list(
-            courseId=cls.google_class_id
-        ).execute().get('students', [])
+        service = google_service('classroom', 'v1', credentials)
+        students = iter_students(service, cls.google_classroom_id)
         
         student_list = []
         for student in students:
@@ -356,7 +316,7 @@ def view_attachment(submission_id, file_id):
         return redirect(url_for('views.dashboard'))
     
     try:
-        service = googleapiclient.discovery.build('drive', 'v3', credentials=credentials)
+        service = google_service('drive', 'v3', credentials)
         
         # Get file metadata
         file_metadata = service.files().get(
@@ -386,28 +346,10 @@ def get_extracted_text(submission_id, file_id):
         return jsonify({"error": "Permission denied"}), 403
     
     try:
-        # Check if submission has submission_data
-        if not hasattr(submission, 'submission_data') or not submission.submission_data:
-            return jsonify({"error": "No file data available"}), 404
-        
-        submission_data = json.loads(submission.submission_data)
-        
-        # Find the specific file
-        for file in submission_data.get('files', []):
-            if file.get('id') == file_id:
-                # Look for extracted text
-                if submission.student_answer:
-                    marker = f"--- Text extracted from {file.get('name')} ---"
-                    if marker in submission.student_answer:
-                        parts = submission.student_answer.split(marker)
-                        for i, part in enumerate(parts):
-                            if i > 0:
-                                extracted_text = part.split("--- Text extracted from")[0] if "--- Text extracted from" in part else part
-                                return jsonify({"text": extracted_text.strip()})
-                
-                return jsonify({"error": "No extracted text found for this file"}), 404
-        
-        return jsonify({"error": "File not found in submission data"}), 404
+        extracted_text = attachment_text(submission, file_id)
+        if extracted_text is None:
+            return jsonify({"error": "No extracted text found for this file"}), 404
+        return jsonify({"text": extracted_text})
         
     except Exception as e:
         logger.error(f"Error getting extracted text: {e}")
@@ -6,19 +6,29 @@ Handles AI grading functionality.
 
 import json
 import logging
-import io
 from threading import Thread
-from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 
 from . import views
 from ..models import Assignment, Submission, Rubric, GradingJob, db, check_resource_access
 from ..services.ai_grading import get_ai_grading_service
-from ..utils.helpers import clean_ai_response, extract_grade, extract_section
+from ..services.file_processing import get_file_processing_service
+from ..services.grading_cache import get_grading_cache
+from ..services.grading_pipeline import get_grading_pipeline, numeric_grade, is_usable_result, failure_message
+from ..services.job_progress import stream_job_events, load_job_status, get_job_writer, prefetch_submissions
+from ..utils.helpers import format_sse
 
 logger = logging.getLogger(__name__)
 
 
+def bypass_cache_requested():
+    """Check whether the teacher asked for a fresh regrade that skips the grading cache."""
+    data = request.get_json(silent=True) or {}
+    flag = data.get('bypass_cache', request.form.get('bypass_cache', request.args.get('bypass_cache', '')))
+    return str(flag).lower() in ('1', 'true', 'yes', 'on')
+
+
 @views.route('/grade', methods=['POST'])
 @login_required
 def grade_assignment():
@@ -45,7 +55,8 @@ def grade_assignment():
     
     try:
         ai_service = get_ai_grading_service()
-        result = ai_service.grade_submission(question, student_answer, rubric_criteria, level)
+        result = ai_service.grade_submission(question, student_answer, rubric_criteria, level,
+                                             use_cache=not bypass_cache_requested())
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in grade_assignment: {str(e)}")
@@ -56,11 +67,12 @@ def grade_assignment():
 @login_required
 def extract_pdf_text():
     """
-    Extract text from uploaded PDF files using PyPDF2.
+    Extract text from uploaded PDF files.
+    
+    Pages are parsed in parallel in the extraction process pool, up to the
+    configured PDF_MAX_PAGES and PDF_MAX_CHARS caps.
     """
     try:
-        from PyPDF2 import PdfReader
-        
         if 'file' not in request.files:
             return jsonify({'success': False, 'error': 'No file provided'}), 400
         
@@ -71,14 +83,8 @@ def extract_pdf_text():
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({'success': False, 'error': 'Only PDF files are supported'}), 400
         
-        # Read PDF content
-        pdf_reader = PdfReader(io.BytesIO(file.read()))
-        extracted_text = ""
-        
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                extracted_text += page_text + "\n"
+        result = get_file_processing_service().extract_pdf(file.read())
+        extracted_text = result['text']
         
         if not extracted_text.strip():
             return jsonify({
@@ -89,7 +95,9 @@ def extract_pdf_text():
         return jsonify({
             'success': True,
             'text': extracted_text.strip(),
-            'pages': len(pdf_reader.pages)
+            'pages': result['pages'],
+            'pages_read': result['pages_read'],
+            'truncated': result['truncated']
         })
         
     except Exception as e:
@@ -121,23 +129,19 @@ def deepgrade(submission_id):
                 assignment.question, 
                 submission.student_answer,
                 rubric_criteria,
-                rubric.level if rubric else "High School"
+                rubric.level if rubric else "High School",
+                use_cache=not bypass_cache_requested()
             )
-            
-            # Update submission with results
-            grade_str = result.get('grade', '')
-            if '/' in str(grade_str):
-                try:
-                    submission.grade = float(grade_str.split('/')[0])
-                except:
-                    submission.grade = 70
+            if not is_usable_result(result):
+                # Leave the stored grade and feedback as they were
+                flash(f"Error grading submission: {failure_message(result)}", category='error')
             else:
-                submission.grade = float(grade_str) if grade_str else 70
-            
-            submission.feedback = result.get('feedback', '')
-            db.session.commit()
-            
-            flash('Submission graded successfully!', category='success')
+                # Update submission with results
+                submission.grade = numeric_grade(result)
+                submission.ai_feedback = json.dumps(result)
+                db.session.commit()
+                
+                flash('Submission graded successfully!', category='success')
             
         except Exception as e:
             logger.error(f"Error in deepgrade: {str(e)}")
@@ -150,6 +154,54 @@ def deepgrade(submission_id):
                          user=current_user)
 
 
+@views.route('/deepgrade/<int:submission_id>/stream', methods=['POST'])
+@login_required
+def deepgrade_stream(submission_id):
+    """
+    Grade a submission with AI, streaming the model output as server-sent events.
+    Emits ``delta`` events while the model is generating and a final
+    ``result`` (or ``error``) event once the parsed result has been saved.
+    """
+    submission = Submission.query.get_or_404(submission_id)
+    assignment = submission.assignment_ref
+    
+    # Security check
+    if not check_resource_access(assignment.class_ref):
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    rubric = Rubric.query.get(assignment.rubric_id) if assignment.rubric_id else None
+    pipeline = get_grading_pipeline()
+    compiled = pipeline.compile_for_rubric(assignment.question, rubric)
+    bypass_cache = bypass_cache_requested()
+    
+    def generate():
+        try:
+            for event, data in pipeline.stream(compiled, submission.student_answer, bypass_cache):
+                if event == 'delta':
+                    yield format_sse({'text': data}, 'delta')
+                    continue
+                
+                if not is_usable_result(data):
+                    yield format_sse({'error': failure_message(data)}, 'error')
+                    return
+                
+                submission.grade = numeric_grade(data)
+                submission.ai_feedback = json.dumps(data)
+                db.session.commit()
+                yield format_sse(data, 'result')
+        
+        except Exception as e:
+            logger.error(f"Error streaming grade for submission {submission_id}: {e}")
+            db.session.rollback()
+            yield format_sse({'error': str(e)}, 'error')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @views.route('/grade-all/<int:assignment_id>', methods=['POST'])
 @login_required
 def grade_all_submissions(assignment_id):
@@ -166,9 +218,10 @@ def grade_all_submissions(assignment_id):
     # Get ungraded submissions
     submissions = Submission.query.filter_by(assignment_id=assignment_id).all()
     skip_graded = request.json.get('skip_graded', True) if request.json else True
+    bypass_cache = bypass_cache_requested()
     
     if skip_graded:
-        submissions = [s for s in submissions if s.grade is None or s.feedback is None]
+        submissions = [s for s in submissions if s.grade is None or s.ai_feedback is None]
     
     if not submissions:
         return jsonify({'error': 'No submissions to grade'}), 400
@@ -176,10 +229,9 @@ def grade_all_submissions(assignment_id):
     # Create a grading job
     job = GradingJob(
         assignment_id=assignment_id,
-        user_id=current_user.id,
-        total_count=len(submissions),
-        processed_count=0,
-        status='pending'
+        total_submissions=len(submissions),
+        processed_submissions=0,
+        status='queued'
     )
     db.session.add(job)
     db.session.commit()
@@ -188,7 +240,8 @@ def grade_all_submissions(assignment_id):
     submission_ids = [s.id for s in submissions]
     app = current_app._get_current_object()
     
-    thread = Thread(target=process_grading_job, args=(app, job.id, submission_ids, assignment.rubric_id, skip_graded))
+    thread = Thread(target=process_grading_job,
+                    args=(app, job.id, submission_ids, assignment.rubric_id, skip_graded, bypass_cache))
     thread.start()
     
     return jsonify({
@@ -199,99 +252,116 @@ def grade_all_submissions(assignment_id):
     })
 
 
-@views.route('/check-grading-status/<int:job_id>')
+@views.route('/check-grading-status/<job_id>')
 @login_required
 def check_grading_status(job_id):
     """
     Route to check the status of a background grading job.
     Returns JSON with current progress, status message, and results.
+    Running jobs are answered from the job progress registry without a
+    database query.
+    """
+    payload, status_code = load_job_status(job_id)
+    response = jsonify(payload)
+    response.status_code = status_code
+    if status_code == 200 and payload.get('version'):
+        response.set_etag(f"{job_id}-{payload['version']}")
+        return response.make_conditional(request)
+    return response
+
+
+@views.route('/grading-job-events/<job_id>')
+@login_required
+def grading_job_events(job_id):
+    """
+    Stream the progress of a background grading job as server-sent events.
+    Emits ``progress`` events as the job runner publishes them and a final
+    ``complete`` event with the job results.
     """
-    job = GradingJob.query.get_or_404(job_id)
+    job = GradingJob.query.get(job_id)
+    if not job or not check_resource_access(job.assignment.class_ref):
+        return jsonify({'error': 'Grading job not found'}), 404
     
-    # Security check
-    if job.user_id != current_user.id:
-        return jsonify({'error': 'Permission denied'}), 403
+    try:
+        last_version = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_version = 0
     
-    return jsonify({
-        'job_id': job.id,
-        'status': job.status,
-        'processed_count': job.processed_count,
-        'total_count': job.total_count,
-        'progress_percent': (job.processed_count / job.total_count * 100) if job.total_count > 0 else 0,
-        'current_message': job.current_message or '',
-        'completed': job.status == 'completed',
-        'error': job.error_message if job.status == 'error' else None
-    })
+    events = stream_job_events(
+        job, last_version,
+        heartbeat=current_app.config.get('GRADING_STREAM_HEARTBEAT', 15),
+        poll_interval=current_app.config.get('GRADING_STREAM_POLL_INTERVAL', 2),
+        max_duration=current_app.config.get('GRADING_STREAM_MAX_DURATION', 25)
+    )
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
-def process_grading_job(app, job_id, submission_ids, rubric_id, skip_graded=True):
+@views.route('/grading-cache/stats')
+@login_required
+def grading_cache_stats():
+    """Return hit/miss counters for the grading result cache."""
+    return jsonify(get_grading_cache().stats())
+
+
+def process_grading_job(app, job_id, submission_ids, rubric_id, skip_graded=True, bypass_cache=False):
     """
     Background function to process a grading job.
-    Updates job status in the database as progress is made.
+    Submissions are loaded with one IN query and graded through the shared
+    grading pipeline (cache first, then concurrently on the grading engine).
+    Progress is published as each one completes; results are written to the
+    database in batched bulk updates.
     """
     with app.app_context():
         job = GradingJob.query.get(job_id)
         if not job:
             return
         
-        job.status = 'processing'
-        db.session.commit()
-        
         rubric = Rubric.query.get(rubric_id) if rubric_id else None
-        ai_service = get_ai_grading_service()
+        pipeline = get_grading_pipeline()
+        writer = get_job_writer(job)
         
         try:
-            for i, submission_id in enumerate(submission_ids):
-                submission = Submission.query.get(submission_id)
+            processed = 0
+            items = []
+            compiled_prompts = {}
+            submissions = prefetch_submissions(submission_ids)
+            for submission_id in submission_ids:
+                submission = submissions.get(submission_id)
                 if not submission:
+                    processed += 1
                     continue
                 
                 # Skip if already graded and skip_graded is True
-                if skip_graded and submission.grade is not None and submission.feedback:
-                    job.processed_count += 1
-                    job.current_message = f"Skipped {submission.student_name} (already graded)"
-                    db.session.commit()
+                if skip_graded and submission.grade is not None and submission.ai_feedback:
+                    processed += 1
                     continue
                 
-                job.current_message = f"Grading submission from {submission.student_name}..."
-                db.session.commit()
-                
+                # Compile the rubric and question once per assignment
                 assignment = submission.assignment_ref
-                rubric_criteria = rubric.get_criteria() if rubric else []
-                
-                try:
-                    result = ai_service.grade_submission(
-                        assignment.question,
-                        submission.student_answer,
-                        rubric_criteria,
-                        rubric.level if rubric else "High School"
-                    )
-                    
-                    # Update submission
-                    grade_str = result.get('grade', '70/100')
-                    if '/' in str(grade_str):
-                        try:
-                            submission.grade = float(grade_str.split('/')[0])
-                        except:
-                            submission.grade = 70
-                    else:
-                        submission.grade = float(grade_str) if grade_str else 70
-                    
-                    submission.feedback = result.get('feedback', '')
-                    
-                except Exception as e:
-                    logger.error(f"Error grading submission {submission_id}: {e}")
-                    submission.feedback = f"Error during grading: {str(e)}"
+                if assignment.id not in compiled_prompts:
+                    compiled_prompts[assignment.id] = pipeline.compile_for_rubric(assignment.question, rubric)
+                items.append((submission.id, compiled_prompts[assignment.id], submission.student_answer))
+            
+            job.update_progress(processed)
+            
+            failed = 0
+            for submission_id, result, error in pipeline.run(items, bypass_cache):
+                # Failed submissions keep their previous grade and feedback
+                if error is not None:
+                    logger.error(f"Error grading submission {submission_id}: {error}")
+                    failed += 1
+                else:
+                    writer.add_result(submission_id, numeric_grade(result), json.dumps(result))
                 
-                job.processed_count += 1
-                db.session.commit()
+                processed += 1
+                writer.update(processed)
             
-            job.status = 'completed'
-            job.current_message = 'All submissions graded successfully'
-            db.session.commit()
+            writer.complete({'status': 'success', 'processed': processed, 'failed': failed})
             
         except Exception as e:
             logger.error(f"Error in grading job {job_id}: {e}")
-            job.status = 'error'
-            job.error_message = str(e)
-            db.session.commit()
+            writer.fail(str(e))
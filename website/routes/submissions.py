@@ -10,7 +10,7 @@ from flask import render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 
 from . import views
-from ..models import Assignment, Submission, db, check_resource_access
+from ..models import Assignment, Submission, ClassroomSyncState, db, check_resource_access
 from ..utils.validators import validate_text_field, validate_email
 
 logger = logging.getLogger(__name__)
@@ -83,6 +83,8 @@ def delete_submission(submission_id):
         return redirect(url_for('views.dashboard'))
     
     try:
+        # Forget the sync watermark so a refresh imports the submission again
+        ClassroomSyncState.query.filter_by(assignment_id=submission.assignment_id).delete()
         db.session.delete(submission)
         db.session.commit()
         flash('Submission deleted successfully!', category='success')
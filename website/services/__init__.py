@@ -4,10 +4,13 @@ Services layer for the AIGrader application.
 Contains business logic separated from routes.
 """
 
-from .ai_grading import AIGradingService
+from .ai_grading import AIGradingService, AsyncAIGradingService
 from .file_processing import FileProcessingService
+from .grading_engine import BatchGradingEngine
 
 __all__ = [
     'AIGradingService',
-    'FileProcessingService'
+    'AsyncAIGradingService',
+    'FileProcessingService',
+    'BatchGradingEngine'
 ]
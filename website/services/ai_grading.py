@@ -5,16 +5,24 @@ Handles all AI-related grading functionality.
 """
 
 import os
-import json
+import asyncio
 import logging
 from huggingface_hub import InferenceClient
-from ..utils.helpers import clean_ai_response, extract_grade, parse_ai_score
+from .event_loop import get_background_loop
+from .grading_cache import get_grading_cache
+from .rate_limiter import get_retry_policy
+from .grading_pipeline import (
+    MAX_TOKENS, TEMPERATURE, get_grading_pipeline, parse_grading_response, error_result, is_cacheable_result
+)
 
 logger = logging.getLogger(__name__)
 
 # Configuration
 API_KEY = os.getenv("HUGGINGFACE_API_KEY")
 MODEL_NAME = os.getenv("AI_MODEL_NAME", "meta-llama/Llama-3.3-70B-Instruct")
+BASE_URL = os.getenv("AI_BASE_URL", "https://router.huggingface.co")
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("GRADING_ASYNC_MAX_IN_FLIGHT", 64))
+REQUEST_TIMEOUT = int(os.getenv("AI_REQUEST_TIMEOUT", 120))
 
 
 class AIGradingService:
@@ -24,7 +32,7 @@ class AIGradingService:
         """Initialize the AI grading service."""
         self.client = InferenceClient(
             token=API_KEY, 
-            base_url="https://router.huggingface.co"
+            base_url=BASE_URL
         )
         self.model_name = MODEL_NAME
     
@@ -41,38 +49,69 @@ class AIGradingService:
         Returns:
             Formatted prompt string
         """
-        criteria_text = ""
-        if rubric_criteria:
-            for criterion in rubric_criteria:
-                criteria_text += f"\n- {criterion.get('name', 'Unknown')}: {criterion.get('description', 'No description')}"
+        return self.compile_prompt(question, rubric_criteria, school_level).render(student_answer)
+    
+    def compile_prompt(self, question, rubric_criteria=None, school_level="High School"):
+        """
+        Compile the question and rubric portion of a grading prompt.
         
-        prompt = f"""You are an expert teacher grading student work. Evaluate the following student response based on the rubric criteria provided.
-
-**Question/Assignment:**
-{question}
-
-**Student Answer:**
-{student_answer}
-
-**Rubric Criteria:**
-{criteria_text if criteria_text else "General assessment of content, clarity, and accuracy"}
-
-**School Level:** {school_level}
-
-Please provide your evaluation in the following JSON format:
-{{
-    "grade": "<score>/100",
-    "feedback": "<detailed constructive feedback>",
-    "glow": "<what the student did well>",
-    "grow": "<areas for improvement>",
-    "summary": "<brief 1-2 sentence summary>"
-}}
-
-Be age-appropriate, constructive, and specific in your feedback. Focus on helping the student improve."""
+        Compile once per assignment and pass the result to ``grade_compiled``
+        for every submission to avoid re-serializing the rubric.
+        
+        Returns:
+            CompiledPrompt instance
+        """
+        return get_grading_pipeline().compile(question, rubric_criteria, school_level)
+    
+    def complete(self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE):
+        """
+        Send a single-turn chat completion request.
+        
+        Args:
+            prompt: The user prompt
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature
+            
+        Returns:
+            The response message content
+        """
+        response = get_retry_policy().call(lambda: self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature
+        ))
+        return response.choices[0].message.content
+    
+    def stream(self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE):
+        """
+        Send a single-turn chat completion request and stream the reply.
         
-        return prompt
+        Args:
+            prompt: The user prompt
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature
+            
+        Yields:
+            Text fragments of the response as the model produces them
+        """
+        # Only opening the stream is retried; a reply cut off midway is not replayed
+        response = get_retry_policy().call(lambda: self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        ))
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
     
-    def grade_submission(self, question, student_answer, rubric_criteria=None, school_level="High School"):
+    def grade_submission(self, question, student_answer, rubric_criteria=None, school_level="High School",
+                         use_cache=True):
         """
         Grade a single submission using AI.
         
@@ -81,50 +120,44 @@ Be age-appropriate, constructive, and specific in your feedback. Focus on helpin
             student_answer: The student's answer
             rubric_criteria: Optional list of rubric criteria
             school_level: The school level for context
+            use_cache: Whether to consult the grading cache (requires an app context)
             
         Returns:
             Dictionary with grading results
         """
-        try:
-            prompt = self.build_grading_prompt(question, student_answer, rubric_criteria, school_level)
-            
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            
-            response_text = response.choices[0].message.content
-            cleaned_response = clean_ai_response(response_text)
-            
-            try:
-                result = json.loads(cleaned_response)
-            except json.JSONDecodeError:
-                # Fallback parsing
-                result = {
-                    "grade": extract_grade(response_text) or "70/100",
-                    "feedback": response_text,
-                    "glow": "Good effort on this assignment.",
-                    "grow": "Continue developing your ideas.",
-                    "summary": "Submission evaluated."
-                }
-            
-            # Ensure grade is properly formatted
-            if 'grade' in result and not isinstance(result['grade'], str):
-                result['grade'] = f"{result['grade']}/100"
-            
-            return result
+        compiled = self.compile_prompt(question, rubric_criteria, school_level)
+        return self.grade_compiled(compiled, student_answer, use_cache)
+    
+    def grade_compiled(self, compiled, student_answer, use_cache=True):
+        """
+        Grade a single submission against a precompiled prompt.
+        
+        Args:
+            compiled: CompiledPrompt for the assignment and rubric
+            student_answer: The student's answer
+            use_cache: Whether to consult the grading cache (requires an app context)
             
+        Returns:
+            Dictionary with grading results
+        """
+        cache = get_grading_cache() if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = compiled.cache_key(student_answer)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            response_text = self.complete(compiled.render(student_answer))
+            result = parse_grading_response(response_text)
         except Exception as e:
             logger.error(f"Error in AI grading: {str(e)}")
-            return {
-                "grade": "Error",
-                "feedback": f"Unable to grade submission: {str(e)}",
-                "glow": "",
-                "grow": "",
-                "summary": "Grading failed due to an error."
-            }
+            return error_result(e)
+        
+        if cache is not None and is_cacheable_result(result):
+            cache.set(cache_key, result, self.model_name)
+        return result
     
     def evaluate_with_rubric(self, question, answer, criteria, school_level):
         """
@@ -148,20 +181,110 @@ School Level: {school_level}
 Provide a score out of 100 and brief explanation."""
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.5
-            )
-            return response.choices[0].message.content
+            return self.complete(prompt, max_tokens=300, temperature=0.5)
         except Exception as e:
             logger.error(f"Error in rubric evaluation: {str(e)}")
             return f"Error evaluating: {str(e)}"
 
 
-# Singleton instance for easy access
+class AsyncAIGradingService(AIGradingService):
+    """
+    Asyncio-native grading service.
+    
+    All requests share one pooled aiohttp session living on the background
+    event loop, so a single worker thread can keep many grading requests in
+    flight. Synchronous callers use ``submit`` or ``grade_submission``.
+    """
+    
+    def __init__(self, max_in_flight=ASYNC_MAX_IN_FLIGHT):
+        """Initialize the async AI grading service."""
+        super().__init__()
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.endpoint = f"{BASE_URL.rstrip('/')}/v1/chat/completions"
+        self._session = None
+        self._semaphore = None
+    
+    async def _get_session(self):
+        """Get the shared HTTP session, creating it on the background loop."""
+        # Only ever called on the background loop thread, so no lock is needed
+        if self._session is None or self._session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Authorization": f"Bearer {API_KEY}"},
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._session
+    
+    async def chat_completion(self, prompt, max_tokens=MAX_TOKENS, temperature=TEMPERATURE):
+        """
+        Send a single-turn chat completion request.
+        
+        Args:
+            prompt: The user prompt
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature
+            
+        Returns:
+            The response message content
+        """
+        session = await self._get_session()
+        payload = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        
+        async def post():
+            async with self._semaphore:
+                async with session.post(self.endpoint, json=payload) as response:
+                    response.raise_for_status()
+                    return await response.json()
+        
+        data = await get_retry_policy().call_async(post)
+        return data["choices"][0]["message"]["content"]
+    
+    async def grade_compiled_async(self, compiled, student_answer):
+        """Grade a single submission against a precompiled prompt without blocking a thread."""
+        try:
+            response_text = await self.chat_completion(compiled.render(student_answer))
+            return parse_grading_response(response_text)
+        except Exception as e:
+            logger.error(f"Error in async AI grading: {str(e)}")
+            return error_result(e)
+    
+    def submit(self, coro):
+        """Schedule a coroutine on the shared event loop and return a Future."""
+        return get_background_loop().submit(coro)
+    
+    def grade_compiled(self, compiled, student_answer, use_cache=True):
+        """Synchronous wrapper around ``grade_compiled_async``."""
+        cache = get_grading_cache() if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = compiled.cache_key(student_answer)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        result = self.submit(self.grade_compiled_async(compiled, student_answer)).result()
+        
+        if cache is not None and is_cacheable_result(result):
+            cache.set(cache_key, result, self.model_name)
+        return result
+    
+    async def close(self):
+        """Close the shared HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# Singleton instances for easy access
 _ai_grading_service = None
+_async_ai_grading_service = None
 
 
 def get_ai_grading_service():
@@ -170,3 +293,11 @@ def get_ai_grading_service():
     if _ai_grading_service is None:
         _ai_grading_service = AIGradingService()
     return _ai_grading_service
+
+
+def get_async_ai_grading_service():
+    """Get the singleton async AI grading service instance."""
+    global _async_ai_grading_service
+    if _async_ai_grading_service is None:
+        _async_ai_grading_service = AsyncAIGradingService()
+    return _async_ai_grading_service
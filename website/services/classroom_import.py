@@ -0,0 +1,1084 @@
+# website/services/classroom_import.py
+"""
+Google Classroom Import Service for the AIGrader application.
+Fetches coursework, rosters and student submissions from Google Classroom
+and stores them as assignments and submissions.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cachetools import TTLCache
+from flask import current_app, has_app_context
+from googleapiclient.http import MediaIoBaseDownload
+from .drive_text_cache import REVISION_FIELDS, file_revision, get_drive_text_cache
+from .extraction_pool import get_extraction_pool
+from .google_clients import get_google_clients, google_service
+from .ocr import get_ocr_service
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_ATTACHMENT_WORKERS = 8
+DEFAULT_ROSTER_TTL = 600  # 10 minutes
+ROSTER_CACHE_MAX_COURSES = 256
+PROFILE_BATCH_SIZE = 50  # Requests per Google API batch call
+DEFAULT_PAGE_SIZE = 100  # Items requested per Classroom list page
+DEFAULT_MAX_FILE_SIZE = 50 * 1024 * 1024  # Largest Drive file downloaded
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+PLACEHOLDER_DOMAIN = 'placeholder.edu'  # For students without a visible email
+
+# Heading placed before each attachment's text in a submission's answer
+ATTACHMENT_MARKER_PREFIX = "--- Text extracted from"
+ATTACHMENT_MARKER = ATTACHMENT_MARKER_PREFIX + " {} ---"
+EXTRACTION_FAILED_TEXT = "[This file could not be processed; it will be retried on the next import.]"
+
+
+def google_credentials_for_user(user):
+    """
+    Get Google OAuth credentials from a user's stored tokens, refreshing
+    and saving them if the access token has expired. Parsed credentials
+    are cached per user (see GoogleClientCache).
+
+    Args:
+        user: The User whose ``google_tokens`` are used
+
+    Returns:
+        Credentials, or None if the tokens are missing or cannot be refreshed
+    """
+    return get_google_clients().credentials(user)
+
+
+def parse_update_time(value):
+    """
+    Parse a Classroom RFC 3339 timestamp such as ``2024-03-01T12:34:56.789Z``.
+
+    Args:
+        value: The timestamp string, or None
+
+    Returns:
+        Naive UTC datetime, or None if the value is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def iter_pages(collection, items_key, page_size=DEFAULT_PAGE_SIZE, **kwargs):
+    """
+    Follow ``nextPageToken`` through a Classroom list method.
+
+    Args:
+        collection: API collection exposing ``list`` and ``list_next``
+        items_key: Response field holding the page's items
+        page_size: Items requested per page
+        **kwargs: Arguments for the ``list`` call
+
+    Yields:
+        Lists of items, one per page, as each page arrives
+    """
+    request = collection.list(pageSize=page_size, **kwargs)
+    while request is not None:
+        response = request.execute()
+        yield response.get(items_key, [])
+        request = collection.list_next(request, response)
+
+
+def iter_items(collection, items_key, page_size=DEFAULT_PAGE_SIZE, **kwargs):
+    """Like ``iter_pages`` but yields the individual items."""
+    for page in iter_pages(collection, items_key, page_size, **kwargs):
+        yield from page
+
+
+def iter_coursework(service, course_id, page_size=DEFAULT_PAGE_SIZE):
+    """Yield every coursework item in a course."""
+    return iter_items(service.courses().courseWork(), 'courseWork', page_size, courseId=course_id)
+
+
+def iter_student_submission_pages(service, course_id, coursework_id, page_size=DEFAULT_PAGE_SIZE):
+    """Yield pages of student submissions for a coursework as they arrive."""
+    return iter_pages(service.courses().courseWork().studentSubmissions(), 'studentSubmissions',
+                      page_size, courseId=course_id, courseWorkId=coursework_id)
+
+
+def iter_students(service, course_id, page_size=DEFAULT_PAGE_SIZE):
+    """Yield every student enrolled in a course."""
+    return iter_items(service.courses().students(), 'students', page_size, courseId=course_id)
+
+
+def list_students(service, course_id, page_size=DEFAULT_PAGE_SIZE):
+    """Retrieve all students in a class."""
+    logger.info(f"Fetching students for course ID: {course_id}")
+    students = list(iter_students(service, course_id, page_size))
+    logger.info(f"Found {len(students)} students")
+    return students
+
+
+def build_student_profile_map(service, students):
+    """Create a mapping of user IDs to student profiles."""
+    student_profile_map = {}
+    for s in students:
+        if 'userId' in s and 'profile' in s:
+            student_profile_map[s['userId']] = s['profile']
+    logger.info(f"Built profile map for {len(student_profile_map)} students")
+    return student_profile_map
+
+
+def _profile_from_user_profile(student_info):
+    """Convert a Classroom userProfiles resource into a roster profile."""
+    return {
+        'name': {'fullName': student_info.get('name', {}).get('fullName', 'Unknown Student')},
+        'emailAddress': student_info.get('emailAddress', '')  # Use empty string as default
+    }
+
+
+def _unknown_profile():
+    """Minimum profile information, so a student is never skipped."""
+    return {
+        'name': {'fullName': 'Unknown Student'},
+        'emailAddress': ''
+    }
+
+
+def fetch_student_profile(service, student_id):
+    """Fetch student profile information."""
+    logger.info(f"Fetching profile for student ID: {student_id}")
+    try:
+        return _profile_from_user_profile(service.userProfiles().get(userId=student_id).execute())
+    except Exception as e:
+        logger.warning(f"Error fetching student profile: {e}")
+        return _unknown_profile()
+
+
+def fetch_student_profiles(service, student_ids, batch_size=PROFILE_BATCH_SIZE):
+    """
+    Fetch several student profiles with batched API calls.
+
+    Args:
+        service: Classroom API service
+        student_ids: Iterable of Classroom user IDs
+        batch_size: Maximum number of lookups per batch request
+
+    Returns:
+        Tuple of (profiles, found) where ``profiles`` maps every requested
+        ID to a profile (a placeholder if the lookup failed) and ``found``
+        holds only the profiles that were actually returned by the API
+    """
+    student_ids = [student_id for student_id in dict.fromkeys(student_ids) if student_id]
+    found = {}
+
+    def store(request_id, response, exception):
+        if exception is not None:
+            logger.warning(f"Error fetching student profile {request_id}: {exception}")
+        else:
+            found[request_id] = _profile_from_user_profile(response)
+
+    for start in range(0, len(student_ids), batch_size):
+        chunk = student_ids[start:start + batch_size]
+        try:
+            batch = service.new_batch_http_request(callback=store)
+            for student_id in chunk:
+                batch.add(service.userProfiles().get(userId=student_id), request_id=student_id)
+            batch.execute()
+        except Exception as e:
+            logger.warning(f"Batched profile lookup failed, fetching individually: {e}")
+            for student_id in chunk:
+                if student_id not in found:
+                    try:
+                        store(student_id, service.userProfiles().get(userId=student_id).execute(), None)
+                    except Exception as lookup_error:
+                        store(student_id, None, lookup_error)
+
+    logger.info(f"Fetched {len(found)} of {len(student_ids)} missing student profiles")
+    profiles = {student_id: found.get(student_id) or _unknown_profile() for student_id in student_ids}
+    return profiles, found
+
+
+def extract_file_text(file_path, mime_type):
+    """
+    Extract text from a downloaded file based on its MIME type, falling
+    back to OCR when local extraction yields nothing.
+
+    Args:
+        file_path: Path of the downloaded file
+        mime_type: The file's MIME type
+
+    Returns:
+        The extracted text, or an empty string
+    """
+    # Process based on mime type
+    extracted_text = ""
+    if mime_type.startswith('text/'):
+        # For text files, just read the content
+        with open(file_path, 'r', errors='ignore') as f:
+            extracted_text = f.read()
+    elif mime_type == 'application/pdf':
+        # For PDFs, try to use PyPDF2 first
+        try:
+            extracted_text = get_extraction_pool().extract_pdf_text(file_path)
+
+            # If no text was extracted, fall back to OCR
+            if not extracted_text.strip():
+                logger.info("No text extracted with PyPDF2, falling back to OCR")
+                extracted_text = get_ocr_service().extract_text(file_path, mime_type)
+        except Exception as pdf_err:
+            logger.warning(f"PyPDF2 extraction failed: {pdf_err}, falling back to OCR")
+            extracted_text = get_ocr_service().extract_text(file_path, mime_type)
+    elif mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
+        # For DOCX files, try to use python-docx
+        try:
+            extracted_text = get_extraction_pool().extract_docx_text(file_path)
+
+            # If no text was extracted, fall back to OCR
+            if not extracted_text.strip():
+                logger.info("No text extracted with python-docx, falling back to OCR")
+                extracted_text = get_ocr_service().extract_text(file_path, mime_type)
+        except Exception as docx_err:
+            logger.warning(f"DOCX extraction failed: {docx_err}, falling back to OCR")
+            extracted_text = get_ocr_service().extract_text(file_path, mime_type)
+    elif mime_type.startswith('image/'):
+        # For images, use OCR
+        extracted_text = get_ocr_service().extract_text(file_path, mime_type)
+    else:
+        # Try to use textract for advanced file types
+        try:
+            import textract
+            extracted_text = textract.process(file_path).decode('utf-8', errors='ignore')
+
+            # If no text was extracted, fall back to OCR
+            if not extracted_text.strip():
+                logger.info("No text extracted with textract, falling back to OCR")
+                extracted_text = get_ocr_service().extract_text(file_path, mime_type)
+        except Exception as textract_err:
+            logger.warning(f"Textract extraction failed: {textract_err}, falling back to OCR")
+            extracted_text = get_ocr_service().extract_text(file_path, mime_type)
+
+    return extracted_text
+
+
+class FileTooLargeError(ValueError):
+    """Raised when a Drive file exceeds the configured download limit."""
+
+
+class _LimitedWriter:
+    """File wrapper that aborts a download once it exceeds ``max_bytes``."""
+
+    def __init__(self, file, max_bytes):
+        self.file = file
+        self.max_bytes = max_bytes
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if self.max_bytes and self.written > self.max_bytes:
+            raise FileTooLargeError(f"download exceeded {self.max_bytes} bytes")
+        return self.file.write(data)
+
+
+def download_drive_file(drive_service, file_id, suffix='', size=None,
+                        max_bytes=DEFAULT_MAX_FILE_SIZE, chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE):
+    """
+    Stream a Drive file to a temporary file in chunks.
+
+    Extractors need a real path, so chunks go straight to a named temporary
+    file on disk rather than being buffered in memory.
+
+    Args:
+        drive_service: Drive API service
+        file_id: Drive file ID
+        suffix: Suffix for the temporary file name
+        size: File size from Drive metadata, if known
+        max_bytes: Maximum file size to download; 0 disables the limit
+        chunk_size: Bytes requested per chunk
+
+    Returns:
+        Path of the temporary file; the caller must delete it
+
+    Raises:
+        FileTooLargeError: If the file is larger than ``max_bytes``
+    """
+    if max_bytes and size and int(size) > max_bytes:
+        raise FileTooLargeError(f"file is {int(size)} bytes, limit is {max_bytes}")
+
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        with temp_file:
+            request = drive_service.files().get_media(fileId=file_id)
+            downloader = MediaIoBaseDownload(_LimitedWriter(temp_file, max_bytes), request, chunksize=chunk_size)
+            done = False
+            while not done:
+                _, done = downloader.next_chunk()
+    except Exception:
+        os.unlink(temp_file.name)
+        raise
+    return temp_file.name
+
+
+def process_drive_file(credentials, file_id, file_title):
+    """
+    Retrieve the text content of a Google Drive file.
+
+    The file's revision is checked against the Drive text cache first, so
+    unchanged files cost a single metadata call. The Drive service is the
+    calling thread's own, built from ``credentials``.
+
+    Returns:
+        The extracted text, an empty string if the file has none, or None
+        if the file could not be fetched or processed
+    """
+    logger.info(f"Processing Drive file: {file_title} (ID: {file_id})")
+    try:
+        drive_service = google_service('drive', 'v3', credentials)
+
+        # Get file metadata
+        file_metadata = drive_service.files().get(fileId=file_id, fields=REVISION_FIELDS).execute()
+        mime_type = file_metadata.get('mimeType', '')
+
+        cache = get_drive_text_cache()
+        revision = file_revision(file_metadata)
+        cached_text = cache.get(file_id, revision)
+        if cached_text is not None:
+            logger.info(f"Using cached text for {file_title} ({revision})")
+            return cached_text
+
+        max_bytes = DEFAULT_MAX_FILE_SIZE
+        chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE
+        if has_app_context():
+            max_bytes = current_app.config.get('DRIVE_MAX_FILE_SIZE', max_bytes)
+            chunk_size = current_app.config.get('DRIVE_DOWNLOAD_CHUNK_SIZE', chunk_size)
+
+        # Stream the file content to disk
+        try:
+            temp_file_path = download_drive_file(
+                drive_service, file_id, os.path.splitext(file_title)[1],
+                size=file_metadata.get('size'), max_bytes=max_bytes, chunk_size=chunk_size
+            )
+        except FileTooLargeError as e:
+            logger.warning(f"Skipping {file_title}: {e}")
+            return f"[File not processed: larger than the {max_bytes // (1024 * 1024)} MB limit.]"
+
+        try:
+            extracted_text = extract_file_text(temp_file_path, mime_type)
+        finally:
+            # Clean up temporary file
+            os.unlink(temp_file_path)
+
+        # Empty results are not cached, as they may come from a transient OCR failure
+        if extracted_text:
+            cache.set(file_id, revision, mime_type, extracted_text)
+
+        logger.info(f"Extracted {len(extracted_text)} characters from {file_title} ({mime_type})")
+        return extracted_text
+    except Exception as e:
+        logger.exception(f"Error processing drive file: {e}")
+        return None
+
+
+def extraction_failed(row):
+    """Check whether any attachment of a processed submission row failed to extract."""
+    return any(attachment.get('failed') for attachment in row[4] or [])
+
+
+def drive_attachments(submission):
+    """
+    List the Drive files attached to a student submission.
+
+    Returns:
+        List of (file_id, file_title) tuples in attachment order
+    """
+    attachments = []
+    for attachment in submission.get('assignmentSubmission', {}).get('attachments', []):
+        if 'driveFile' in attachment:
+            drive_file = attachment['driveFile']
+            attachments.append((drive_file['id'], drive_file.get('title', drive_file.get('name', 'Untitled File'))))
+    return attachments
+
+
+def process_submission(service, credentials, submission, student_profile_map, course_id, attachment_texts=None):
+    """
+    Process an individual student submission.
+
+    Args:
+        service: Classroom API service
+        credentials: Google OAuth credentials, used for Drive attachments
+        submission: Classroom studentSubmissions resource
+        student_profile_map: Mapping of user IDs to roster profiles
+        course_id: Google Classroom course ID
+        attachment_texts: Optional mapping of Drive file IDs to futures
+                          already extracting their text; files not in it
+                          are processed inline
+
+    Returns:
+        Tuple of (student_name, student_email, full_answer,
+        submission_data_json, attachments), where attachments lists the
+        file_id, file_name and text of each Drive attachment, and whether
+        its extraction ``failed``
+    """
+    attachment_texts = attachment_texts or {}
+    student_id = submission.get('userId')
+
+    profile = student_profile_map.get(student_id)
+    if not profile:
+        logger.info(f"Profile not found in map for student ID: {student_id}, fetching directly")
+        profile = fetch_student_profile(service, student_id)
+
+    student_name = profile.get('name', {}).get('fullName', 'Unknown Student')
+    student_email = profile.get('emailAddress') or placeholder_email(student_id or student_name)
+
+    student_answer = ""
+    extracted_texts = []
+    file_links = []
+
+    if 'assignmentSubmission' in submission:
+        assign_submission = submission['assignmentSubmission']
+
+        # Check for text submission
+        if 'text' in assign_submission:
+            student_answer = assign_submission['text']
+
+        # Check for file attachments
+        for file_id, file_title in drive_attachments(submission):
+            # Add to file links
+            file_links.append({
+                'name': file_title,
+                'id': file_id,
+                'type': 'drive',
+                'link': f"https://drive.google.com/file/d/{file_id}/view"
+            })
+
+            # Extract text from file, unless it is already being extracted
+            pending = attachment_texts.get(file_id)
+            if pending is not None:
+                extracted_text = pending.result()
+            else:
+                extracted_text = process_drive_file(credentials, file_id, file_title)
+
+            if extracted_text is None:
+                # Saved for now; the sync watermark stays below this submission so it is retried
+                extracted_texts.append({
+                    'file_name': file_title,
+                    'file_id': file_id,
+                    'text': EXTRACTION_FAILED_TEXT,
+                    'failed': True
+                })
+            elif extracted_text:
+                # Store extracted text with file information
+                extracted_texts.append({
+                    'file_name': file_title,
+                    'file_id': file_id,
+                    'text': extracted_text
+                })
+            else:
+                logger.info(f"No text extracted from {file_title}")
+                # Store empty text information to acknowledge the file
+                extracted_texts.append({
+                    'file_name': file_title,
+                    'file_id': file_id,
+                    'text': "[No text content could be extracted from this file.]"
+                })
+
+    # Format the extracted text to be included in student_answer
+    full_answer = student_answer
+    for extracted in extracted_texts:
+        # Add delimiter and file information
+        if full_answer:
+            full_answer += "\n\n"
+        full_answer += f"{ATTACHMENT_MARKER.format(extracted['file_name'])}\n{extracted['text']}"
+
+    # If no text was extracted at all, add a note
+    if not full_answer.strip():
+        full_answer = "[No text content was found in this submission.]"
+
+    logger.info(f"Processed submission for {student_name}: {len(full_answer)} characters, "
+                f"{len(file_links)} files")
+
+    submission_data_json = json.dumps({'files': file_links}) if file_links else None
+    return student_name, student_email, full_answer, submission_data_json, extracted_texts
+
+
+def placeholder_email(student_key):
+    """
+    Build a stable placeholder email for a student without one, so repeated
+    imports update the same submission instead of adding another.
+
+    Args:
+        student_key: Classroom user ID, or the student's name if there is none
+    """
+    digest = hashlib.md5(str(student_key).encode()).hexdigest()[:12]
+    return f"classroom_{digest}@{PLACEHOLDER_DOMAIN}"
+
+
+def _is_legacy_placeholder(email):
+    """Check for the timestamp-based placeholder emails of earlier imports."""
+    return bool(email) and email.startswith('student_') and email.endswith(f"@{PLACEHOLDER_DOMAIN}")
+
+
+def _save_attachments(assignment_id, attachments):
+    """
+    Sync the stored attachment texts of an assignment's submissions.
+
+    Existing attachments are loaded with one query; new files are
+    inserted, files whose text hash changed are updated and files no
+    longer attached are deleted. The caller commits.
+
+    Args:
+        assignment_id: Local assignment ID
+        attachments: Mapping of submission IDs to the file_id, file_name
+                     and text of each of their Drive attachments
+    """
+    from sqlalchemy import delete, insert, update
+    from ..models import Submission, SubmissionAttachment, db
+
+    if not attachments:
+        return
+
+    existing = {}
+    for attachment_id, submission_id, file_id, text_hash in db.session.query(
+            SubmissionAttachment.id, SubmissionAttachment.submission_id,
+            SubmissionAttachment.file_id, SubmissionAttachment.text_hash
+    ).join(Submission, Submission.id == SubmissionAttachment.submission_id).filter(
+            Submission.assignment_id == assignment_id):
+        if submission_id in attachments:
+            existing[(submission_id, file_id)] = (attachment_id, text_hash)
+
+    inserts = {}
+    updates = []
+    for submission_id, files in attachments.items():
+        for attachment in files:
+            text = attachment['text'] or ''
+            row = {
+                'file_name': attachment['file_name'],
+                'text': text,
+                'size': len(text),
+                'text_hash': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+                'updated_at': datetime.utcnow()
+            }
+            key = (submission_id, attachment['file_id'])
+            stored = existing.pop(key, None)
+            if stored is None:
+                inserts[key] = dict(row, submission_id=submission_id, file_id=attachment['file_id'])
+            elif stored[1] != row['text_hash']:
+                updates.append(dict(row, id=stored[0]))
+
+    if inserts:
+        db.session.execute(insert(SubmissionAttachment), list(inserts.values()))
+    if updates:
+        db.session.execute(update(SubmissionAttachment), updates)
+    if existing:
+        # Files removed from the submission since the last import
+        db.session.execute(delete(SubmissionAttachment).where(
+            SubmissionAttachment.id.in_([attachment_id for attachment_id, _ in existing.values()])
+        ))
+
+
+def attachment_text(submission, file_id):
+    """
+    Get the extracted text of one Drive attachment of a submission.
+
+    Submissions imported before attachment texts were stored separately
+    only have them inside ``student_answer``, so the text is looked up by
+    its marker there.
+
+    Args:
+        submission: The Submission
+        file_id: Drive file ID of the attachment
+
+    Returns:
+        The extracted text, or None if the submission has no such attachment
+    """
+    from ..models import SubmissionAttachment
+
+    attachment = SubmissionAttachment.query.filter_by(submission_id=submission.id, file_id=file_id).first()
+    if attachment is not None:
+        return attachment.text
+
+    submission_data = submission.get_submission_data() or {}
+    for file in submission_data.get('files', []):
+        if file.get('id') == file_id:
+            marker = ATTACHMENT_MARKER.format(file.get('name'))
+            if submission.student_answer and marker in submission.student_answer:
+                text = submission.student_answer.split(marker, 1)[1]
+                return text.split(ATTACHMENT_MARKER_PREFIX)[0].strip()
+            return None
+    return None
+
+
+def save_submissions(assignment_id, rows):
+    """
+    Insert or update the imported submissions of an assignment in one transaction.
+
+    The assignment's existing submissions are loaded with a single query
+    and matched on student email; matches are updated in one bulk UPDATE
+    by primary key and the rest inserted in bulk, returning their new IDs. Submissions saved under the timestamp-based
+    placeholder emails of earlier imports are matched on student name.
+    Attachment texts are written to the submission_attachment table in
+    the same transaction.
+
+    Args:
+        assignment_id: Local assignment ID
+        rows: (student_name, student_email, student_answer,
+              submission_data_json, attachments) tuples as returned by
+              process_submission; attachments of None leaves a
+              submission's stored attachments untouched
+
+    Returns:
+        Number of submissions saved, 0 if the transaction failed
+    """
+    from sqlalchemy import insert, update
+    from ..models import Submission, db
+
+    if not rows:
+        return 0
+
+    try:
+        existing = {}
+        legacy = {}
+        for submission_id, email, name in db.session.query(
+                Submission.id, Submission.student_email, Submission.student_name
+        ).filter(Submission.assignment_id == assignment_id):
+            existing[email] = submission_id
+            if _is_legacy_placeholder(email):
+                legacy.setdefault(name, []).append(submission_id)
+
+        updates = {}
+        inserts = {}
+        attachments = {}  # By submission ID
+        new_attachments = {}  # By student email, until the rows are inserted
+        for student_name, student_email, student_answer, submission_data_json, files in rows:
+            student_email = student_email or placeholder_email(student_name)
+            row = {
+                'student_name': student_name,
+                'student_email': student_email,
+                'student_answer': student_answer,
+                'submission_data': submission_data_json,
+                'assignment_id': assignment_id
+            }
+            submission_id = existing.get(student_email)
+            if submission_id is None and student_email.endswith(f"@{PLACEHOLDER_DOMAIN}") and legacy.get(student_name):
+                submission_id = legacy[student_name].pop(0)
+            if submission_id is not None:
+                updates[submission_id] = dict(row, id=submission_id)
+                attachments[submission_id] = files
+            else:
+                inserts[student_email] = dict(row, grade=0)  # Default grade
+                new_attachments[student_email] = files
+
+        if updates:
+            db.session.execute(update(Submission), list(updates.values()))
+        if inserts:
+            for submission_id, email in db.session.execute(
+                    insert(Submission).returning(Submission.id, Submission.student_email),
+                    list(inserts.values())):
+                attachments[submission_id] = new_attachments.pop(email)
+        _save_attachments(assignment_id, {
+            submission_id: files for submission_id, files in attachments.items() if files is not None
+        })
+        db.session.commit()
+
+        logger.info(f"Saved submissions for assignment {assignment_id}: "
+                    f"{len(updates)} updated, {len(inserts)} new")
+        return len(updates) + len(inserts)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error saving submissions for assignment {assignment_id}: {e}")
+        return 0
+
+
+class RosterCache:
+    """
+    Short-lived per-course cache of student profile maps.
+
+    Lets repeated imports of the same course within ``ttl`` seconds reuse
+    the roster instead of listing every student again.
+    """
+
+    def __init__(self, ttl=DEFAULT_ROSTER_TTL, max_courses=ROSTER_CACHE_MAX_COURSES):
+        """
+        Initialize the roster cache.
+
+        Args:
+            ttl: Time-to-live for a course roster in seconds
+            max_courses: Maximum number of courses to keep
+        """
+        self.ttl = int(ttl)
+        self._rosters = TTLCache(maxsize=max_courses, ttl=self.ttl) if self.ttl > 0 else None
+        self._lock = threading.Lock()
+
+    def get(self, course_id):
+        """Get a copy of the cached profile map for a course, or None."""
+        if self._rosters is None:
+            return None
+        with self._lock:
+            roster = self._rosters.get(course_id)
+            return dict(roster) if roster is not None else None
+
+    def set(self, course_id, student_profile_map):
+        """Store the profile map for a course."""
+        if self._rosters is None:
+            return
+        with self._lock:
+            self._rosters[course_id] = dict(student_profile_map)
+
+    def add(self, course_id, profiles):
+        """Merge individually fetched profiles into a cached roster."""
+        if self._rosters is None or not profiles:
+            return
+        with self._lock:
+            roster = self._rosters.get(course_id)
+            if roster is not None:
+                roster.update(profiles)
+
+    def invalidate(self, course_id):
+        """Drop the cached roster for a course."""
+        if self._rosters is None:
+            return
+        with self._lock:
+            self._rosters.pop(course_id, None)
+
+
+class ClassroomImporter:
+    """
+    Imports a Google Classroom course with bounded concurrency.
+
+    The coursework list and the roster are fetched side by side, then every
+    coursework item's submissions are listed and processed on a worker pool.
+    Drive attachments of each page of submissions are downloaded and
+    extracted on a second pool, so files of different students proceed in
+    parallel while each answer is still assembled in attachment order.
+    Google API service objects are not thread-safe, so every thread gets
+    its own Classroom and Drive services from the Google client cache,
+    built from the importer's credentials. Assignments and submissions are
+    written on the calling thread as results arrive.
+    """
+
+    def __init__(self, credentials, max_workers=DEFAULT_MAX_WORKERS, roster_cache=None,
+                 page_size=DEFAULT_PAGE_SIZE, attachment_workers=DEFAULT_ATTACHMENT_WORKERS):
+        """
+        Initialize the importer.
+
+        Args:
+            credentials: Google OAuth credentials of the importing teacher
+            max_workers: Maximum number of coursework items fetched at once
+            roster_cache: Optional RosterCache shared between imports
+            page_size: Items requested per Classroom list page
+            attachment_workers: Maximum number of Drive files processed at once
+        """
+        self.credentials = credentials
+        self.max_workers = max(1, int(max_workers))
+        self.page_size = max(1, int(page_size))
+        self.attachment_workers = max(1, int(attachment_workers))
+        self._attachment_executor = None
+        self.progress = None
+        self.roster_cache = roster_cache
+        # Workers read and write the Drive text cache, so they need the app
+        self.app = current_app._get_current_object() if has_app_context() else None
+        self._roster_lock = threading.Lock()
+
+    def _in_app_context(self, fn, *args):
+        """Run ``fn`` on a worker thread inside an application context."""
+        if self.app is None:
+            return fn(*args)
+        with self.app.app_context():
+            return fn(*args)
+
+    def _service(self):
+        """Get this thread's Classroom API service."""
+        return google_service('classroom', 'v1', self.credentials)
+
+    def fetch_coursework(self, course_id):
+        """List all coursework items in a course."""
+        logger.info(f"Fetching coursework for Google Classroom ID: {course_id}")
+        coursework_items = list(iter_coursework(self._service(), course_id, self.page_size))
+        logger.info(f"Found {len(coursework_items)} coursework items")
+        return coursework_items
+
+    def fetch_roster(self, course_id):
+        """
+        Get the student profile map for a course, listing the roster only
+        if no recent copy is cached.
+        """
+        if self.roster_cache is not None:
+            student_profile_map = self.roster_cache.get(course_id)
+            if student_profile_map is not None:
+                logger.info(f"Using cached roster for course ID: {course_id}")
+                return student_profile_map
+
+        service = self._service()
+        student_profile_map = build_student_profile_map(service, list_students(service, course_id, self.page_size))
+        if self.roster_cache is not None:
+            self.roster_cache.set(course_id, student_profile_map)
+        return student_profile_map
+
+    def resolve_profiles(self, course_id, student_submissions, student_profile_map):
+        """
+        Look up, in batches, the profiles of submitters missing from the roster
+        (e.g. students who left the course) and add them to the shared map.
+        """
+        with self._roster_lock:
+            missing = [submission.get('userId') for submission in student_submissions
+                       if submission.get('userId') not in student_profile_map]
+        if not missing:
+            return
+
+        profiles, found = fetch_student_profiles(self._service(), missing)
+        with self._roster_lock:
+            for student_id, profile in profiles.items():
+                student_profile_map.setdefault(student_id, profile)
+        if self.roster_cache is not None:
+            self.roster_cache.add(course_id, found)
+
+    def submit_attachments(self, submissions):
+        """
+        Start extracting the Drive attachments of several submissions.
+
+        Args:
+            submissions: Classroom studentSubmissions resources
+
+        Returns:
+            Mapping of Drive file IDs to futures resolving to extracted text
+        """
+        if self._attachment_executor is None:
+            return {}
+        pending = {}
+        for submission in submissions:
+            for file_id, file_title in drive_attachments(submission):
+                if file_id not in pending:
+                    pending[file_id] = self._attachment_executor.submit(
+                        self._in_app_context, process_drive_file, self.credentials, file_id, file_title
+                    )
+        progress = self.progress
+        if progress is not None and pending:
+            progress.add_files(len(pending))
+            for future in pending.values():
+                future.add_done_callback(lambda _: progress.file_done())
+        return pending
+
+    def fetch_submissions(self, course_id, coursework_id, roster, since=None):
+        """
+        List and process the student submissions of one coursework item.
+
+        Runs on a worker thread; its only database access is the Drive
+        text cache, through the worker's own session. A submission whose
+        attachment could not be extracted is still returned, but the
+        returned watermark stays below its ``updateTime`` so the next
+        sync imports it again.
+
+        Args:
+            course_id: Google Classroom course ID
+            coursework_id: Google Classroom coursework ID
+            roster: Future resolving to the course's student profile map
+            since: Watermark from the last sync; submissions whose
+                   ``updateTime`` is not newer are skipped without
+                   downloading their attachments
+
+        Returns:
+            Tuple of (rows, latest, skipped): a list of processed
+            submission rows for changed submissions, the watermark to
+            save and the number of unchanged submissions skipped
+        """
+        service = self._service()
+        rows = []
+        updates = []
+        failed_at = None  # Oldest updateTime of a submission whose extraction failed
+        skipped = 0
+        # Process each page as it arrives instead of holding the full listing
+        for page in iter_student_submission_pages(service, course_id, coursework_id, self.page_size):
+            changed = []
+            for submission in page:
+                updated = parse_update_time(submission.get('updateTime'))
+                if updated is not None:
+                    updates.append(updated)
+                if since is not None and updated is not None and updated <= since:
+                    skipped += 1
+                else:
+                    changed.append(submission)
+            if not changed:
+                continue
+
+            student_profile_map = roster.result()
+            attachment_texts = self.submit_attachments(changed)
+            self.resolve_profiles(course_id, changed, student_profile_map)
+            for submission in changed:
+                row = process_submission(service, self.credentials, submission, student_profile_map, course_id,
+                                         attachment_texts)
+                rows.append(row)
+                updated = parse_update_time(submission.get('updateTime'))
+                if extraction_failed(row) and updated is not None and (failed_at is None or updated < failed_at):
+                    failed_at = updated
+
+        # Never advance the watermark past a submission that has to be retried
+        latest = max((updated for updated in updates if failed_at is None or updated < failed_at), default=since)
+        if failed_at is not None:
+            logger.warning(f"Attachments of some submissions for coursework ID: {coursework_id} failed to"
+                           f" extract; they will be retried on the next sync")
+        logger.info(f"Processed {len(rows)} submissions for coursework ID: {coursework_id}"
+                    f" ({skipped} unchanged)")
+        return rows, latest, skipped
+
+    def import_course(self, google_class, progress=None, full_sync=False):
+        """
+        Import the coursework and submissions of a Google Classroom class.
+
+        Each coursework item keeps a ClassroomSyncState watermark holding
+        the newest submission ``updateTime`` imported. Later imports skip
+        submissions that have not changed since, and the watermark only
+        advances once every changed submission of the item was saved.
+
+        Args:
+            google_class: The GoogleClass to import into
+            progress: Optional ImportProgress told about each finished
+                      assignment and Drive file
+            full_sync: Ignore the watermarks and re-import every submission
+
+        Returns:
+            Dictionary with counts of imported assignments, imported and
+            unchanged submissions, and the titles of coursework items that failed
+        """
+        from ..models import Assignment, ClassroomSyncState, db
+
+        course_id = google_class.google_classroom_id
+        summary = {'assignments': 0, 'submissions': 0, 'unchanged': 0, 'failed': []}
+        sync_states = {
+            state.coursework_id: state
+            for state in ClassroomSyncState.query.filter_by(class_id=google_class.id)
+        }
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='classroom-import') as executor, \
+                ThreadPoolExecutor(max_workers=self.attachment_workers,
+                                   thread_name_prefix='classroom-attachment') as attachment_executor:
+            self._attachment_executor = attachment_executor
+            self.progress = progress
+            roster = executor.submit(self.fetch_roster, course_id)
+            coursework_items = self.fetch_coursework(course_id)
+            if progress is not None:
+                progress.set_assignments(len(coursework_items))
+
+            futures = {}
+            for item in coursework_items:
+                state = sync_states.get(item['id'])
+                since = None if full_sync or state is None else state.submissions_updated_at
+                future = executor.submit(self._in_app_context, self.fetch_submissions,
+                                         course_id, item['id'], roster, since)
+
+                # Create or update the assignment while its submissions download
+                assignment = Assignment.query.filter_by(
+                    name=item['title'],
+                    class_id=google_class.id
+                ).first()
+                if assignment is None:
+                    assignment = Assignment(
+                        name=item['title'],
+                        question=item.get('description', ''),
+                        class_id=google_class.id,
+                        rubric_id=google_class.rubric_id
+                    )
+                    db.session.add(assignment)
+                    db.session.flush()  # Get the ID without committing
+                else:
+                    assignment.question = item.get('description', '')
+                futures[future] = (assignment.id, item)
+            db.session.commit()
+            summary['assignments'] = len(futures)
+
+            for future in as_completed(futures):
+                assignment_id, item = futures[future]
+                try:
+                    rows, latest, skipped = future.result()
+                except Exception as e:
+                    logger.exception(f"Error importing submissions for '{item['title']}': {e}")
+                    summary['failed'].append(item['title'])
+                    rows, latest, skipped = [], None, 0
+                saved = save_submissions(assignment_id, rows)
+                summary['submissions'] += saved
+                summary['unchanged'] += skipped
+                if latest is not None and saved == len(rows):
+                    self.save_sync_state(google_class.id, assignment_id, item, latest, sync_states)
+                if progress is not None:
+                    progress.assignment_done(saved)
+
+        self._attachment_executor = None
+        self.progress = None
+        logger.info(f"Imported {summary['assignments']} assignments and {summary['submissions']} "
+                    f"submissions from course {course_id} ({summary['unchanged']} unchanged)")
+        return summary
+
+    @staticmethod
+    def save_sync_state(class_id, assignment_id, item, latest, sync_states):
+        """
+        Advance the watermark of a coursework item after a successful sync.
+
+        Args:
+            class_id: ID of the GoogleClass being imported
+            assignment_id: ID of the item's Assignment
+            item: The Classroom courseWork resource
+            latest: Newest submission ``updateTime`` that was imported
+            sync_states: Mapping of coursework ID to loaded ClassroomSyncState
+        """
+        from ..models import ClassroomSyncState, db
+
+        state = sync_states.get(item['id'])
+        if state is None:
+            state = ClassroomSyncState(class_id=class_id, coursework_id=item['id'])
+            db.session.add(state)
+            sync_states[item['id']] = state
+        state.assignment_id = assignment_id
+        state.coursework_updated_at = parse_update_time(item.get('updateTime'))
+        if state.submissions_updated_at is None or latest > state.submissions_updated_at:
+            state.submissions_updated_at = latest
+        state.synced_at = datetime.utcnow()
+        try:
+            db.session.commit()
+        except Exception as e:
+            logger.warning(f"Could not save sync state for coursework {item['id']}: {e}")
+            db.session.rollback()
+            sync_states.pop(item['id'], None)
+
+
+def get_classroom_importer(credentials):
+    """
+    Create a Classroom importer for one import run.
+
+    Args:
+        credentials: Google OAuth credentials of the importing teacher
+
+    Returns:
+        ClassroomImporter instance
+    """
+    max_workers = DEFAULT_MAX_WORKERS
+    page_size = DEFAULT_PAGE_SIZE
+    attachment_workers = DEFAULT_ATTACHMENT_WORKERS
+    if has_app_context():
+        max_workers = current_app.config.get('CLASSROOM_IMPORT_WORKERS', max_workers)
+        page_size = current_app.config.get('CLASSROOM_PAGE_SIZE', page_size)
+        attachment_workers = current_app.config.get('CLASSROOM_ATTACHMENT_WORKERS', attachment_workers)
+    return ClassroomImporter(credentials, max_workers, get_roster_cache(), page_size, attachment_workers)
+
+
+# Singleton instance
+_roster_cache = None
+_roster_cache_lock = threading.Lock()
+
+
+def get_roster_cache():
+    """Get the singleton course roster cache."""
+    global _roster_cache
+    if _roster_cache is None:
+        with _roster_cache_lock:
+            if _roster_cache is None:
+                ttl = DEFAULT_ROSTER_TTL
+                if has_app_context():
+                    ttl = current_app.config.get('CLASSROOM_ROSTER_TTL', ttl)
+                _roster_cache = RosterCache(ttl)
+    return _roster_cache
@@ -0,0 +1,207 @@
+# website/services/drive_text_cache.py
+"""
+Drive Text Cache for the AIGrader application.
+Stores text extracted from Google Drive attachments so unchanged files are
+not downloaded and parsed again on every Classroom refresh.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_MAX_AGE = 180 * 24 * 3600  # 180 days since last use
+
+# Drive metadata needed to decide whether a cached extraction is current
+REVISION_FIELDS = "mimeType, name, size, md5Checksum, version, modifiedTime"
+
+
+def file_revision(file_metadata):
+    """
+    Build a revision fingerprint from Drive file metadata.
+
+    Binary uploads carry an ``md5Checksum`` of their content; native Google
+    Docs do not, so their ``version`` and ``modifiedTime`` are used instead.
+
+    Args:
+        file_metadata: Drive files.get response including REVISION_FIELDS
+
+    Returns:
+        Revision string, or None if the metadata cannot identify a revision
+    """
+    md5 = file_metadata.get('md5Checksum')
+    if md5:
+        return f"md5:{md5}"
+    version = file_metadata.get('version')
+    modified = file_metadata.get('modifiedTime')
+    if version or modified:
+        return f"v:{version or ''}:{modified or ''}"
+    return None
+
+
+class DriveTextCache:
+    """
+    Persistent extracted-text store backed by the ``drive_text_cache`` table.
+
+    One row is kept per Drive file; a lookup only hits when the stored
+    revision matches the file's current revision, so edited files are
+    re-extracted and their row overwritten. Rows unused for ``max_age``
+    seconds are removed by ``evict``.
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, enabled=True):
+        """
+        Initialize the Drive text cache.
+
+        Args:
+            max_age: Seconds since last use after which entries are evicted
+            enabled: Whether the cache is consulted at all
+        """
+        self.max_age = int(max_age)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _table():
+        from ..models import DriveTextCacheEntry
+        return DriveTextCacheEntry.__table__
+
+    @staticmethod
+    def _connect():
+        """Open a short transaction on its own connection, leaving the caller's session alone."""
+        from ..models import db
+        return db.engine.begin()
+
+    def get(self, file_id, revision):
+        """
+        Look up the extracted text of a Drive file revision.
+
+        Args:
+            file_id: Drive file ID
+            revision: Revision fingerprint from ``file_revision``
+
+        Returns:
+            The cached text, or None on a miss
+        """
+        if not self.enabled or not revision:
+            return None
+
+        from sqlalchemy import select, update
+
+        table = self._table()
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    select(table.c.revision, table.c.text).where(table.c.file_id == file_id)
+                ).first()
+                if row is None or row.revision != revision:
+                    self._count(False)
+                    return None
+
+                connection.execute(update(table).where(table.c.file_id == file_id).values(
+                    last_used_at=datetime.utcnow()
+                ))
+            self._count(True)
+            return row.text
+        except Exception as e:
+            logger.warning(f"Drive text cache lookup failed: {e}")
+            self._count(False)
+            return None
+
+    def set(self, file_id, revision, mime_type, text):
+        """
+        Store the extracted text of a Drive file revision.
+
+        Args:
+            file_id: Drive file ID
+            revision: Revision fingerprint from ``file_revision``
+            mime_type: The file's MIME type
+            text: The extracted text
+        """
+        if not self.enabled or not revision:
+            return
+
+        from sqlalchemy import insert, update
+
+        table = self._table()
+        try:
+            now = datetime.utcnow()
+            values = {
+                'revision': revision,
+                'mime_type': mime_type,
+                'text': text,
+                'created_at': now,
+                'last_used_at': now
+            }
+            with self._connect() as connection:
+                updated = connection.execute(update(table).where(table.c.file_id == file_id).values(**values))
+                if not updated.rowcount:
+                    connection.execute(insert(table).values(file_id=file_id, **values))
+        except Exception as e:
+            logger.warning(f"Drive text cache store failed: {e}")
+
+    def evict(self):
+        """
+        Remove entries that have not been used for ``max_age`` seconds.
+
+        Returns:
+            Number of entries removed
+        """
+        from sqlalchemy import delete
+
+        table = self._table()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.max_age)
+            with self._connect() as connection:
+                removed = connection.execute(delete(table).where(table.c.last_used_at < cutoff)).rowcount
+            if removed:
+                logger.info(f"Evicted {removed} Drive text cache entries")
+            return removed
+        except Exception as e:
+            logger.warning(f"Drive text cache eviction failed: {e}")
+            return 0
+
+    def stats(self):
+        """Get cache counters for monitoring."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else 0,
+            'max_age': self.max_age
+        }
+
+
+# Singleton instance
+_drive_text_cache = None
+_drive_text_cache_lock = threading.Lock()
+
+
+def get_drive_text_cache():
+    """Get the singleton Drive text cache instance."""
+    global _drive_text_cache
+    if _drive_text_cache is None:
+        with _drive_text_cache_lock:
+            if _drive_text_cache is None:
+                max_age = DEFAULT_MAX_AGE
+                enabled = True
+                if has_app_context():
+                    max_age = current_app.config.get('DRIVE_TEXT_CACHE_MAX_AGE', max_age)
+                    enabled = current_app.config.get('DRIVE_TEXT_CACHE_ENABLED', enabled)
+                _drive_text_cache = DriveTextCache(max_age, enabled)
+    return _drive_text_cache
@@ -0,0 +1,82 @@
+# website/services/event_loop.py
+"""
+Background event loop for the AIGrader application.
+Lets synchronous code (request threads, job runners, Celery tasks) submit
+coroutines to a single long-lived asyncio loop.
+"""
+
+import asyncio
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundEventLoop:
+    """An asyncio event loop running forever on a daemon thread."""
+
+    def __init__(self, name='aigrader-event-loop'):
+        """Initialize the background loop (started lazily)."""
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """The running event loop, starting it on first use."""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=self._run, args=(loop,), name=self.name, daemon=True)
+                    thread.start()
+                    self._thread = thread
+                    self._loop = loop
+        return self._loop
+
+    @staticmethod
+    def _run(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the background loop.
+
+        Args:
+            coro: The coroutine to run
+
+        Returns:
+            concurrent.futures.Future resolving to the coroutine result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the background loop and wait for its result."""
+        return self.submit(coro).result(timeout=timeout)
+
+    def stop(self):
+        """Stop the loop and wait for its thread to exit."""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+# Singleton instance
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop():
+    """Get the singleton background event loop."""
+    global _background_loop
+    if _background_loop is None:
+        with _background_loop_lock:
+            if _background_loop is None:
+                _background_loop = BackgroundEventLoop()
+                atexit.register(_background_loop.stop)
+    return _background_loop
@@ -0,0 +1,404 @@
+# website/services/extraction_pool.py
+"""
+Text Extraction Pool for the AIGrader application.
+Runs CPU-bound document parsing in worker processes so it does not hold
+the GIL of the web or import threads.
+"""
+
+import io
+import os
+import time
+import signal
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_PROCESSES = min(4, os.cpu_count() or 1)
+DEFAULT_TIMEOUT = 60  # Seconds per extraction job
+DEFAULT_MEMORY_LIMIT = 1024 * 1024 * 1024  # Address space per worker process
+MAX_TASKS_PER_CHILD = 200  # Recycle workers to contain parser memory leaks
+DEFAULT_PDF_MAX_PAGES = 50
+DEFAULT_PDF_MAX_CHARS = 200000
+DEFAULT_PDF_PAGES_PER_CHUNK = 10
+HARD_TIMEOUT_GRACE = 5  # Seconds past its alarm before a stuck job's pool is killed
+WAIT_INTERVAL = 1  # Seconds between checks on a job that may be stuck
+
+
+class ExtractionTimeout(TimeoutError):
+    """Raised when an extraction job runs longer than its timeout."""
+
+
+def _limit_memory(max_bytes):
+    """Worker initializer: cap the worker's address space (Unix only)."""
+    if not max_bytes:
+        return
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _run_with_timeout(timeout, fn, *args):
+    """
+    Worker-side job wrapper: run ``fn`` under an interval timer started
+    when the job starts, so time spent queued does not count against it.
+    """
+    if not timeout or not hasattr(signal, 'setitimer'):
+        return fn(*args)
+
+    def expired(signum, frame):
+        raise ExtractionTimeout(f"Extraction took longer than {timeout} seconds")
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _pdf_page_texts(pdf_reader, start, stop):
+    page_texts = []
+    for page_num in range(start, min(stop, len(pdf_reader.pages))):
+        try:
+            page_texts.append(pdf_reader.pages[page_num].extract_text() or "")
+        except Exception:
+            # One unreadable page should not lose the rest of the document
+            page_texts.append("")
+    return page_texts
+
+
+def _docx_text(source):
+    import docx
+
+    doc = docx.Document(source)
+    return "\n".join(paragraph.text for paragraph in doc.paragraphs)
+
+
+# The functions below run inside worker processes, so they must stay at
+# module level and take only picklable arguments.
+
+def pdf_first_pages(file_path, count):
+    """
+    Open a PDF and extract its first ``count`` pages.
+
+    Returns:
+        Tuple of (total page count, list of page texts)
+    """
+    import PyPDF2
+
+    with open(file_path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        return len(pdf_reader.pages), _pdf_page_texts(pdf_reader, 0, count)
+
+
+def pdf_page_range(file_path, start, stop):
+    """Extract pages ``start`` to ``stop`` (exclusive) of a PDF file."""
+    import PyPDF2
+
+    with open(file_path, 'rb') as f:
+        return _pdf_page_texts(PyPDF2.PdfReader(f), start, stop)
+
+
+def docx_text_from_path(file_path):
+    """Extract the paragraphs of a DOCX file."""
+    return _docx_text(file_path)
+
+
+def docx_text_from_bytes(data):
+    """Extract the paragraphs of in-memory DOCX content."""
+    return _docx_text(io.BytesIO(data))
+
+
+class TextExtractionPool:
+    """
+    Process pool for document parsing.
+
+    Each job gets a timeout, and each worker process an address-space
+    limit, so a pathological document fails with an error instead of
+    pinning a CPU or exhausting memory. Workers are started with
+    ``forkserver`` (``spawn`` where unavailable) rather than ``fork``,
+    because forking a multi-threaded web worker can copy held locks into
+    the child. The timeout is an alarm set inside the worker when the job
+    starts, so a job waiting behind others never times out and a timed-out
+    job leaves its worker usable. Only a job stuck where the alarm cannot
+    interrupt it gets its pool terminated and recreated; other callers'
+    jobs lost to that restart are retried once on the new pool.
+    """
+
+    def __init__(self, processes=DEFAULT_PROCESSES, timeout=DEFAULT_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 pdf_max_pages=DEFAULT_PDF_MAX_PAGES, pdf_max_chars=DEFAULT_PDF_MAX_CHARS,
+                 pdf_pages_per_chunk=DEFAULT_PDF_PAGES_PER_CHUNK):
+        """
+        Initialize the extraction pool.
+
+        Args:
+            processes: Number of worker processes
+            timeout: Default seconds a job may run; 0 disables the timeout
+            memory_limit: Address-space limit per worker in bytes; 0 disables it
+            pdf_max_pages: Default page cap for PDF extraction; 0 reads all
+            pdf_max_chars: Default character cap for PDF extraction; 0 is unlimited
+            pdf_pages_per_chunk: PDF pages extracted per job
+        """
+        self.processes = max(1, int(processes))
+        self.timeout = timeout
+        self.memory_limit = int(memory_limit)
+        self.pdf_max_pages = int(pdf_max_pages)
+        self.pdf_max_chars = int(pdf_max_chars)
+        self.pdf_pages_per_chunk = max(1, int(pdf_pages_per_chunk))
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=self._context,
+                    initializer=_limit_memory,
+                    initargs=(self.memory_limit,),
+                    max_tasks_per_child=MAX_TASKS_PER_CHILD
+                )
+            return self._executor
+
+    def _reset(self, executor, terminate=False):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if terminate:
+            for process in list((getattr(executor, '_processes', None) or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, args, timeout):
+        """Submit a job with its worker-side timeout; returns (executor, future)."""
+        executor = self._get_executor()
+        return executor, executor.submit(_run_with_timeout, timeout, fn, *args)
+
+    def _wait(self, executor, future, timeout, name):
+        """
+        Wait for a job. The worker enforces the timeout itself; the pool is
+        only terminated if a job has been running for well past it, which
+        means it is stuck where the alarm cannot interrupt it.
+        """
+        if not timeout:
+            return future.result()
+        # A future reports running once handed to the worker queue, which
+        # may be up to one job before it actually starts
+        hard_timeout = 2 * timeout + HARD_TIMEOUT_GRACE
+        started = None
+        # Poll with wait(): the worker's ExtractionTimeout is itself a
+        # TimeoutError, so it cannot be told apart from result() timing out
+        while not wait([future], timeout=WAIT_INTERVAL).done:
+            if started is None:
+                if future.running():
+                    started = time.monotonic()
+            elif time.monotonic() - started > hard_timeout:
+                logger.warning(f"{name} ignored its {timeout}s timeout; restarting the extraction pool")
+                self._reset(executor, terminate=True)
+                raise ExtractionTimeout(f"Extraction took longer than {timeout} seconds")
+        return future.result()
+
+    def run(self, fn, *args, timeout=None):
+        """
+        Run a module-level function in a worker process and wait for it.
+
+        Args:
+            fn: Picklable function to run
+            *args: Picklable arguments
+            timeout: Seconds the job may run once started; defaults to the
+                     pool's timeout
+
+        Returns:
+            The function's return value
+
+        Raises:
+            ExtractionTimeout: If the job exceeds its timeout
+            MemoryError: If the worker hit its memory limit
+        """
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(2):
+            executor, future = self._submit(fn, args, timeout)
+            try:
+                return self._wait(executor, future, timeout, fn.__name__)
+            except (BrokenProcessPool, CancelledError):
+                self._reset(executor)
+                if attempt:
+                    raise
+                logger.warning("Text extraction pool was restarted; retrying on a new pool")
+
+    def _result(self, job, fn, args, timeout):
+        """
+        Wait for one job of a multi-job extraction, retrying it on a new
+        pool if a restart caused by another job broke or cancelled it.
+        """
+        executor, future = job
+        try:
+            return self._wait(executor, future, timeout, fn.__name__)
+        except (BrokenProcessPool, CancelledError):
+            self._reset(executor)
+            logger.warning("Text extraction pool was restarted; retrying on a new pool")
+            return self.run(fn, *args, timeout=timeout)
+
+    def map(self, fn, args_list, timeout=None):
+        """
+        Run a module-level function over several argument tuples in
+        parallel worker processes.
+
+        Args:
+            fn: Picklable function to run
+            args_list: Iterable of picklable argument tuples
+            timeout: Seconds each job may run once started; defaults to the
+                     pool's timeout
+
+        Returns:
+            List of return values in the order of ``args_list``
+
+        Raises:
+            ExtractionTimeout: If a job exceeds its timeout
+            MemoryError: If a worker hit its memory limit
+        """
+        timeout = self.timeout if timeout is None else timeout
+        jobs = [(self._submit(fn, args, timeout), args) for args in args_list]
+        try:
+            return [self._result(job, fn, args, timeout) for job, args in jobs]
+        finally:
+            for (_, future), _ in jobs:
+                future.cancel()
+
+    def extract_pdf(self, source, max_pages=None, max_chars=None, pages_per_chunk=None):
+        """
+        Extract a PDF's text layer with page chunks parsed in parallel.
+
+        The first job opens the document and extracts the first chunk;
+        further chunks are submitted in a window of one per worker and
+        collected in page order, stopping as soon as ``max_chars``
+        characters have been collected.
+
+        Args:
+            source: PDF bytes or the path of a PDF file
+            max_pages: Maximum number of pages to read; 0 reads all.
+                Defaults to the pool's ``pdf_max_pages``
+            max_chars: Maximum number of characters to return; 0 is
+                unlimited. Defaults to the pool's ``pdf_max_chars``
+            pages_per_chunk: Pages extracted per job. Defaults to the
+                pool's ``pdf_pages_per_chunk``
+
+        Returns:
+            Dictionary with the extracted ``text``, the document's total
+            ``pages``, the number of ``pages_read`` and whether the result
+            was ``truncated`` by a cap
+        """
+        if isinstance(source, bytes):
+            # Hand workers a path instead of pickling the document per chunk
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+                temp_file.write(source)
+            try:
+                return self.extract_pdf(temp_file.name, max_pages, max_chars, pages_per_chunk)
+            finally:
+                os.unlink(temp_file.name)
+
+        max_pages = self.pdf_max_pages if max_pages is None else max_pages
+        max_chars = self.pdf_max_chars if max_chars is None else max_chars
+        pages_per_chunk = max(1, int(pages_per_chunk or self.pdf_pages_per_chunk))
+        first_args = (source, min(pages_per_chunk, max_pages or pages_per_chunk))
+        total_pages, page_texts = self._result(
+            self._submit(pdf_first_pages, first_args, self.timeout), pdf_first_pages, first_args, self.timeout
+        )
+        last_page = min(total_pages, max_pages) if max_pages else total_pages
+        del page_texts[last_page:]
+        collected = sum(len(text) for text in page_texts)
+
+        starts = iter(range(pages_per_chunk, last_page, pages_per_chunk))
+        window = deque()
+
+        def fill():
+            while len(window) < self.processes:
+                start = next(starts, None)
+                if start is None:
+                    return
+                args = (source, start, min(start + pages_per_chunk, last_page))
+                window.append((self._submit(pdf_page_range, args, self.timeout), args))
+
+        try:
+            if not max_chars or collected < max_chars:
+                fill()
+            while window:
+                job, args = window.popleft()
+                chunk_texts = self._result(job, pdf_page_range, args, self.timeout)
+                page_texts.extend(chunk_texts)
+                collected += sum(len(text) for text in chunk_texts)
+                if max_chars and collected >= max_chars:
+                    break
+                fill()
+        finally:
+            for (_, future), _ in window:
+                future.cancel()
+
+        text = "\n".join(page_text for page_text in page_texts if page_text)
+        truncated = len(page_texts) < total_pages
+        if max_chars and len(text) > max_chars:
+            text = text[:max_chars]
+            truncated = True
+        return {
+            'text': text,
+            'pages': total_pages,
+            'pages_read': len(page_texts),
+            'truncated': truncated
+        }
+
+    def extract_pdf_text(self, file_path):
+        """
+        Extract the text layer of a PDF file within the configured caps,
+        noting in the text when the document was cut short.
+        """
+        result = self.extract_pdf(file_path)
+        text = result['text']
+        if result['truncated'] and text.strip():
+            text += f"\n[Text truncated: read {result['pages_read']} of {result['pages']} pages.]"
+        return text
+
+    def extract_docx_text(self, file_path):
+        """Extract the paragraphs of a DOCX file in a worker process."""
+        return self.run(docx_text_from_path, file_path)
+
+
+# Singleton instance
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+
+def get_extraction_pool():
+    """Get the singleton text extraction pool."""
+    global _extraction_pool
+    if _extraction_pool is None:
+        with _extraction_pool_lock:
+            if _extraction_pool is None:
+                processes = DEFAULT_PROCESSES
+                timeout = DEFAULT_TIMEOUT
+                memory_limit = DEFAULT_MEMORY_LIMIT
+                max_pages = DEFAULT_PDF_MAX_PAGES
+                max_chars = DEFAULT_PDF_MAX_CHARS
+                pages_per_chunk = DEFAULT_PDF_PAGES_PER_CHUNK
+                if has_app_context():
+                    processes = current_app.config.get('EXTRACTION_PROCESSES', processes)
+                    timeout = current_app.config.get('EXTRACTION_TIMEOUT', timeout)
+                    memory_limit = current_app.config.get('EXTRACTION_MEMORY_LIMIT', memory_limit)
+                    max_pages = current_app.config.get('PDF_MAX_PAGES', max_pages)
+                    max_chars = current_app.config.get('PDF_MAX_CHARS', max_chars)
+                    pages_per_chunk = current_app.config.get('PDF_PAGES_PER_CHUNK', pages_per_chunk)
+                _extraction_pool = TextExtractionPool(processes, timeout, memory_limit,
+                                                      max_pages, max_chars, pages_per_chunk)
+    return _extraction_pool
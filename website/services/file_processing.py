@@ -5,9 +5,11 @@ Handles PDF text extraction and file processing.
 """
 
 import os
-import io
 import logging
 import tempfile
+from .extraction_pool import (
+    ExtractionTimeout, get_extraction_pool, docx_text_from_bytes
+)
 
 logger = logging.getLogger(__name__)
 
@@ -15,11 +17,42 @@ logger = logging.getLogger(__name__)
 class FileProcessingService:
     """Service class for file processing functionality."""
     
+    @staticmethod
+    def _read_content(file_content):
+        """Get the bytes of file content given as bytes or a file-like object."""
+        if isinstance(file_content, bytes):
+            return file_content
+        return file_content.read()
+    
+    @staticmethod
+    def extract_pdf(file_content):
+        """
+        Extract the text layer of PDF file content with page details.
+        
+        Page chunks are parsed in parallel in the text extraction process
+        pool, up to the configured page and character caps.
+        
+        Args:
+            file_content: The PDF file bytes or file-like object
+            
+        Returns:
+            Dictionary with ``text``, ``pages``, ``pages_read`` and ``truncated``
+            
+        Raises:
+            ExtractionTimeout: If a page chunk takes too long to parse
+            MemoryError: If a worker hits its memory limit
+        """
+        data = FileProcessingService._read_content(file_content)
+        return get_extraction_pool().extract_pdf(data)
+    
     @staticmethod
     def extract_pdf_text(file_content):
         """
         Extract text from PDF file content.
         
+        Parsing runs in the text extraction process pool, so a large PDF
+        does not hold the GIL of the request thread.
+        
         Args:
             file_content: The PDF file bytes or file-like object
             
@@ -29,26 +62,19 @@ class FileProcessingService:
             If failure, result is the error message
         """
         try:
-            from PyPDF2 import PdfReader
-            
-            if isinstance(file_content, bytes):
-                file_like = io.BytesIO(file_content)
-            else:
-                file_like = file_content
-            
-            pdf_reader = PdfReader(file_like)
-            extracted_text = ""
-            
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    extracted_text += page_text + "\n"
+            extracted_text = FileProcessingService.extract_pdf(file_content)['text']
             
             if not extracted_text.strip():
                 return False, "Could not extract text from PDF. The PDF may be image-based."
             
             return True, extracted_text.strip()
             
+        except ExtractionTimeout:
+            logger.error("PDF text extraction timed out")
+            return False, "Error processing PDF: the file took too long to process."
+        except MemoryError:
+            logger.error("PDF text extraction ran out of memory")
+            return False, "Error processing PDF: the file is too large to process."
         except Exception as e:
             logger.error(f"Error extracting PDF text: {str(e)}")
             return False, f"Error processing PDF: {str(e)}"
@@ -58,6 +84,8 @@ class FileProcessingService:
         """
         Extract text from DOCX file content.
         
+        Parsing runs in the text extraction process pool.
+        
         Args:
             file_content: The DOCX file bytes
             
@@ -65,21 +93,20 @@ class FileProcessingService:
             Tuple of (success: bool, result: str)
         """
         try:
-            import docx
-            
-            if isinstance(file_content, bytes):
-                file_like = io.BytesIO(file_content)
-            else:
-                file_like = file_content
-            
-            doc = docx.Document(file_like)
-            extracted_text = "\n".join([para.text for para in doc.paragraphs])
+            data = FileProcessingService._read_content(file_content)
+            extracted_text = get_extraction_pool().run(docx_text_from_bytes, data)
             
             if not extracted_text.strip():
                 return False, "Could not extract text from document."
             
             return True, extracted_text.strip()
             
+        except ExtractionTimeout:
+            logger.error("DOCX text extraction timed out")
+            return False, "Error processing document: the file took too long to process."
+        except MemoryError:
+            logger.error("DOCX text extraction ran out of memory")
+            return False, "Error processing document: the file is too large to process."
         except Exception as e:
             logger.error(f"Error extracting DOCX text: {str(e)}")
             return False, f"Error processing document: {str(e)}"
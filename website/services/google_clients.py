@@ -0,0 +1,208 @@
+# website/services/google_clients.py
+"""
+Google API Client Cache for the AIGrader application.
+Keeps each user's parsed OAuth credentials and the Google API service
+objects built from them, so a Classroom import or page view does not
+re-parse tokens and re-load discovery documents for every call.
+"""
+
+import json
+import logging
+import threading
+from cachetools import TTLCache
+from flask import current_app, has_app_context
+import google.auth.transport.requests
+import google.oauth2.credentials
+import googleapiclient.discovery
+import googleapiclient.discovery_cache
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_CREDENTIALS_TTL = 3600  # 1 hour
+CREDENTIALS_CACHE_MAX_USERS = 1024
+
+# Token fields needed to refresh an expired access token
+REQUIRED_TOKEN_FIELDS = ['refresh_token', 'token_uri', 'client_id', 'client_secret']
+
+
+class GoogleClientCache:
+    """
+    Per-user Google credentials and per-thread API service cache.
+
+    Credentials are cached per user and keyed on the stored token JSON, so
+    reconnecting an account replaces them; an expired access token is
+    refreshed and saved once, under a per-user lock. Discovery documents
+    are the static copies bundled with google-api-python-client, parsed
+    once per process. The HTTP transport of a service object is not
+    thread-safe, so services are cached per thread and reused for as long
+    as the thread keeps asking with the same credentials.
+    """
+
+    def __init__(self, ttl=DEFAULT_CREDENTIALS_TTL):
+        """
+        Initialize the client cache.
+
+        Args:
+            ttl: Seconds a user's parsed credentials are kept
+        """
+        self._credentials = TTLCache(maxsize=CREDENTIALS_CACHE_MAX_USERS, ttl=max(1, int(ttl)))
+        self._documents = {}
+        self._lock = threading.Lock()
+        self._user_locks = {}
+        self._local = threading.local()
+
+    def _user_lock(self, user_id):
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+    def credentials(self, user):
+        """
+        Get Google OAuth credentials for a user, refreshing and saving them
+        if the access token has expired.
+
+        Args:
+            user: The User whose ``google_tokens`` are used
+
+        Returns:
+            Credentials, or None if the tokens are missing or cannot be refreshed
+        """
+        from ..models import db
+
+        if not user.google_tokens:
+            logger.warning("No Google tokens found for user")
+            return None
+
+        with self._user_lock(user.id):
+            with self._lock:
+                cached = self._credentials.get(user.id)
+            if cached and cached[0] == user.google_tokens:
+                credentials = cached[1]
+            else:
+                credentials = self._parse(user.google_tokens)
+                if credentials is None:
+                    return None
+
+            try:
+                # Force refresh if token is expired
+                if not credentials.valid:
+                    logger.info("Token expired, attempting to refresh")
+                    credentials.refresh(google.auth.transport.requests.Request())
+
+                    # Update stored token
+                    user.google_tokens = json.dumps({
+                        'token': credentials.token,
+                        'refresh_token': credentials.refresh_token,
+                        'token_uri': credentials.token_uri,
+                        'client_id': credentials.client_id,
+                        'client_secret': credentials.client_secret,
+                        'scopes': credentials.scopes
+                    })
+                    db.session.commit()
+                    logger.info("Token refreshed successfully")
+            except Exception as e:
+                logger.error(f"Error refreshing credentials: {str(e)}")
+                self.invalidate(user.id)
+                return None
+
+            with self._lock:
+                self._credentials[user.id] = (user.google_tokens, credentials)
+            return credentials
+
+    @staticmethod
+    def _parse(google_tokens):
+        """Build credentials from stored token JSON, or None if it is unusable."""
+        try:
+            token_data = json.loads(google_tokens)
+        except ValueError as e:
+            logger.error(f"Error reading stored Google tokens: {e}")
+            return None
+
+        # Check if we have all required fields for refreshing
+        missing_fields = [field for field in REQUIRED_TOKEN_FIELDS if not token_data.get(field)]
+        if missing_fields:
+            logger.warning(f"Missing required fields for token refresh: {', '.join(missing_fields)}")
+            return None
+
+        return google.oauth2.credentials.Credentials(
+            token=token_data.get('token'),
+            refresh_token=token_data.get('refresh_token'),
+            token_uri=token_data.get('token_uri'),
+            client_id=token_data.get('client_id'),
+            client_secret=token_data.get('client_secret'),
+            scopes=token_data.get('scopes')
+        )
+
+    def invalidate(self, user_id):
+        """Drop the cached credentials of a user."""
+        with self._lock:
+            self._credentials.pop(user_id, None)
+
+    def document(self, api, version):
+        """
+        Get the parsed discovery document of an API.
+
+        The static copy bundled with the client library is used, falling
+        back to fetching it once if the library has none.
+        """
+        key = (api, version)
+        document = self._documents.get(key)
+        if document is None:
+            content = googleapiclient.discovery_cache.get_static_doc(api, version)
+            if content is None:
+                logger.info(f"No bundled discovery document for {api} {version}, fetching it")
+                content = googleapiclient.discovery.build(
+                    api, version, static_discovery=False, cache_discovery=False
+                )._rootDesc
+            document = json.loads(content) if isinstance(content, str) else content
+            with self._lock:
+                document = self._documents.setdefault(key, document)
+        return document
+
+    def service(self, api, version, credentials):
+        """
+        Get this thread's API service object for a set of credentials.
+
+        Args:
+            api: API name, e.g. ``'classroom'`` or ``'drive'``
+            version: API version, e.g. ``'v1'``
+            credentials: Google OAuth credentials
+
+        Returns:
+            A googleapiclient Resource
+        """
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = {}
+        cached = services.get((api, version))
+        if cached and cached[0] is credentials:
+            return cached[1]
+
+        service = googleapiclient.discovery.build_from_document(
+            self.document(api, version), credentials=credentials
+        )
+        services[(api, version)] = (credentials, service)
+        return service
+
+
+def google_service(api, version, credentials):
+    """Get a Google API service object from the shared client cache."""
+    return get_google_clients().service(api, version, credentials)
+
+
+# Singleton instance
+_google_clients = None
+_google_clients_lock = threading.Lock()
+
+
+def get_google_clients():
+    """Get the singleton Google API client cache."""
+    global _google_clients
+    if _google_clients is None:
+        with _google_clients_lock:
+            if _google_clients is None:
+                ttl = DEFAULT_CREDENTIALS_TTL
+                if has_app_context():
+                    ttl = current_app.config.get('GOOGLE_CREDENTIALS_TTL', ttl)
+                _google_clients = GoogleClientCache(ttl)
+    return _google_clients
@@ -0,0 +1,234 @@
+# website/services/grading_cache.py
+"""
+Grading Result Cache for the AIGrader application.
+Stores AI grading results keyed on a content hash so identical prompts are
+not re-sent to the model.
+"""
+
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_TTL = 30 * 24 * 3600  # 30 days
+DEFAULT_MAX_ENTRIES = 50000
+EVICTION_INTERVAL = 100  # Run eviction every N writes
+
+
+class GradingCache:
+    """
+    Persistent grading cache backed by the ``grading_cache`` table.
+
+    Entries expire after ``ttl`` seconds, and once the table grows past
+    ``max_entries`` the least recently used entries are evicted. Hit and
+    miss counters are kept per process.
+
+    Every lookup and store runs in its own short transaction on a separate
+    connection, so the cache never commits or expires objects in the
+    caller's session (e.g. a job runner's batched writes).
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, enabled=True):
+        """
+        Initialize the grading cache.
+
+        Args:
+            ttl: Time-to-live for entries in seconds
+            max_entries: Maximum number of entries to keep
+            enabled: Whether the cache is consulted at all
+        """
+        self.ttl = int(ttl)
+        self.max_entries = int(max_entries)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_answer(student_answer):
+        """Normalize whitespace so trivially different answers share a key."""
+        return " ".join((student_answer or "").split())
+
+    @classmethod
+    def make_key(cls, prompt_fingerprint, student_answer):
+        """
+        Build the cache key for a grading request.
+
+        Args:
+            prompt_fingerprint: Hash of the question, rubric, model and
+                                prompt version (see CompiledPrompt)
+            student_answer: The student's answer
+
+        Returns:
+            SHA-256 hex digest string
+        """
+        material = f"{prompt_fingerprint}\n{cls.normalize_answer(student_answer)}"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _table():
+        from ..models import GradingCacheEntry
+        return GradingCacheEntry.__table__
+
+    @staticmethod
+    def _connect():
+        """Open a short transaction on its own connection, leaving the caller's session alone."""
+        from ..models import db
+        return db.engine.begin()
+
+    def get(self, key):
+        """
+        Look up a cached grading result.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cached result dictionary, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        from sqlalchemy import delete, func, select, update
+
+        table = self._table()
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    select(table.c.result, table.c.created_at).where(table.c.key == key)
+                ).first()
+                if row is None:
+                    self._count(False)
+                    return None
+
+                now = datetime.utcnow()
+                if row.created_at and row.created_at < now - timedelta(seconds=self.ttl):
+                    connection.execute(delete(table).where(table.c.key == key))
+                    self._count(False)
+                    return None
+
+                connection.execute(update(table).where(table.c.key == key).values(
+                    hit_count=func.coalesce(table.c.hit_count, 0) + 1,
+                    last_used_at=now
+                ))
+            self._count(True)
+            return json.loads(row.result)
+        except Exception as e:
+            logger.warning(f"Grading cache lookup failed: {e}")
+            self._count(False)
+            return None
+
+    def set(self, key, result, model_name=None):
+        """
+        Store a grading result.
+
+        Args:
+            key: The cache key
+            result: The grading result dictionary
+            model_name: Optional model name for bookkeeping
+        """
+        if not self.enabled:
+            return
+
+        from sqlalchemy import insert, update
+
+        table = self._table()
+        try:
+            now = datetime.utcnow()
+            values = {
+                'model_name': model_name,
+                'result': json.dumps(result),
+                'created_at': now,
+                'last_used_at': now
+            }
+            with self._connect() as connection:
+                updated = connection.execute(update(table).where(table.c.key == key).values(**values))
+                if not updated.rowcount:
+                    connection.execute(insert(table).values(key=key, hit_count=0, **values))
+        except Exception as e:
+            logger.warning(f"Grading cache store failed: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            run_eviction = self._writes % EVICTION_INTERVAL == 0
+        if run_eviction:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries and trim the cache to ``max_entries``.
+
+        Returns:
+            Number of entries removed
+        """
+        from sqlalchemy import delete, func, select
+
+        table = self._table()
+        try:
+            with self._connect() as connection:
+                cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+                removed = connection.execute(delete(table).where(table.c.created_at < cutoff)).rowcount
+
+                overflow = connection.execute(select(func.count()).select_from(table)).scalar() - self.max_entries
+                if overflow > 0:
+                    stale_keys = connection.execute(
+                        select(table.c.key).order_by(table.c.last_used_at.asc()).limit(overflow)
+                    ).scalars().all()
+                    removed += connection.execute(delete(table).where(table.c.key.in_(stale_keys))).rowcount
+
+            if removed:
+                logger.info(f"Evicted {removed} grading cache entries")
+            return removed
+        except Exception as e:
+            logger.warning(f"Grading cache eviction failed: {e}")
+            return 0
+
+    def stats(self):
+        """Get cache counters for monitoring."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else 0,
+            'ttl': self.ttl,
+            'max_entries': self.max_entries
+        }
+
+
+# Singleton instance
+_grading_cache = None
+_grading_cache_lock = threading.Lock()
+
+
+def get_grading_cache():
+    """Get the singleton grading cache instance."""
+    global _grading_cache
+    if _grading_cache is None:
+        with _grading_cache_lock:
+            if _grading_cache is None:
+                ttl = DEFAULT_TTL
+                max_entries = DEFAULT_MAX_ENTRIES
+                enabled = True
+                if has_app_context():
+                    ttl = current_app.config.get('GRADING_CACHE_TTL', ttl)
+                    max_entries = current_app.config.get('GRADING_CACHE_MAX_ENTRIES', max_entries)
+                    enabled = current_app.config.get('GRADING_CACHE_ENABLED', enabled)
+                _grading_cache = GradingCache(ttl, max_entries, enabled)
+    return _grading_cache
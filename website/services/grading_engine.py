@@ -0,0 +1,133 @@
+# website/services/grading_engine.py
+"""
+Batch Grading Engine for the AIGrader application.
+Fans grading work out to a bounded pool of concurrent inference calls.
+"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import current_app, has_app_context
+from .event_loop import get_background_loop
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_POOL_SIZE = 8
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_ASYNC_POOL_SIZE = 32
+
+
+class BatchGradingEngine:
+    """
+    Runs grading calls concurrently on a process-wide worker pool.
+
+    The shared executor is sized to the global concurrency cap, so all jobs
+    in the process together never have more than ``max_concurrency`` calls
+    in flight. Each job additionally keeps at most ``pool_size`` of its own
+    calls queued, which stops one large class from starving the others.
+
+    Coroutine grading functions are scheduled on the shared background event
+    loop instead of the thread pool; their global cap is enforced by the
+    async grading service.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 backend='thread', async_pool_size=DEFAULT_ASYNC_POOL_SIZE):
+        """
+        Initialize the grading engine.
+
+        Args:
+            pool_size: Maximum number of in-flight calls per job
+            max_concurrency: Maximum number of in-flight calls across all jobs
+            backend: Preferred inference backend, 'thread' or 'async'
+            async_pool_size: Maximum number of in-flight coroutines per job
+        """
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.pool_size = max(1, min(int(pool_size), self.max_concurrency))
+        self.backend = backend
+        self.async_pool_size = max(1, int(async_pool_size))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix='grading-worker'
+        )
+
+    @property
+    def use_async(self):
+        """Whether callers should pass coroutine grading functions."""
+        return self.backend == 'async'
+
+    def run(self, tasks, grade_fn, pool_size=None):
+        """
+        Grade tasks concurrently, yielding results as they complete.
+
+        Results are yielded in the calling thread, so callers can safely
+        update the database session between calls.
+
+        Args:
+            tasks: Iterable of (key, payload) tuples
+            grade_fn: Callable or coroutine function taking a payload and
+                      returning a result
+            pool_size: Optional per-job override of the in-flight window
+
+        Yields:
+            Tuples of (key, result, error) where exactly one of result
+            and error is set
+        """
+        is_async = asyncio.iscoroutinefunction(grade_fn)
+        if is_async:
+            window = max(1, pool_size or self.async_pool_size)
+        else:
+            window = max(1, min(pool_size or self.pool_size, self.max_concurrency))
+        pending_tasks = deque(tasks)
+        in_flight = {}
+
+        while pending_tasks or in_flight:
+            # Top up the window for this job
+            while pending_tasks and len(in_flight) < window:
+                key, payload = pending_tasks.popleft()
+                if is_async:
+                    future = get_background_loop().submit(grade_fn(payload))
+                else:
+                    future = self._executor.submit(grade_fn, payload)
+                in_flight[future] = key
+
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                error = future.exception()
+                if error is not None:
+                    logger.error(f"Error grading task {key}: {error}")
+                    yield key, None, error
+                else:
+                    yield key, future.result(), None
+
+    def shutdown(self, wait_for_tasks=True):
+        """Shut down the worker pool."""
+        self._executor.shutdown(wait=wait_for_tasks)
+
+
+# Singleton instance shared by all jobs in the process
+_grading_engine = None
+_grading_engine_lock = threading.Lock()
+
+
+def get_grading_engine():
+    """Get the singleton batch grading engine instance."""
+    global _grading_engine
+    if _grading_engine is None:
+        with _grading_engine_lock:
+            if _grading_engine is None:
+                pool_size = DEFAULT_POOL_SIZE
+                max_concurrency = DEFAULT_MAX_CONCURRENCY
+                backend = 'thread'
+                async_pool_size = DEFAULT_ASYNC_POOL_SIZE
+                if has_app_context():
+                    pool_size = current_app.config.get('GRADING_POOL_SIZE', pool_size)
+                    max_concurrency = current_app.config.get('GRADING_MAX_CONCURRENCY', max_concurrency)
+                    backend = current_app.config.get('GRADING_BACKEND', backend)
+                    async_pool_size = current_app.config.get('GRADING_ASYNC_POOL_SIZE', async_pool_size)
+                _grading_engine = BatchGradingEngine(pool_size, max_concurrency, backend, async_pool_size)
+    return _grading_engine
@@ -0,0 +1,618 @@
+# website/services/grading_pipeline.py
+"""
+Grading Pipeline for the AIGrader application.
+Single place where grading prompts are built and model responses are parsed.
+"""
+
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from flask import current_app, has_app_context
+from ..utils.helpers import extract_grade, extract_section
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the prompt template changes so cached results are not reused
+PROMPT_VERSION = "pipeline-v2"
+
+# Generation settings shared by every grading call
+MAX_TOKENS = 2000
+TEMPERATURE = 0.7
+
+DEFAULT_SCHOOL_LEVEL = "High School"
+
+# Packing: several short answers graded in one model call
+DEFAULT_PACK_SIZE = 10
+DEFAULT_PACK_MAX_CHARS = 500  # Only answers up to this length are packed
+PACKED_TOKENS_PER_ANSWER = 400
+PACKED_MAX_TOKENS = 8000
+PACK_RETRIES = 1  # Times a throttled or failed packed call is re-sent as a unit
+
+# Keys every grading result carries
+RESULT_KEYS = ['feedback', 'grade', 'summary', 'glow', 'grow', 'think_about_it', 'rubric']
+
+# Set on results salvaged from a response that was not the expected JSON
+FALLBACK_FLAG = 'parse_fallback'
+
+# Static part of the prompt, rendered once per job. The student answer is
+# appended last so the shared prefix is identical for every submission.
+PROMPT_HEADER = """You are an AI teaching assistant. Grade the student answer below based on the provided rubric.
+
+Question: {question}
+
+Rubric Criteria for {school_level} Level:
+{criteria}
+
+Provide detailed feedback and a numerical grade between 0-100.
+Format your response as a JSON object with the following keys:
+- feedback: [detailed feedback]
+- grade: [numerical grade as a string in format "X/100"]
+- summary: [brief summary of the feedback]
+- glow: [what the student did well]
+- grow: [areas for improvement]
+- think_about_it: [questions to ponder for improvement]
+- rubric: [detailed rubric breakdown with scores and explanations]
+
+IMPORTANT GRADING INSTRUCTIONS:
+1. If the student's answer is completely unrelated to the question, assign 0 marks and provide appropriate feedback.
+2. If the content appears to be AI-generated, deduct marks appropriately and mention this concern in your feedback.
+3. Return ONLY the JSON object with no markdown formatting, no backticks, and no code blocks.
+
+Your entire response must be a valid JSON object that can be directly parsed.
+
+Student Answer:
+"""
+
+# Static part of a packed prompt grading several answers in one call
+PACKED_PROMPT_HEADER = """You are an AI teaching assistant. Grade each of the student answers below based on the provided rubric.
+Grade every answer independently; do not compare students with each other.
+
+Question: {question}
+
+Rubric Criteria for {school_level} Level:
+{criteria}
+
+For EACH answer provide brief feedback and a numerical grade between 0-100.
+Format your response as a JSON array with one object per answer, in the same order, each with the following keys:
+- id: [the answer id exactly as given]
+- feedback: [concise feedback]
+- grade: [numerical grade as a string in format "X/100"]
+- summary: [one-sentence summary of the feedback]
+- glow: [what the student did well]
+- grow: [areas for improvement]
+- think_about_it: [a question to ponder for improvement]
+- rubric: [short rubric breakdown with scores]
+
+IMPORTANT GRADING INSTRUCTIONS:
+1. If a student's answer is completely unrelated to the question, assign 0 marks and provide appropriate feedback.
+2. If the content appears to be AI-generated, deduct marks appropriately and mention this concern in your feedback.
+3. Return ONLY the JSON array with no markdown formatting, no backticks, and no code blocks.
+
+Your entire response must be a valid JSON array that can be directly parsed.
+
+Student Answers:
+"""
+
+
+class CompiledPrompt:
+    """
+    The question and rubric portion of a grading prompt, built once.
+
+    Serializing the rubric and hashing the static inputs happens here, so
+    grading a submission only appends its answer to a prebuilt string.
+    """
+
+    def __init__(self, question, rubric_criteria=None, school_level=DEFAULT_SCHOOL_LEVEL,
+                 model_name=None, prompt_version=PROMPT_VERSION):
+        """
+        Compile the static part of a grading prompt.
+
+        Args:
+            question: The assignment question
+            rubric_criteria: Rubric criteria (any JSON-serializable value)
+            school_level: The school level for age-appropriate feedback
+            model_name: The model the prompt will be sent to
+            prompt_version: Version of the prompt template
+        """
+        self.question = question or ""
+        self.school_level = school_level or DEFAULT_SCHOOL_LEVEL
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+
+        criteria_json = json.dumps(rubric_criteria, indent=2, sort_keys=True) if rubric_criteria else None
+        self._criteria_text = criteria_json or "No specific rubric provided"
+        self._packed_prefix = None
+        self.prefix = PROMPT_HEADER.format(
+            question=self.question,
+            school_level=self.school_level,
+            criteria=self._criteria_text
+        )
+        self.fingerprint = hashlib.sha256(json.dumps(
+            [self.question, self.school_level, criteria_json, model_name, prompt_version],
+            ensure_ascii=False
+        ).encode('utf-8')).hexdigest()
+
+    def render(self, student_answer):
+        """Build the full grading prompt for one student answer."""
+        return self.prefix + (student_answer or "")
+
+    def render_packed(self, student_answers):
+        """
+        Build one prompt grading several student answers.
+
+        Args:
+            student_answers: List of answers; answer ``i`` is given id ``i + 1``
+
+        Returns:
+            Formatted prompt string
+        """
+        if self._packed_prefix is None:
+            self._packed_prefix = PACKED_PROMPT_HEADER.format(
+                question=self.question,
+                school_level=self.school_level,
+                criteria=self._criteria_text
+            )
+        parts = [self._packed_prefix]
+        for index, student_answer in enumerate(student_answers, start=1):
+            parts.append(f"\n[id: {index}]\n{student_answer or ''}\n")
+        return "".join(parts)
+
+    def cache_key(self, student_answer, packed=False):
+        """
+        Build the grading cache key for one student answer.
+
+        Packed results use the shorter packed prompt, so they are kept
+        under their own key and never served for a single grading call.
+        """
+        from .grading_cache import GradingCache
+        fingerprint = f"{self.fingerprint}:packed" if packed else self.fingerprint
+        return GradingCache.make_key(fingerprint, student_answer)
+
+
+def _strip_code_fences(response_text):
+    """Remove markdown code fences and backticks around a JSON response."""
+    return re.sub(r'```json\s*|\s*```|`', '', (response_text or '').strip())
+
+
+def parse_grading_response(response_text):
+    """
+    Parse a raw model response into a grading result dictionary.
+
+    Only a JSON object in the response is trusted. Anything else is
+    salvaged into a result flagged with ``FALLBACK_FLAG`` (its grade may
+    be made up), which callers must not cache.
+
+    Args:
+        response_text: The raw model response
+
+    Returns:
+        Dictionary with every key in ``RESULT_KEYS``
+    """
+    cleaned = _strip_code_fences(response_text)
+    start, end = cleaned.find('{'), cleaned.rfind('}')
+    try:
+        if start == -1 or end <= start:
+            raise ValueError("Grading response contains no JSON object")
+        result = json.loads(cleaned[start:end + 1])
+        if not isinstance(result, dict):
+            raise ValueError("Grading response is not a JSON object")
+    except ValueError:
+        extracted = extract_grade(response_text)
+        result = {
+            'feedback': response_text,
+            'grade': extracted if extracted is not None else "70/100",
+            'summary': "AI provided feedback but not in the expected format.",
+            'glow': extract_section(response_text, "glow", "positive points", "strengths"),
+            'grow': extract_section(response_text, "grow", "improve", "weaknesses"),
+            'think_about_it': extract_section(response_text, "think", "consider", "reflect"),
+            'rubric': {"Overall": "See feedback for assessment details."},
+            FALLBACK_FLAG: True
+        }
+
+    return _normalize_result(result)
+
+
+def _normalize_result(result):
+    """Format the grade and fill in any missing result keys."""
+    # Ensure grade is properly formatted
+    grade = result.get('grade')
+    if isinstance(grade, (int, float)):
+        result['grade'] = f"{grade:g}/100"
+    elif isinstance(grade, str) and '/' not in grade:
+        extracted = extract_grade(grade)
+        result['grade'] = f"{extracted:g}/100" if extracted is not None else f"{grade}/100"
+
+    # Ensure all expected keys are present
+    for key in RESULT_KEYS:
+        if key not in result:
+            if key == 'rubric':
+                result[key] = {"Overall": "Assessment included in general feedback."}
+            else:
+                result[key] = "Not provided in AI response."
+
+    return result
+
+
+def parse_packed_response(response_text, count):
+    """
+    Parse a packed model response into per-answer grading results.
+
+    Args:
+        response_text: The raw model response
+        count: Number of answers in the packed prompt
+
+    Returns:
+        Dictionary mapping answer index (0-based) to a grading result.
+        Answers missing from the response are left out so callers can
+        regrade them individually.
+
+    Raises:
+        ValueError: If the response is not a JSON array of results
+    """
+    cleaned = _strip_code_fences(response_text)
+    start, end = cleaned.find('['), cleaned.rfind(']')
+    if start == -1 or end <= start:
+        raise ValueError("Packed grading response contains no JSON array")
+    try:
+        entries = json.loads(cleaned[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Packed grading response is not valid JSON: {e}")
+
+    results = {}
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(str(entry.pop('id', position + 1)).strip()) - 1
+        except ValueError:
+            continue
+        if 0 <= index < count and index not in results:
+            results[index] = _normalize_result(entry)
+    if not results:
+        raise ValueError("Packed grading response contains no usable results")
+    return results
+
+
+def numeric_grade(result, default=None):
+    """
+    Convert the grade in a grading result to a number.
+
+    Args:
+        result: Grading result dictionary
+        default: Value returned when the result carries no numeric grade
+
+    Returns:
+        Float grade value, or ``default``
+    """
+    grade = result.get('grade')
+    try:
+        if isinstance(grade, (int, float)):
+            return float(grade)
+        if isinstance(grade, str) and grade:
+            return float(grade.split('/')[0])
+    except ValueError:
+        pass
+    return default
+
+
+def error_result(error):
+    """Result returned to API callers when grading fails."""
+    return {
+        'feedback': f"Unable to grade submission: {str(error)}",
+        'grade': "Error",
+        'summary': "Grading failed due to an error.",
+        'glow': "",
+        'grow': "",
+        'think_about_it': "",
+        'rubric': {}
+    }
+
+
+def is_error_result(result):
+    """Whether a result came from ``error_result`` and must not be cached."""
+    return result.get('grade') == "Error"
+
+
+def is_fallback_result(result):
+    """Whether a result was salvaged from an unparseable response and must not be cached."""
+    return bool(result.get(FALLBACK_FLAG))
+
+
+def is_usable_result(result):
+    """
+    Whether a result carries a grade the model actually gave, so it may be
+    saved to a submission or stored in the grading cache.
+    """
+    return (not is_error_result(result) and not is_fallback_result(result)
+            and numeric_grade(result) is not None)
+
+
+def is_cacheable_result(result):
+    """Whether a result may be stored in the grading cache."""
+    return is_usable_result(result)
+
+
+def failure_message(result):
+    """Explain why a result that is not usable was not saved."""
+    if is_error_result(result):
+        return result['feedback']
+    return "The AI response did not contain a usable grade, so no grade was saved."
+
+
+class UnusableResultError(ValueError):
+    """Yielded by the pipeline for a response that holds no usable grade."""
+
+
+class GradingPipeline:
+    """
+    Grades batches of submissions: cache lookup, prompt rendering,
+    concurrent inference on the grading engine, parsing and cache writes.
+
+    With packing enabled, short answers sharing a compiled prompt are graded
+    ``pack_size`` at a time in a single model call. Answers the packed
+    response does not cover, or gives no usable grade, are regraded one
+    by one. A packed call that
+    fails with a retryable error (e.g. throttling) is re-sent as a unit
+    after a backoff instead of being fanned out into single calls.
+    """
+
+    def __init__(self, model_name, prompt_version=PROMPT_VERSION, packing_enabled=False,
+                 pack_size=DEFAULT_PACK_SIZE, pack_max_chars=DEFAULT_PACK_MAX_CHARS):
+        """
+        Initialize the grading pipeline.
+
+        Args:
+            model_name: The model used for grading
+            prompt_version: Version of the prompt template
+            packing_enabled: Whether batches pack short answers by default
+            pack_size: Maximum number of answers per packed call
+            pack_max_chars: Longest answer (in characters) eligible for packing
+        """
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.packing_enabled = packing_enabled
+        self.pack_size = max(1, int(pack_size))
+        self.pack_max_chars = int(pack_max_chars)
+
+    def compile(self, question, rubric_criteria=None, school_level=DEFAULT_SCHOOL_LEVEL):
+        """
+        Compile the static part of a grading prompt.
+
+        Args:
+            question: The assignment question
+            rubric_criteria: Rubric criteria (any JSON-serializable value)
+            school_level: The school level for age-appropriate feedback
+
+        Returns:
+            CompiledPrompt instance
+        """
+        return CompiledPrompt(question, rubric_criteria, school_level, self.model_name, self.prompt_version)
+
+    def compile_for_rubric(self, question, rubric):
+        """Compile a prompt for an optional Rubric model instance."""
+        if rubric is None:
+            return self.compile(question)
+        return self.compile(question, rubric.get_criteria(), rubric.level)
+
+    @staticmethod
+    def complete(prompt, max_tokens=MAX_TOKENS):
+        """Send a grading prompt on the thread backend."""
+        from .ai_grading import get_ai_grading_service
+        return get_ai_grading_service().complete(prompt, max_tokens=max_tokens, temperature=TEMPERATURE)
+
+    @staticmethod
+    async def complete_async(prompt, max_tokens=MAX_TOKENS):
+        """Send a grading prompt over the shared async HTTP session."""
+        from .ai_grading import get_async_ai_grading_service
+        return await get_async_ai_grading_service().chat_completion(
+            prompt, max_tokens=max_tokens, temperature=TEMPERATURE
+        )
+
+    def stream(self, compiled, student_answer, bypass_cache=False):
+        """
+        Grade one submission, streaming the model output as it arrives.
+
+        Args:
+            compiled: CompiledPrompt for the assignment and rubric
+            student_answer: The student's answer
+            bypass_cache: Whether to skip the cache lookup
+
+        Yields:
+            ('delta', text) tuples while the model is generating, then a
+            single ('result', result) tuple with the parsed result. A cache
+            hit yields only the result.
+        """
+        from .ai_grading import get_ai_grading_service
+        from .grading_cache import get_grading_cache
+
+        cache = get_grading_cache()
+        cache_key = compiled.cache_key(student_answer)
+        cached = None if bypass_cache else cache.get(cache_key)
+        if cached is not None:
+            yield 'result', cached
+            return
+
+        chunks = []
+        for text in get_ai_grading_service().stream(compiled.render(student_answer)):
+            chunks.append(text)
+            yield 'delta', text
+
+        result = parse_grading_response("".join(chunks))
+        if is_cacheable_result(result):
+            cache.set(cache_key, result, self.model_name)
+        yield 'result', result
+
+    @classmethod
+    def _complete_request(cls, request):
+        return cls.complete(*request)
+
+    @classmethod
+    async def _complete_request_async(cls, request):
+        return await cls.complete_async(*request)
+
+    def _packable(self, student_answer):
+        """Whether an answer is short enough to be packed."""
+        return len(student_answer or '') <= self.pack_max_chars
+
+    def _pack(self, pending):
+        """
+        Split pending work into single and packed model requests.
+
+        Args:
+            pending: List of (key, compiled_prompt, student_answer) tuples
+
+        Returns:
+            List of (request_key, (prompt, max_tokens)) tuples where
+            request_key is ('single', key) or ('packed', [(key, compiled,
+            student_answer), ...])
+        """
+        requests = []
+        groups = {}
+        for item in pending:
+            key, compiled, student_answer = item
+            if self._packable(student_answer):
+                groups.setdefault(compiled.fingerprint, []).append(item)
+            else:
+                requests.append((('single', key), (compiled.render(student_answer), MAX_TOKENS)))
+
+        for group in groups.values():
+            for start in range(0, len(group), self.pack_size):
+                chunk = group[start:start + self.pack_size]
+                if len(chunk) == 1:
+                    key, compiled, student_answer = chunk[0]
+                    requests.append((('single', key), (compiled.render(student_answer), MAX_TOKENS)))
+                    continue
+                compiled = chunk[0][1]
+                prompt = compiled.render_packed([student_answer for _, _, student_answer in chunk])
+                max_tokens = min(PACKED_TOKENS_PER_ANSWER * len(chunk), PACKED_MAX_TOKENS)
+                requests.append((('packed', chunk), (prompt, max_tokens)))
+        return requests
+
+    def run(self, items, bypass_cache=False, pack=None):
+        """
+        Grade submissions, yielding results as they become available.
+
+        Cached results are yielded first; the rest are graded concurrently
+        on the shared grading engine. Results are yielded in the calling
+        thread, so callers may use the database session between results;
+        the cache uses its own connection and never commits that session.
+
+        Args:
+            items: Iterable of (key, compiled_prompt, student_answer) tuples
+            bypass_cache: Whether to skip cache lookups and force fresh grades
+            pack: Whether to pack short answers; defaults to ``packing_enabled``
+
+        Yields:
+            Tuples of (key, result, error) where exactly one of result
+            and error is set. A response without a usable grade is
+            yielded as an ``UnusableResultError``, never as a result.
+        """
+        from .grading_cache import get_grading_cache
+        from .grading_engine import get_grading_engine
+        from .rate_limiter import get_retry_policy, is_retryable, retry_after_from
+
+        cache = get_grading_cache()
+        engine = get_grading_engine()
+        if pack is None:
+            pack = self.packing_enabled
+        pack = pack and self.pack_size > 1
+        cache_keys = {}
+        pending = []
+
+        for key, compiled, student_answer in items:
+            cache_key = compiled.cache_key(student_answer)
+            cached = None
+            if not bypass_cache:
+                cached = cache.get(cache_key)
+                if cached is None and pack and self._packable(student_answer):
+                    cached = cache.get(compiled.cache_key(student_answer, packed=True))
+            if cached is not None:
+                yield key, cached, None
+                continue
+            cache_keys[key] = cache_key
+            pending.append((key, compiled, student_answer))
+
+        if pack:
+            requests = self._pack(pending)
+        else:
+            requests = [(('single', key), (compiled.render(student_answer), MAX_TOKENS))
+                        for key, compiled, student_answer in pending]
+
+        complete_fn = self._complete_request_async if engine.use_async else self._complete_request
+        packed_payloads = {id(target): payload for (kind, target), payload in requests if kind == 'packed'}
+        pack_attempts = {}
+        while requests:
+            retry = []
+            backoff = 0
+            for (kind, target), response_text, error in engine.run(requests, complete_fn):
+                if kind == 'single':
+                    if error is not None:
+                        yield target, None, error
+                        continue
+                    result = parse_grading_response(response_text)
+                    if not is_usable_result(result):
+                        yield target, None, UnusableResultError(failure_message(result))
+                        continue
+                    cache.set(cache_keys[target], result, self.model_name)
+                    yield target, result, None
+                    continue
+
+                if error is not None and is_retryable(error):
+                    # Throttled or timed out: another N calls would only add
+                    # load, so re-send the pack as a unit or give up on it
+                    attempt = pack_attempts.get(id(target), 0)
+                    if attempt < PACK_RETRIES:
+                        pack_attempts[id(target)] = attempt + 1
+                        backoff = max(backoff, get_retry_policy().delay(attempt, retry_after_from(error)))
+                        logger.warning(f"Packed grading of {len(target)} answers failed, retrying as a unit: {error}")
+                        retry.append((('packed', target), packed_payloads[id(target)]))
+                        continue
+                    for key, _, _ in target:
+                        yield key, None, error
+                    continue
+
+                # Unusable response: regrade the answers it did not cover singly
+                try:
+                    if error is not None:
+                        raise error
+                    packed_results = parse_packed_response(response_text, len(target))
+                except Exception as e:
+                    logger.warning(f"Packed grading of {len(target)} answers failed, regrading individually: {e}")
+                    packed_results = {}
+                for index, (key, compiled, student_answer) in enumerate(target):
+                    result = packed_results.get(index)
+                    if result is None or not is_usable_result(result):
+                        retry.append((('single', key), (compiled.render(student_answer), MAX_TOKENS)))
+                        continue
+                    cache.set(compiled.cache_key(student_answer, packed=True), result, self.model_name)
+                    yield key, result, None
+            if backoff:
+                time.sleep(backoff)
+            requests = retry
+
+
+# Singleton instance
+_grading_pipeline = None
+_grading_pipeline_lock = threading.Lock()
+
+
+def get_grading_pipeline():
+    """Get the singleton grading pipeline instance."""
+    global _grading_pipeline
+    if _grading_pipeline is None:
+        with _grading_pipeline_lock:
+            if _grading_pipeline is None:
+                from .ai_grading import MODEL_NAME
+                packing_enabled = False
+                pack_size = DEFAULT_PACK_SIZE
+                pack_max_chars = DEFAULT_PACK_MAX_CHARS
+                if has_app_context():
+                    packing_enabled = current_app.config.get('GRADING_PACKING_ENABLED', packing_enabled)
+                    pack_size = current_app.config.get('GRADING_PACK_SIZE', pack_size)
+                    pack_max_chars = current_app.config.get('GRADING_PACK_MAX_CHARS', pack_max_chars)
+                _grading_pipeline = GradingPipeline(MODEL_NAME, PROMPT_VERSION, packing_enabled,
+                                                    pack_size, pack_max_chars)
+    return _grading_pipeline
@@ -0,0 +1,249 @@
+# website/services/import_jobs.py
+"""
+Import Job Runner for the AIGrader application.
+Runs Google Classroom imports as tracked background jobs, so the request
+that starts an import returns at once with a job ID to poll.
+"""
+
+import time
+import logging
+import threading
+from flask import current_app, has_app_context
+from .job_progress import get_job_progress, progress_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_RUNNER = 'thread'  # 'thread' runs in this process, 'celery' on a worker
+DEFAULT_PUBLISH_INTERVAL = 1.0  # Seconds between file progress updates
+
+
+def import_snapshot(job_id, status, counts, error_message=None):
+    """
+    Build the progress payload of an import job.
+
+    Args:
+        job_id: The import job ID
+        status: Job status (queued, processing, completed, failed)
+        counts: The job's progress counters (see ImportJob.to_counts)
+        error_message: Optional failure message
+
+    Returns:
+        Dictionary describing the job's progress
+    """
+    snapshot = progress_snapshot(job_id, status, counts['processed_assignments'],
+                                 counts['total_assignments'], error_message)
+    snapshot.update(counts)
+    snapshot['kind'] = 'import'
+    snapshot['status'] = import_status_message(status, counts)
+    return snapshot
+
+
+def import_status_message(status, counts):
+    """Describe an import job's progress for display."""
+    if status == 'completed':
+        return (f"Imported {counts['processed_assignments']} assignments and "
+                f"{counts['imported_submissions']} submissions")
+    if status == 'failed':
+        return "The Google Classroom import failed"
+    if not counts['total_assignments']:
+        return "Fetching coursework from Google Classroom..."
+    return (f"Importing assignments... ({counts['processed_assignments']}/{counts['total_assignments']} "
+            f"assignments, {counts['processed_files']}/{counts['total_files']} files)")
+
+
+def publish_import_progress(job_id, status, counts, error_message=None, owner_id=None):
+    """Push an import job's progress to the job progress registry."""
+    return get_job_progress().publish(job_id, status, counts['processed_assignments'],
+                                      counts['total_assignments'], error_message, owner_id,
+                                      extra=import_snapshot(job_id, status, counts, error_message))
+
+
+class ImportProgress:
+    """
+    Progress counters for one Classroom import run.
+
+    ``set_assignments`` and ``assignment_done`` are called on the importing
+    thread and write the job row. ``add_files`` and ``file_done`` may be
+    called from attachment worker threads; they only publish to the job
+    progress registry, at most every ``interval`` seconds.
+    """
+
+    def __init__(self, job, interval=DEFAULT_PUBLISH_INTERVAL):
+        """
+        Initialize the progress tracker.
+
+        Args:
+            job: The ImportJob being run, bound to the importing thread's session
+            interval: Minimum seconds between file progress publishes
+        """
+        self.job = job
+        self.job_id = job.id
+        self.owner_id = job.class_ref.owner_id if job.class_ref else None
+        self.interval = interval
+        self._counts = job.to_counts()
+        self._lock = threading.Lock()
+        self._last_publish = 0
+
+    def counts(self):
+        """Get a copy of the current counters."""
+        with self._lock:
+            return dict(self._counts)
+
+    def _save(self):
+        self.job.update_progress(self.counts())
+
+    def _publish(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_publish < self.interval:
+                return
+            self._last_publish = now
+            counts = dict(self._counts)
+        publish_import_progress(self.job_id, 'processing', counts, owner_id=self.owner_id)
+
+    def set_assignments(self, total):
+        """Record how many coursework items the course has."""
+        with self._lock:
+            self._counts['total_assignments'] = total
+        self._save()
+
+    def assignment_done(self, submissions):
+        """Record a finished coursework item and its saved submissions."""
+        with self._lock:
+            self._counts['processed_assignments'] += 1
+            self._counts['imported_submissions'] += submissions
+        self._save()
+
+    def add_files(self, count):
+        """Record Drive attachments queued for extraction."""
+        if not count:
+            return
+        with self._lock:
+            self._counts['total_files'] += count
+        self._publish()
+
+    def file_done(self):
+        """Record a processed Drive attachment."""
+        with self._lock:
+            self._counts['processed_files'] += 1
+        self._publish()
+
+
+def run_import_job(job_id, full_sync=False):
+    """
+    Run a Classroom import job. Must be called inside an application context.
+
+    Args:
+        job_id: ID of the ImportJob to run
+        full_sync: Re-import every submission instead of only changed ones
+
+    Returns:
+        The import summary, or None if the job could not run
+    """
+    from ..models import ImportJob, User, db
+    from .classroom_import import get_classroom_importer, google_credentials_for_user
+
+    job = ImportJob.query.get(job_id)
+    if not job:
+        logger.error(f"Import job {job_id} not found")
+        return None
+
+    try:
+        user = User.query.get(job.user_id)
+        credentials = google_credentials_for_user(user) if user else None
+        if not credentials:
+            job.fail('Google authentication expired. Please reconnect your Google account.')
+            return None
+
+        job.update_progress({})
+        summary = get_classroom_importer(credentials).import_course(job.class_ref, ImportProgress(job), full_sync)
+        if summary['failed']:
+            logger.warning(f"Import job {job_id} could not import: {', '.join(summary['failed'])}")
+        job.complete(summary)
+        return summary
+
+    except Exception as e:
+        logger.exception(f"Error in import job {job_id}: {e}")
+        db.session.rollback()
+        job.fail(str(e))
+        return None
+
+
+def _run_in_app(app, job_id, full_sync):
+    with app.app_context():
+        run_import_job(job_id, full_sync)
+
+
+def start_import_job(google_class, user, full_sync=False):
+    """
+    Create an import job for a Google class and start it in the background.
+
+    Args:
+        google_class: The GoogleClass to import into
+        user: The user whose Google credentials are used
+        full_sync: Re-import every submission instead of only changed ones
+
+    Returns:
+        The new ImportJob
+    """
+    from ..models import ImportJob, db
+
+    job = ImportJob(class_id=google_class.id, user_id=user.id)
+    db.session.add(job)
+    db.session.commit()
+    job.publish_progress()
+
+    runner = DEFAULT_RUNNER
+    if has_app_context():
+        runner = current_app.config.get('CLASSROOM_IMPORT_RUNNER', runner)
+
+    if runner == 'celery':
+        from ..tasks import import_classroom_task
+        import_classroom_task.delay(job.id, full_sync)
+    else:
+        app = current_app._get_current_object()
+        threading.Thread(target=_run_in_app, args=(app, job.id, full_sync), daemon=True).start()
+
+    logger.info(f"Started import job {job.id} for class {google_class.id} ({runner})")
+    return job
+
+
+def load_import_job_status(job_id):
+    """
+    Build the status payload for the import job status endpoint.
+
+    Running jobs are answered from the progress registry without touching
+    the database; unknown and finished jobs are read with a primary-key lookup.
+
+    Args:
+        job_id: The import job ID
+
+    Returns:
+        Tuple of (payload, HTTP status code)
+    """
+    from flask_login import current_user
+    from ..models import ImportJob, check_resource_access
+
+    snapshot = get_job_progress().get(job_id)
+    if snapshot and not snapshot['complete']:
+        owner_id = snapshot.pop('owner_id', None)
+        if owner_id != current_user.id and not getattr(current_user, 'is_admin', False):
+            return {'error': 'Permission denied'}, 403
+        snapshot.pop('updated', None)
+        snapshot['id'] = job_id
+        return snapshot, 200
+
+    job = ImportJob.query.get(job_id)
+    if not job:
+        return {'error': 'Import job not found'}, 404
+    if not check_resource_access(job.class_ref):
+        return {'error': 'Permission denied'}, 403
+
+    payload = import_snapshot(job.id, job.status, job.to_counts(), job.error_message)
+    payload['id'] = job.id
+    payload['version'] = snapshot['version'] if snapshot else 0
+    payload['class_id'] = job.class_id
+    payload['timestamp'] = job.updated_at.isoformat() if job.updated_at else None
+    payload['results'] = job.to_dict()['results']
+    return payload, 200
@@ -0,0 +1,495 @@
+# website/services/job_progress.py
+"""
+Job Progress Registry for the AIGrader application.
+Lets job runners push grading progress to status endpoints and streams
+instead of clients polling the database, and batches the runners'
+database writes.
+"""
+
+import json
+import time
+import logging
+import threading
+from flask import current_app, has_app_context
+from ..utils.helpers import format_sse
+
+logger = logging.getLogger(__name__)
+
+# How long finished jobs stay in the registry for late subscribers
+FINISHED_RETENTION = 10 * 60  # 10 minutes
+# Upper bound on how long a running job's entry lives in Redis
+ACTIVE_RETENTION = 24 * 3600  # 1 day
+REDIS_KEY_PREFIX = 'aigrader:job-progress:'
+
+# Defaults for batching grading job writes to the database
+DEFAULT_WRITE_BATCH_SIZE = 25  # submissions
+DEFAULT_WRITE_INTERVAL = 5  # seconds
+
+
+def progress_snapshot(job_id, status, processed, total, error_message=None):
+    """
+    Build the progress payload sent to clients.
+
+    Args:
+        job_id: The grading job ID
+        status: Job status (queued, processing, completed, failed)
+        processed: Number of processed submissions
+        total: Total number of submissions in the job
+        error_message: Optional failure message
+
+    Returns:
+        Dictionary describing the job's progress
+    """
+    processed = processed or 0
+    total = total or 0
+    progress = round((processed / total) * 100, 1) if total > 0 else 0
+
+    if status == 'completed':
+        message = f"Completed grading {processed} submissions"
+    elif status == 'failed':
+        message = "There was a problem processing some submissions"
+    else:
+        message = f"Processing submissions... ({processed}/{total if total > 0 else '?'})"
+
+    return {
+        'job_id': job_id,
+        'state': status,
+        'status': message,
+        'progress': progress,
+        'processed': processed,
+        'total': total,
+        'complete': status in ['completed', 'failed'],
+        'error': error_message if status == 'failed' else None
+    }
+
+
+class JobProgressRegistry:
+    """
+    In-process registry of grading job progress.
+
+    Every published update bumps the job's version number and wakes all
+    waiters, so a status stream only does work when something changed.
+    """
+
+    def __init__(self, retention=FINISHED_RETENTION):
+        """
+        Initialize the registry.
+
+        Args:
+            retention: Seconds to keep finished jobs for late subscribers
+        """
+        self.retention = retention
+        self._jobs = {}
+        self._condition = threading.Condition()
+
+    def publish(self, job_id, status, processed, total, error_message=None, owner_id=None, extra=None):
+        """
+        Record new progress for a job and wake any waiting streams.
+
+        Args:
+            job_id: The grading job ID
+            status: Job status
+            processed: Number of processed submissions
+            total: Total number of submissions in the job
+            error_message: Optional failure message
+            owner_id: ID of the user owning the job's class, used to
+                      authorise status reads without a database query
+            extra: Optional fields merged into the snapshot, e.g. a job
+                   type's own counters and status message
+
+        Returns:
+            The new version number
+        """
+        snapshot = progress_snapshot(job_id, status, processed, total, error_message)
+        snapshot.update(extra or {})
+        snapshot['owner_id'] = owner_id
+        with self._condition:
+            previous = self._jobs.get(job_id)
+            version = previous['version'] + 1 if previous else 1
+            snapshot['version'] = version
+            snapshot['updated'] = time.monotonic()
+            self._jobs[job_id] = snapshot
+            self._prune()
+            self._condition.notify_all()
+        return version
+
+    def publish_job(self, job):
+        """Publish the current state of a GradingJob instance."""
+        class_ref = job.assignment.class_ref if job.assignment else None
+        owner_id = class_ref.owner_id if class_ref else None
+        return self.publish(job.id, job.status, job.processed_submissions, job.total_submissions,
+                            job.error_message, owner_id)
+
+    def get(self, job_id):
+        """Get the latest progress snapshot for a job, or None if unknown."""
+        with self._condition:
+            snapshot = self._jobs.get(job_id)
+            return dict(snapshot) if snapshot else None
+
+    def wait(self, job_id, since_version=0, timeout=15):
+        """
+        Wait until a job's progress moves past ``since_version``.
+
+        Args:
+            job_id: The grading job ID
+            since_version: Last version the caller has seen
+            timeout: Maximum seconds to wait
+
+        Returns:
+            The newer snapshot, or None if nothing changed before the timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                snapshot = self._jobs.get(job_id)
+                if snapshot and snapshot['version'] > since_version:
+                    return dict(snapshot)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _prune(self):
+        """Drop finished jobs past the retention window (lock held)."""
+        cutoff = time.monotonic() - self.retention
+        stale = [job_id for job_id, snapshot in self._jobs.items()
+                 if snapshot['complete'] and snapshot['updated'] < cutoff]
+        for job_id in stale:
+            del self._jobs[job_id]
+
+
+class RedisJobProgressRegistry(JobProgressRegistry):
+    """
+    Job progress registry shared through Redis.
+
+    Lets web processes stream progress for jobs running in other processes
+    (Celery workers, other gunicorn workers). Snapshots are stored as JSON
+    with a TTL and every publish is announced on a per-job channel.
+    """
+
+    def __init__(self, redis_url, retention=FINISHED_RETENTION):
+        """
+        Initialize the registry.
+
+        Args:
+            redis_url: Redis connection URL
+            retention: Seconds to keep finished jobs for late subscribers
+        """
+        import redis
+        super().__init__(retention)
+        self._redis = redis.Redis.from_url(redis_url)
+
+    @staticmethod
+    def _key(job_id):
+        return f"{REDIS_KEY_PREFIX}{job_id}"
+
+    def publish(self, job_id, status, processed, total, error_message=None, owner_id=None, extra=None):
+        """Record new progress for a job in Redis and notify subscribers."""
+        snapshot = progress_snapshot(job_id, status, processed, total, error_message)
+        snapshot.update(extra or {})
+        snapshot['owner_id'] = owner_id
+        key = self._key(job_id)
+        ttl = self.retention if snapshot['complete'] else ACTIVE_RETENTION
+        try:
+            version = self._redis.incr(f"{key}:version")
+            snapshot['version'] = version
+            pipe = self._redis.pipeline()
+            pipe.set(key, json.dumps(snapshot), ex=ttl)
+            pipe.expire(f"{key}:version", ttl)
+            pipe.publish(key, version)
+            pipe.execute()
+            return version
+        except Exception as e:
+            logger.warning(f"Failed to publish progress for job {job_id}: {e}")
+            return None
+
+    def get(self, job_id):
+        """Get the latest progress snapshot for a job, or None if unknown."""
+        try:
+            raw = self._redis.get(self._key(job_id))
+        except Exception as e:
+            logger.warning(f"Failed to read progress for job {job_id}: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def wait(self, job_id, since_version=0, timeout=15):
+        """Wait until a job's progress moves past ``since_version``."""
+        snapshot = self.get(job_id)
+        if snapshot and snapshot['version'] > since_version:
+            return snapshot
+
+        deadline = time.monotonic() + timeout
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self._key(job_id))
+            # Re-check after subscribing so a publish in between is not missed
+            snapshot = self.get(job_id)
+            while not (snapshot and snapshot['version'] > since_version):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                if pubsub.get_message(timeout=remaining):
+                    snapshot = self.get(job_id)
+            return snapshot
+        except Exception as e:
+            logger.warning(f"Failed to wait for progress of job {job_id}: {e}")
+            return None
+        finally:
+            pubsub.close()
+
+
+class GradingJobWriter:
+    """
+    Batches a grading job's database writes.
+
+    Progress is published to the registry as soon as it changes, while
+    graded submission results are buffered and written with one bulk
+    UPDATE, together with the job row, every ``batch_size`` submissions or
+    ``interval`` seconds.
+    """
+
+    def __init__(self, job, batch_size=DEFAULT_WRITE_BATCH_SIZE, interval=DEFAULT_WRITE_INTERVAL):
+        """
+        Initialize the job writer.
+
+        Args:
+            job: The GradingJob being processed
+            batch_size: Write after this many updates
+            interval: Write when this many seconds have passed
+        """
+        self.job = job
+        self.batch_size = max(1, int(batch_size))
+        self.interval = interval
+        self._rows = []
+        self._pending = 0
+        self._last_write = time.monotonic()
+
+    def add_result(self, submission_id, grade, ai_feedback):
+        """
+        Buffer a graded submission for the next bulk update.
+
+        Submissions whose grading failed are not passed here, so their
+        previous grade and feedback stay in place.
+
+        Args:
+            submission_id: ID of the graded submission
+            grade: Numeric grade
+            ai_feedback: Serialized feedback JSON
+        """
+        self._rows.append({'id': submission_id, 'grade': grade, 'ai_feedback': ai_feedback})
+
+    def update(self, processed_count):
+        """Record progress, writing to the database when a batch is due."""
+        self.job.update_progress(processed_count, commit=False)
+        self._pending += 1
+        if (self._pending >= self.batch_size
+                or time.monotonic() - self._last_write >= self.interval):
+            self.flush()
+
+    def flush(self):
+        """Write buffered submission results and job progress in one transaction."""
+        from sqlalchemy import update
+        from ..models import Submission, db
+
+        # Bulk UPDATE by primary key
+        if self._rows:
+            db.session.execute(update(Submission), self._rows)
+        db.session.commit()
+        self._rows = []
+        self._pending = 0
+        self._last_write = time.monotonic()
+
+    def complete(self, results_data):
+        """Write any buffered results and mark the job completed."""
+        self.flush()
+        self.job.complete(results_data)
+
+    def _flush_best_effort(self):
+        from ..models import db
+
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Failed to write buffered results for job {self.job.id}: {e}")
+            db.session.rollback()
+
+    def fail(self, error_message):
+        """Write any buffered results (best effort) and mark the job failed."""
+        self._flush_best_effort()
+        self.job.fail(error_message)
+
+    def requeue(self, error_message):
+        """Write any buffered results (best effort) and mark the job queued for a retry."""
+        self._flush_best_effort()
+        self.job.requeue(error_message)
+
+
+def prefetch_submissions(submission_ids, chunk_size=500):
+    """
+    Load submissions (with their assignments) using IN queries.
+
+    Args:
+        submission_ids: IDs of the submissions to load
+        chunk_size: Maximum number of IDs per query
+
+    Returns:
+        Dictionary mapping submission ID to Submission
+    """
+    from sqlalchemy.orm import joinedload
+    from ..models import Submission
+
+    submission_ids = list(submission_ids)
+    submissions = {}
+    for start in range(0, len(submission_ids), chunk_size):
+        chunk = submission_ids[start:start + chunk_size]
+        for submission in Submission.query.options(joinedload(Submission.assignment_ref)).filter(
+                Submission.id.in_(chunk)).all():
+            submissions[submission.id] = submission
+    return submissions
+
+
+def load_job_status(job_id):
+    """
+    Build the status payload for the job status endpoint.
+
+    Running jobs are answered from the progress registry without touching
+    the database; unknown and finished jobs are read with a single
+    primary-key lookup.
+
+    Args:
+        job_id: The grading job ID
+
+    Returns:
+        Tuple of (payload, HTTP status code)
+    """
+    from flask_login import current_user
+    from ..models import GradingJob, check_resource_access
+
+    snapshot = get_job_progress().get(job_id)
+    if snapshot and not snapshot['complete']:
+        owner_id = snapshot.pop('owner_id', None)
+        if owner_id != current_user.id and not getattr(current_user, 'is_admin', False):
+            return {'error': 'Permission denied'}, 403
+        snapshot.pop('updated', None)
+        snapshot['id'] = job_id
+        return snapshot, 200
+
+    job = GradingJob.query.get(job_id)
+    if not job:
+        return {'error': 'Grading job not found'}, 404
+    if not check_resource_access(job.assignment.class_ref if job.assignment else None):
+        return {'error': 'Permission denied'}, 403
+
+    payload = progress_snapshot(job.id, job.status, job.processed_submissions,
+                                job.total_submissions, job.error_message)
+    payload['id'] = job.id
+    payload['version'] = snapshot['version'] if snapshot else 0
+    payload['assignment_id'] = job.assignment_id
+    payload['timestamp'] = job.updated_at.isoformat() if job.updated_at else None
+    payload['results'] = []
+    if payload['complete'] and job.results:
+        try:
+            results_data = json.loads(job.results)
+            if isinstance(results_data, dict):
+                payload['results'] = results_data.get('results', [])
+        except json.JSONDecodeError:
+            logger.warning(f"Invalid results JSON for grading job {job.id}")
+    return payload, 200
+
+
+def stream_job_events(job, last_version=0, heartbeat=15, poll_interval=2, max_duration=25):
+    """
+    Generate server-sent events for a grading job's progress.
+
+    Progress pushed by an in-process runner is forwarded as soon as it is
+    published. Jobs running in another process (e.g. a Celery worker) fall
+    back to re-reading the job row every ``poll_interval`` seconds.
+
+    Each stream holds a web worker, so it ends after ``max_duration`` and
+    the browser's EventSource reconnects, resuming from Last-Event-ID.
+
+    Args:
+        job: The GradingJob instance (bound to the request's session)
+        last_version: Last event ID the client has seen
+        heartbeat: Seconds between keep-alive comments
+        poll_interval: Seconds between reads of the job row in fallback mode
+        max_duration: Seconds before the stream ends and the browser reconnects
+
+    Yields:
+        ``progress`` events and a final ``complete`` event with job results
+    """
+    from ..models import db
+
+    registry = get_job_progress()
+    version = last_version
+    last_read = None
+    deadline = time.monotonic() + max_duration
+
+    while time.monotonic() < deadline:
+        if registry.get(job.id) is not None:
+            timeout = min(heartbeat, max(deadline - time.monotonic(), 0))
+            snapshot = registry.wait(job.id, version, timeout=timeout)
+            if snapshot is None:
+                yield ": keepalive\n\n"
+                continue
+            version = snapshot['version']
+        else:
+            db.session.refresh(job)
+            snapshot = progress_snapshot(job.id, job.status, job.processed_submissions,
+                                         job.total_submissions, job.error_message)
+            # End the read transaction so a long stream does not hold it open
+            db.session.rollback()
+            if (snapshot['state'], snapshot['processed']) == last_read:
+                time.sleep(poll_interval)
+                yield ": keepalive\n\n"
+                continue
+            last_read = (snapshot['state'], snapshot['processed'])
+            version += 1
+            snapshot['version'] = version
+
+        snapshot.pop('owner_id', None)
+        snapshot.pop('updated', None)
+        if snapshot['complete']:
+            db.session.refresh(job)
+            try:
+                results_data = json.loads(job.results) if job.results else {}
+            except json.JSONDecodeError:
+                results_data = {}
+            snapshot['results'] = results_data.get('results', []) if isinstance(results_data, dict) else []
+            yield format_sse(snapshot, 'complete', version)
+            return
+
+        yield format_sse(snapshot, 'progress', version)
+
+
+# Singleton instance
+_job_progress = None
+_job_progress_lock = threading.Lock()
+
+
+def get_job_progress():
+    """Get the singleton job progress registry (in-memory or Redis-backed)."""
+    global _job_progress
+    if _job_progress is None:
+        with _job_progress_lock:
+            if _job_progress is None:
+                backend = 'memory'
+                redis_url = None
+                if has_app_context():
+                    backend = current_app.config.get('JOB_PROGRESS_BACKEND', backend)
+                    redis_url = current_app.config.get('JOB_PROGRESS_REDIS_URL')
+                if backend == 'redis' and redis_url:
+                    _job_progress = RedisJobProgressRegistry(redis_url)
+                else:
+                    _job_progress = JobProgressRegistry()
+    return _job_progress
+
+
+def get_job_writer(job):
+    """Create a batched database writer for a grading job using the configured batch sizes."""
+    batch_size = DEFAULT_WRITE_BATCH_SIZE
+    interval = DEFAULT_WRITE_INTERVAL
+    if has_app_context():
+        batch_size = current_app.config.get('GRADING_WRITE_BATCH_SIZE', batch_size)
+        interval = current_app.config.get('GRADING_WRITE_INTERVAL', interval)
+    return GradingJobWriter(job, batch_size, interval)
@@ -0,0 +1,480 @@
+# website/services/ocr.py
+"""
+OCR Service for the AIGrader application.
+Recognises text in photos and image-only PDFs through pluggable backends:
+Google Cloud Vision, or a local Tesseract engine that works offline.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import importlib.util
+from flask import current_app, has_app_context
+from .extraction_pool import get_extraction_pool
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_BACKENDS = 'vision'  # Comma-separated, tried in order
+DEFAULT_LANGUAGE = 'eng'
+DEFAULT_DPI = 300
+DEFAULT_MAX_PAGES = 50
+DEFAULT_PAGE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'aigrader-ocr-pages')
+DEFAULT_PAGE_CACHE_MAX_AGE = 24 * 3600  # 1 day since last use
+
+PAGE_MANIFEST = 'pages.json'
+
+# Vision API request limits
+DEFAULT_VISION_BATCH_SIZE = 16
+VISION_MAX_BATCH_SIZE = 16  # Images per batch_annotate_images call
+VISION_MAX_BATCH_BYTES = 8 * 1024 * 1024  # Stay below the request size limit
+VISION_FILE_PAGES_PER_REQUEST = 5  # Pages per synchronous batch_annotate_files call
+VISION_FILE_MIME_TYPES = ('application/pdf', 'image/tiff', 'image/gif')
+
+# Process-wide Vision client
+_vision_client = None
+_vision_client_pid = None
+_vision_client_lock = threading.Lock()
+
+
+def _module_available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def get_vision_client():
+    """
+    Get the process-wide Cloud Vision client.
+
+    The client and its gRPC channel are reused across files and threads.
+    A forked child (e.g. a Celery prefork worker) builds its own client,
+    since gRPC channels do not survive a fork.
+    """
+    global _vision_client, _vision_client_pid
+    if _vision_client is None or _vision_client_pid != os.getpid():
+        with _vision_client_lock:
+            if _vision_client is None or _vision_client_pid != os.getpid():
+                from google.cloud import vision
+                _vision_client = vision.ImageAnnotatorClient()
+                _vision_client_pid = os.getpid()
+    return _vision_client
+
+
+# The functions below run inside worker processes, so they must stay at
+# module level and take only picklable arguments.
+
+def rasterize_pdf(file_path, output_dir, dpi, max_pages):
+    """
+    Render the pages of a PDF to PNG files.
+
+    Returns:
+        List of page image file names inside ``output_dir``, in page order
+    """
+    from pdf2image import convert_from_path
+
+    page_paths = convert_from_path(
+        file_path,
+        dpi=dpi,
+        output_folder=output_dir,
+        output_file='page',
+        fmt='png',
+        paths_only=True,
+        last_page=max_pages or None
+    )
+    return [os.path.basename(page_path) for page_path in page_paths]
+
+
+def tesseract_image_text(image_path, language):
+    """Recognise the text of one image with Tesseract."""
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        return pytesseract.image_to_string(image, lang=language)
+
+
+class PageRasterCache:
+    """
+    On-disk cache of rendered PDF pages.
+
+    Pages are keyed by a hash of the PDF's content and the render settings,
+    so a document is rasterised once however many OCR backends or imports
+    look at it. Rendering runs in the text extraction process pool into a
+    scratch directory that is renamed into place when complete, so a
+    partly rendered document is never served.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_PAGE_CACHE_DIR, dpi=DEFAULT_DPI, max_pages=DEFAULT_MAX_PAGES,
+                 max_age=DEFAULT_PAGE_CACHE_MAX_AGE):
+        """
+        Initialize the page cache.
+
+        Args:
+            cache_dir: Directory holding one sub-directory per rendered PDF
+            dpi: Render resolution
+            max_pages: Maximum number of pages rendered per PDF; 0 renders all
+            max_age: Seconds since last use after which entries are evicted
+        """
+        self.cache_dir = cache_dir
+        self.dpi = int(dpi)
+        self.max_pages = int(max_pages)
+        self.max_age = int(max_age)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        """Check whether PDFs can be rasterised on this host."""
+        return _module_available('pdf2image') and shutil.which('pdftoppm') is not None
+
+    def _key(self, file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return f"{digest.hexdigest()}-{self.dpi}-{self.max_pages}"
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _cached_pages(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, PAGE_MANIFEST)) as f:
+                page_names = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(entry_dir)
+        return [os.path.join(entry_dir, page_name) for page_name in page_names]
+
+    def pages(self, file_path):
+        """
+        Get page images for a PDF, rendering it on first use.
+
+        Args:
+            file_path: Path of the PDF file
+
+        Returns:
+            List of page image paths, or None if the PDF cannot be rasterised
+        """
+        if not self.is_available():
+            return None
+
+        key = self._key(file_path)
+        entry_dir = os.path.join(self.cache_dir, key)
+        with self._key_lock(key):
+            page_paths = self._cached_pages(entry_dir)
+            if page_paths is not None:
+                return page_paths
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            scratch_dir = tempfile.mkdtemp(prefix=f"{key}.", dir=self.cache_dir)
+            try:
+                page_names = get_extraction_pool().run(
+                    rasterize_pdf, file_path, scratch_dir, self.dpi, self.max_pages
+                )
+                with open(os.path.join(scratch_dir, PAGE_MANIFEST), 'w') as f:
+                    json.dump(page_names, f)
+                try:
+                    os.rename(scratch_dir, entry_dir)
+                except OSError:
+                    # Another process rendered the same document first
+                    shutil.rmtree(scratch_dir, ignore_errors=True)
+            except Exception as e:
+                logger.warning(f"Could not rasterise PDF {file_path}: {e}")
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+                return None
+
+            logger.info(f"Rasterised {len(page_names)} PDF pages at {self.dpi} dpi")
+            return self._cached_pages(entry_dir)
+
+    def evict(self):
+        """
+        Remove rendered documents that have not been used for ``max_age`` seconds.
+
+        Returns:
+            Number of documents removed
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+
+        cutoff = time.time() - self.max_age
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            try:
+                if os.path.getmtime(entry_dir) < cutoff:
+                    shutil.rmtree(entry_dir)
+                    removed += 1
+            except OSError as e:
+                logger.warning(f"Could not evict OCR page cache entry {name}: {e}")
+        return removed
+
+
+class OCRBackend:
+    """
+    Interface of an OCR engine.
+
+    Backends recognise text in page images; ``file_text`` handles files
+    that could not be rasterised and by default recognises nothing.
+    """
+
+    name = None
+
+    def is_available(self):
+        """Check whether the engine can run on this host."""
+        return True
+
+    def images_text(self, image_paths):
+        """
+        Recognise the text of several images.
+
+        Args:
+            image_paths: Paths of image files, e.g. the pages of one document
+
+        Returns:
+            List of recognised texts in the order of ``image_paths``
+        """
+        raise NotImplementedError
+
+    def file_text(self, file_path, mime_type):
+        """Recognise the text of a file that is not available as page images."""
+        return ""
+
+
+class VisionOCRBackend(OCRBackend):
+    """
+    OCR through the Google Cloud Vision API.
+
+    Page images are sent in ``batch_annotate_images`` calls of up to
+    ``batch_size`` images, and PDFs that could not be rasterised go to
+    ``batch_annotate_files`` a few pages at a time, all over the
+    process-wide client from ``get_vision_client``.
+    """
+
+    name = 'vision'
+
+    def __init__(self, batch_size=DEFAULT_VISION_BATCH_SIZE, max_pages=DEFAULT_MAX_PAGES):
+        """
+        Initialize the Vision backend.
+
+        Args:
+            batch_size: Images per batch_annotate_images call (at most 16)
+            max_pages: Maximum number of pages read from an unrasterised PDF; 0 reads all
+        """
+        self.batch_size = max(1, min(int(batch_size), VISION_MAX_BATCH_SIZE))
+        self.max_pages = int(max_pages)
+
+    def is_available(self):
+        return _module_available('google.cloud.vision')
+
+    def _batches(self, image_paths):
+        """Group images into batches by count and request size."""
+        batch, batch_bytes = [], 0
+        for image_path in image_paths:
+            size = os.path.getsize(image_path)
+            if batch and (len(batch) >= self.batch_size or batch_bytes + size > VISION_MAX_BATCH_BYTES):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(image_path)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _response_text(response):
+        if response.error.message:
+            logger.warning(f"Vision could not annotate a page: {response.error.message}")
+            return ""
+        return response.full_text_annotation.text
+
+    def images_text(self, image_paths):
+        from google.cloud import vision
+
+        vision_client = get_vision_client()
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        texts = []
+        for batch in self._batches(image_paths):
+            requests = []
+            for image_path in batch:
+                with open(image_path, 'rb') as file:
+                    requests.append(vision.AnnotateImageRequest(
+                        image=vision.Image(content=file.read()), features=[feature]
+                    ))
+            response = vision_client.batch_annotate_images(requests=requests)
+            texts.extend(self._response_text(image_response) for image_response in response.responses)
+        return texts
+
+    def file_text(self, file_path, mime_type):
+        from google.cloud import vision
+
+        with open(file_path, 'rb') as file:
+            content = file.read()
+
+        if mime_type not in VISION_FILE_MIME_TYPES:
+            image = vision.Image(content=content)
+            response = get_vision_client().document_text_detection(image=image)
+            return response.full_text_annotation.text
+
+        vision_client = get_vision_client()
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        input_config = vision.InputConfig(content=content, mime_type=mime_type)
+        texts = []
+        first_page, total_pages = 1, None
+        while total_pages is None or first_page <= total_pages:
+            last_page = first_page + VISION_FILE_PAGES_PER_REQUEST - 1
+            if self.max_pages:
+                last_page = min(last_page, self.max_pages)
+            if total_pages is not None:
+                last_page = min(last_page, total_pages)
+            request = vision.AnnotateFileRequest(
+                input_config=input_config, features=[feature], pages=list(range(first_page, last_page + 1))
+            )
+            file_response = vision_client.batch_annotate_files(requests=[request]).responses[0]
+            if file_response.error.message:
+                logger.warning(f"Vision could not annotate {mime_type} pages: {file_response.error.message}")
+                break
+            texts.extend(self._response_text(page_response) for page_response in file_response.responses)
+            total_pages = file_response.total_pages
+            if self.max_pages:
+                total_pages = min(total_pages, self.max_pages)
+            first_page = last_page + 1
+        return "\n".join(text for text in texts if text and text.strip())
+
+
+class TesseractOCRBackend(OCRBackend):
+    """Local OCR with Tesseract, one page per worker process."""
+
+    name = 'tesseract'
+
+    def __init__(self, language=DEFAULT_LANGUAGE):
+        """
+        Initialize the Tesseract backend.
+
+        Args:
+            language: Tesseract language code(s), e.g. ``eng`` or ``eng+hin``
+        """
+        self.language = language
+
+    def is_available(self):
+        return _module_available('pytesseract') and shutil.which('tesseract') is not None
+
+    def images_text(self, image_paths):
+        return get_extraction_pool().map(
+            tesseract_image_text, [(image_path, self.language) for image_path in image_paths]
+        )
+
+
+# Registered OCR backends by name
+OCR_BACKENDS = {
+    VisionOCRBackend.name: VisionOCRBackend,
+    TesseractOCRBackend.name: TesseractOCRBackend,
+}
+
+
+class OCRService:
+    """
+    Runs OCR backends in order until one recognises some text.
+
+    Image-only PDFs are rasterised once through the page cache and the
+    same page images are handed to every backend that is tried.
+    """
+
+    def __init__(self, backends, page_cache=None):
+        """
+        Initialize the OCR service.
+
+        Args:
+            backends: OCRBackend instances, tried in order
+            page_cache: PageRasterCache for PDF pages
+        """
+        self.backends = backends
+        self.page_cache = page_cache or PageRasterCache()
+
+    def extract_text(self, file_path, mime_type):
+        """
+        Recognise the text of an image or document file.
+
+        Args:
+            file_path: Path of the file
+            mime_type: The file's MIME type
+
+        Returns:
+            The recognised text, or an empty string
+        """
+        logger.info(f"Extracting text from file: {file_path} with mime type: {mime_type}")
+        if mime_type.startswith('image/'):
+            image_paths = [file_path]
+        elif mime_type == 'application/pdf':
+            image_paths = self.page_cache.pages(file_path)
+        else:
+            image_paths = None
+
+        for backend in self.backends:
+            if not backend.is_available():
+                logger.debug(f"OCR backend {backend.name} is not available")
+                continue
+            try:
+                if image_paths:
+                    texts = backend.images_text(image_paths)
+                    extracted_text = "\n".join(text for text in texts if text and text.strip())
+                else:
+                    extracted_text = backend.file_text(file_path, mime_type)
+            except Exception as e:
+                logger.exception(f"Error in {backend.name} OCR: {e}")
+                continue
+
+            if extracted_text and extracted_text.strip():
+                logger.info(f"Extracted {len(extracted_text)} characters with {backend.name} OCR")
+                return extracted_text
+            logger.info(f"No text detected with {backend.name} OCR")
+
+        return ""
+
+
+# Singleton instance
+_ocr_service = None
+_ocr_service_lock = threading.Lock()
+
+
+def get_ocr_service():
+    """Get the singleton OCR service instance."""
+    global _ocr_service
+    if _ocr_service is None:
+        with _ocr_service_lock:
+            if _ocr_service is None:
+                backend_names = DEFAULT_BACKENDS
+                language = DEFAULT_LANGUAGE
+                dpi = DEFAULT_DPI
+                max_pages = DEFAULT_MAX_PAGES
+                cache_dir = DEFAULT_PAGE_CACHE_DIR
+                max_age = DEFAULT_PAGE_CACHE_MAX_AGE
+                vision_batch_size = DEFAULT_VISION_BATCH_SIZE
+                if has_app_context():
+                    backend_names = current_app.config.get('OCR_BACKENDS', backend_names)
+                    language = current_app.config.get('OCR_LANGUAGE', language)
+                    dpi = current_app.config.get('OCR_DPI', dpi)
+                    max_pages = current_app.config.get('PDF_MAX_PAGES', max_pages)
+                    cache_dir = current_app.config.get('OCR_PAGE_CACHE_DIR', cache_dir)
+                    max_age = current_app.config.get('OCR_PAGE_CACHE_MAX_AGE', max_age)
+                    vision_batch_size = current_app.config.get('VISION_BATCH_SIZE', vision_batch_size)
+
+                backends = []
+                for name in backend_names.split(','):
+                    name = name.strip().lower()
+                    if name == TesseractOCRBackend.name:
+                        backends.append(TesseractOCRBackend(language))
+                    elif name == VisionOCRBackend.name:
+                        backends.append(VisionOCRBackend(vision_batch_size, max_pages))
+                    elif name in OCR_BACKENDS:
+                        backends.append(OCR_BACKENDS[name]())
+                    elif name:
+                        logger.warning(f"Unknown OCR backend: {name}")
+                _ocr_service = OCRService(backends, PageRasterCache(cache_dir, dpi, max_pages, max_age))
+    return _ocr_service
@@ -0,0 +1,545 @@
+# website/services/rate_limiter.py
+"""
+Inference Rate Limiter for the AIGrader application.
+Paces calls to the inference backend with an adaptive token bucket and
+retries throttled or failed calls with exponential backoff and jitter.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import weakref
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when no application config is available
+DEFAULT_RATE = float(os.getenv('AI_RATE_LIMIT_PER_SECOND', 5))
+DEFAULT_BURST = int(os.getenv('AI_RATE_LIMIT_BURST', 10))
+DEFAULT_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 5))
+DEFAULT_BACKOFF_BASE = float(os.getenv('AI_BACKOFF_BASE', 1.0))
+DEFAULT_BACKOFF_MAX = float(os.getenv('AI_BACKOFF_MAX', 60))
+DEFAULT_REDIS_TIMEOUT = float(os.getenv('AI_RATE_LIMIT_REDIS_TIMEOUT', 0.5))  # Seconds per Redis call
+
+# Adaptive pacing: halve the rate on throttling, creep back up on success
+DECREASE_FACTOR = 0.5
+MIN_RATE_FRACTION = 0.05
+INCREASE_FRACTION = 0.05
+INCREASE_EVERY = 10  # successful calls per increase
+
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+REDIS_KEY_PREFIX = 'aigrader:ratelimit:'
+
+
+def _status_of(error):
+    """HTTP status carried by a requests/huggingface_hub or aiohttp error, if any."""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        status = getattr(error, 'status', None)
+    return status if isinstance(status, int) else None
+
+
+def _transient_errors():
+    """Exception types that indicate a timeout or dropped connection."""
+    errors = [TimeoutError, asyncio.TimeoutError, ConnectionError]
+    try:
+        import requests
+        errors += [requests.exceptions.Timeout, requests.exceptions.ConnectionError]
+    except ImportError:
+        pass
+    try:
+        import aiohttp
+        errors += [aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError]
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+def is_retryable(error):
+    """Whether an inference error is worth retrying."""
+    status = _status_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return isinstance(error, _transient_errors())
+
+
+def is_throttled(error):
+    """Whether an inference error means the provider is rate limiting us."""
+    return _status_of(error) in (429, 503)
+
+
+def retry_after_from(error):
+    """
+    Read the Retry-After header from an inference error.
+
+    Args:
+        error: The raised exception
+
+    Returns:
+        Seconds to wait, or None if the error carries no Retry-After
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or getattr(error, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_countdown(attempt, error=None, base=60, cap=3600):
+    """
+    Delay before re-running a failed background task.
+
+    Uses "equal jitter" (half fixed, half random) so retried tasks never
+    fire immediately but still spread out, and never undercuts Retry-After.
+
+    Args:
+        attempt: Number of retries already made
+        error: The exception that caused the retry, if any
+        base: Delay for the first retry, in seconds
+        cap: Upper bound on the exponential part of the delay
+
+    Returns:
+        Countdown in seconds
+    """
+    delay = min(cap, base * (2 ** attempt))
+    countdown = delay / 2 + random.uniform(0, delay / 2)
+    retry_after = retry_after_from(error) if error is not None else None
+    if retry_after is not None:
+        countdown = max(countdown, retry_after)
+    return int(countdown)
+
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe token bucket whose refill rate adapts to throttling.
+
+    The rate starts at ``rate`` requests per second. A throttled response
+    halves it and pauses all callers for the Retry-After period; every
+    ``INCREASE_EVERY`` successful calls raise it again by a small step, up
+    to the configured rate.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            rate: Maximum sustained requests per second
+            burst: Bucket capacity (requests allowed back to back)
+        """
+        self.max_rate = max(0.01, float(rate))
+        self.min_rate = self.max_rate * MIN_RATE_FRACTION
+        self.burst = max(1, int(burst))
+        self.rate = self.max_rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        """
+        Take a token if one is available.
+
+        Returns:
+            0 if a token was taken, otherwise seconds to wait before retrying
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def _try_acquire_async(self):
+        """Take a token if one is available, without blocking the event loop."""
+        return self._try_acquire()
+
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a request may be sent."""
+        while True:
+            wait = await self._try_acquire_async()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def _increase_due(self):
+        """Count a successful call; True once every ``INCREASE_EVERY`` calls."""
+        with self._lock:
+            self._successes += 1
+            due = self._successes >= INCREASE_EVERY
+            if due:
+                self._successes = 0
+        return due
+
+    def _increase(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * INCREASE_FRACTION)
+
+    def on_success(self):
+        """Record a successful call, slowly raising the rate back up."""
+        if self._increase_due():
+            self._increase()
+
+    async def on_success_async(self):
+        """Record a successful call from the event loop."""
+        self.on_success()
+
+    async def on_throttle_async(self, retry_after=None):
+        """Record a throttled call from the event loop."""
+        self.on_throttle(retry_after)
+
+    def on_throttle(self, retry_after=None):
+        """Record a throttled call: lower the rate and honour Retry-After."""
+        with self._lock:
+            self._successes = 0
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self._tokens = 0.0
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logger.warning(f"Inference backend throttled; rate lowered to {self.rate:.2f}/s"
+                       + (f", pausing {retry_after:.1f}s" if retry_after else ""))
+
+
+# Atomically refill and take a token from the shared bucket.
+# Returns "0" when a token was taken, otherwise the seconds to wait.
+_ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local max_rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local paused_until = tonumber(redis.call('GET', KEYS[4]) or '0')
+if now < paused_until then
+    return tostring(paused_until - now)
+end
+local rate = tonumber(redis.call('GET', KEYS[3]) or max_rate)
+local tokens = tonumber(redis.call('GET', KEYS[1]) or burst)
+local updated = tonumber(redis.call('GET', KEYS[2]) or now)
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('SET', KEYS[1], tostring(tokens), 'EX', 3600)
+redis.call('SET', KEYS[2], tostring(now), 'EX', 3600)
+return tostring(wait)
+"""
+
+# Atomically adjust the shared rate: ARGV[1] is a multiplier, ARGV[2] an
+# increment, clamped to [ARGV[3], ARGV[4]]. ARGV[5] is an optional pause.
+_ADJUST_SCRIPT = """
+local rate = tonumber(redis.call('GET', KEYS[1]) or ARGV[4])
+rate = rate * tonumber(ARGV[1]) + tonumber(ARGV[2])
+rate = math.max(tonumber(ARGV[3]), math.min(tonumber(ARGV[4]), rate))
+redis.call('SET', KEYS[1], tostring(rate), 'EX', 3600)
+local pause = tonumber(ARGV[5])
+if pause > 0 then
+    local now_parts = redis.call('TIME')
+    local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+    local until_ts = now + pause
+    local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if until_ts > current then
+        redis.call('SET', KEYS[2], tostring(until_ts), 'EX', math.ceil(pause) + 1)
+    end
+    redis.call('SET', KEYS[3], '0', 'EX', 3600)
+end
+return tostring(rate)
+"""
+
+
+class RedisRateLimiter(AdaptiveRateLimiter):
+    """
+    Adaptive token bucket shared by every thread and process through Redis.
+
+    Threads use a blocking client; coroutines use a ``redis.asyncio``
+    client per event loop, so waiting on Redis never stalls the loop's
+    other requests. Both have socket timeouts, and the in-process bucket
+    is used whenever Redis is slow or unavailable.
+    """
+
+    def __init__(self, redis_url, rate=DEFAULT_RATE, burst=DEFAULT_BURST, name='inference',
+                 timeout=DEFAULT_REDIS_TIMEOUT):
+        """
+        Initialize the shared rate limiter.
+
+        Args:
+            redis_url: Redis connection URL
+            rate: Maximum sustained requests per second
+            burst: Bucket capacity
+            name: Bucket name, so several backends can be limited separately
+            timeout: Socket connect and read timeout for Redis calls, in seconds
+        """
+        import redis
+        super().__init__(rate, burst)
+        self._redis_url = redis_url
+        self._timeout = timeout
+        self._redis = redis.Redis.from_url(redis_url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        prefix = f"{REDIS_KEY_PREFIX}{name}:"
+        self._keys = [f"{prefix}tokens", f"{prefix}updated", f"{prefix}rate", f"{prefix}paused_until"]
+        self._acquire_script = self._redis.register_script(_ACQUIRE_SCRIPT)
+        self._adjust_script = self._redis.register_script(_ADJUST_SCRIPT)
+        self._async_scripts = weakref.WeakKeyDictionary()  # Event loop -> (acquire, adjust)
+
+    def _scripts_async(self):
+        """Get the asyncio client's scripts for the running event loop."""
+        loop = asyncio.get_running_loop()
+        scripts = self._async_scripts.get(loop)
+        if scripts is None:
+            import redis.asyncio
+            client = redis.asyncio.Redis.from_url(
+                self._redis_url, socket_timeout=self._timeout, socket_connect_timeout=self._timeout
+            )
+            scripts = (client.register_script(_ACQUIRE_SCRIPT), client.register_script(_ADJUST_SCRIPT))
+            self._async_scripts[loop] = scripts
+        return scripts
+
+    def _adjust_args(self, factor, increment, pause):
+        tokens_key, _, rate_key, paused_key = self._keys
+        return [rate_key, paused_key, tokens_key], [factor, increment, self.min_rate, self.max_rate, pause or 0]
+
+    def _try_acquire(self):
+        try:
+            return float(self._acquire_script(keys=self._keys, args=[self.max_rate, self.burst]))
+        except Exception as e:
+            logger.warning(f"Shared rate limiter unavailable, using local bucket: {e}")
+            return super()._try_acquire()
+
+    async def _try_acquire_async(self):
+        try:
+            acquire_script, _ = self._scripts_async()
+            return float(await acquire_script(keys=self._keys, args=[self.max_rate, self.burst]))
+        except Exception as e:
+            logger.warning(f"Shared rate limiter unavailable, using local bucket: {e}")
+            return super()._try_acquire()
+
+    def _adjust(self, factor, increment, pause=0):
+        keys, args = self._adjust_args(factor, increment, pause)
+        try:
+            self.rate = float(self._adjust_script(keys=keys, args=args))
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to adjust shared rate limit: {e}")
+            return False
+
+    async def _adjust_async(self, factor, increment, pause=0):
+        keys, args = self._adjust_args(factor, increment, pause)
+        try:
+            _, adjust_script = self._scripts_async()
+            self.rate = float(await adjust_script(keys=keys, args=args))
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to adjust shared rate limit: {e}")
+            return False
+
+    def _log_throttle(self, retry_after):
+        logger.warning(f"Inference backend throttled; shared rate lowered to {self.rate:.2f}/s"
+                       + (f", pausing {retry_after:.1f}s" if retry_after else ""))
+
+    def on_success(self):
+        """Record a successful call, slowly raising the shared rate back up."""
+        if self._increase_due() and not self._adjust(1, self.max_rate * INCREASE_FRACTION):
+            self._increase()
+
+    async def on_success_async(self):
+        """Record a successful call from the event loop."""
+        if self._increase_due() and not await self._adjust_async(1, self.max_rate * INCREASE_FRACTION):
+            self._increase()
+
+    def on_throttle(self, retry_after=None):
+        """Record a throttled call for every process sharing the bucket."""
+        if self._adjust(DECREASE_FACTOR, 0, retry_after):
+            self._log_throttle(retry_after)
+        else:
+            super().on_throttle(retry_after)
+
+    async def on_throttle_async(self, retry_after=None):
+        """Record a throttled call for every process sharing the bucket, from the event loop."""
+        if await self._adjust_async(DECREASE_FACTOR, 0, retry_after):
+            self._log_throttle(retry_after)
+        else:
+            super().on_throttle(retry_after)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that honours Retry-After."""
+
+    def __init__(self, limiter, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BACKOFF_BASE,
+                 max_delay=DEFAULT_BACKOFF_MAX):
+        """
+        Initialize the retry policy.
+
+        Args:
+            limiter: Rate limiter consulted before every attempt
+            max_retries: Maximum number of retries after the first attempt
+            base_delay: Backoff delay for the first retry, in seconds
+            max_delay: Upper bound on any single backoff delay
+        """
+        self.limiter = limiter
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Compute how long to wait before retry number ``attempt`` (0-based).
+
+        Args:
+            attempt: Number of retries already made
+            retry_after: Server-provided Retry-After in seconds, if any
+
+        Returns:
+            Seconds to wait
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            # Never retry before the server asked us to, but spread callers out
+            return min(max(self.max_delay, retry_after), retry_after + backoff * 0.1)
+        return backoff
+
+    def _retry_delay(self, error, attempt, retry_after):
+        delay = self.delay(attempt, retry_after)
+        logger.warning(f"Inference call failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def _on_error(self, error, attempt):
+        """Record a failed attempt and return the delay before retrying, or None to give up."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        retry_after = retry_after_from(error)
+        if is_throttled(error):
+            self.limiter.on_throttle(retry_after)
+        return self._retry_delay(error, attempt, retry_after)
+
+    async def _on_error_async(self, error, attempt):
+        """Async variant of ``_on_error`` for callers on the event loop."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        retry_after = retry_after_from(error)
+        if is_throttled(error):
+            await self.limiter.on_throttle_async(retry_after)
+        return self._retry_delay(error, attempt, retry_after)
+
+    def call(self, fn):
+        """
+        Call ``fn`` under the rate limiter, retrying transient failures.
+
+        Args:
+            fn: Zero-argument callable performing one inference request
+
+        Returns:
+            The callable's return value
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.limiter.on_success()
+            return result
+
+    async def call_async(self, coro_fn):
+        """
+        Await ``coro_fn()`` under the rate limiter, retrying transient failures.
+
+        Args:
+            coro_fn: Zero-argument callable returning a coroutine
+
+        Returns:
+            The coroutine's result
+        """
+        attempt = 0
+        while True:
+            await self.limiter.acquire_async()
+            try:
+                result = await coro_fn()
+            except Exception as e:
+                delay = await self._on_error_async(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            await self.limiter.on_success_async()
+            return result
+
+
+# Singleton instance
+_retry_policy = None
+_retry_policy_lock = threading.Lock()
+
+
+def get_retry_policy():
+    """Get the singleton retry policy (and its rate limiter) for the inference backend."""
+    global _retry_policy
+    if _retry_policy is None:
+        with _retry_policy_lock:
+            if _retry_policy is None:
+                rate = DEFAULT_RATE
+                burst = DEFAULT_BURST
+                max_retries = DEFAULT_MAX_RETRIES
+                base_delay = DEFAULT_BACKOFF_BASE
+                max_delay = DEFAULT_BACKOFF_MAX
+                redis_timeout = DEFAULT_REDIS_TIMEOUT
+                backend = 'memory'
+                redis_url = None
+                if has_app_context():
+                    rate = current_app.config.get('AI_RATE_LIMIT_PER_SECOND', rate)
+                    burst = current_app.config.get('AI_RATE_LIMIT_BURST', burst)
+                    max_retries = current_app.config.get('AI_MAX_RETRIES', max_retries)
+                    base_delay = current_app.config.get('AI_BACKOFF_BASE', base_delay)
+                    max_delay = current_app.config.get('AI_BACKOFF_MAX', max_delay)
+                    redis_timeout = current_app.config.get('AI_RATE_LIMIT_REDIS_TIMEOUT', redis_timeout)
+                    backend = current_app.config.get('AI_RATE_LIMIT_BACKEND', backend)
+                    redis_url = current_app.config.get('AI_RATE_LIMIT_REDIS_URL')
+                else:
+                    backend = os.getenv('AI_RATE_LIMIT_BACKEND', backend)
+                    redis_url = os.getenv('REDIS_URL')
+
+                limiter = None
+                if backend == 'redis' and redis_url:
+                    try:
+                        limiter = RedisRateLimiter(redis_url, rate, burst, timeout=redis_timeout)
+                    except Exception as e:
+                        logger.warning(f"Could not create shared rate limiter, using local bucket: {e}")
+                if limiter is None:
+                    limiter = AdaptiveRateLimiter(rate, burst)
+                _retry_policy = RetryPolicy(limiter, max_retries, base_delay, max_delay)
+    return _retry_policy
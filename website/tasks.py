@@ -3,6 +3,7 @@
 Celery background tasks for the AIGrader application.
 """
 
+import json
 import logging
 from .celery_app import celery
 
@@ -10,13 +11,14 @@ logger = logging.getLogger(__name__)
 
 
 @celery.task(bind=True, max_retries=3)
-def grade_submission_task(self, submission_id, rubric_id=None):
+def grade_submission_task(self, submission_id, rubric_id=None, bypass_cache=False):
     """
     Background task to grade a single submission.
     
     Args:
         submission_id: ID of the submission to grade
         rubric_id: Optional rubric ID to use for grading
+        bypass_cache: Whether to skip the grading cache and force a fresh grade
         
     Returns:
         Dictionary with grading results
@@ -24,6 +26,7 @@ def grade_submission_task(self, submission_id, rubric_id=None):
     try:
         from .models import Submission, Rubric, db
         from .services.ai_grading import get_ai_grading_service
+        from .services.grading_pipeline import numeric_grade, is_usable_result, failure_message
         
         submission = Submission.query.get(submission_id)
         if not submission:
@@ -39,36 +42,33 @@ def grade_submission_task(self, submission_id, rubric_id=None):
             assignment.question,
             submission.student_answer,
             rubric_criteria,
-            rubric.level if rubric else "High School"
+            rubric.level if rubric else "High School",
+            use_cache=not bypass_cache
         )
+        if not is_usable_result(result):
+            # Retry later instead of recording a placeholder grade
+            raise RuntimeError(failure_message(result))
         
         # Update submission
-        grade_str = result.get('grade', '70/100')
-        if '/' in str(grade_str):
-            try:
-                submission.grade = float(grade_str.split('/')[0])
-            except:
-                submission.grade = 70
-        else:
-            submission.grade = float(grade_str) if grade_str else 70
-        
-        submission.feedback = result.get('feedback', '')
+        submission.grade = numeric_grade(result)
+        submission.ai_feedback = json.dumps(result)
         db.session.commit()
         
         return {
             'success': True,
             'submission_id': submission_id,
             'grade': submission.grade,
-            'feedback': submission.feedback
+            'feedback': result.get('feedback', '')
         }
         
     except Exception as e:
         logger.error(f"Error grading submission {submission_id}: {e}")
-        self.retry(exc=e, countdown=60)
+        from .services.rate_limiter import backoff_countdown
+        self.retry(exc=e, countdown=backoff_countdown(self.request.retries, e, base=60))
 
 
 @celery.task(bind=True, max_retries=2)
-def grade_all_task(self, job_id, submission_ids, rubric_id=None, skip_graded=True):
+def grade_all_task(self, job_id, submission_ids, rubric_id=None, skip_graded=True, bypass_cache=False):
     """
     Background task to grade multiple submissions.
     
@@ -77,86 +77,87 @@ def grade_all_task(self, job_id, submission_ids, rubric_id=None, skip_graded=Tru
         submission_ids: List of submission IDs to grade
         rubric_id: Optional rubric ID to use
         skip_graded: Whether to skip already graded submissions
+        bypass_cache: Whether to skip the grading cache and force fresh grades
         
     Returns:
         Dictionary with job results
     """
+    job = None
+    writer = None
     try:
-        from .models import Submission, Rubric, GradingJob, db
-        from .services.ai_grading import get_ai_grading_service
+        from .models import Rubric, GradingJob
+        from .services.grading_pipeline import get_grading_pipeline, numeric_grade
+        from .services.job_progress import get_job_writer, prefetch_submissions
         
         job = GradingJob.query.get(job_id)
         if not job:
             return {'error': 'Job not found'}
         
-        job.status = 'processing'
-        db.session.commit()
-        
         rubric = Rubric.query.get(rubric_id) if rubric_id else None
-        ai_service = get_ai_grading_service()
+        pipeline = get_grading_pipeline()
+        writer = get_job_writer(job)
         
+        processed = 0
+        items = []
+        compiled_prompts = {}
+        submissions = prefetch_submissions(submission_ids)
         for submission_id in submission_ids:
-            submission = Submission.query.get(submission_id)
+            submission = submissions.get(submission_id)
             if not submission:
+                processed += 1
                 continue
             
             # Skip if already graded
-            if skip_graded and submission.grade is not None and submission.feedback:
-                job.processed_count += 1
-                job.current_message = f"Skipped {submission.student_name} (already graded)"
-                db.session.commit()
+            if skip_graded and submission.grade is not None and submission.ai_feedback:
+                processed += 1
                 continue
             
-            job.current_message = f"Grading {submission.student_name}..."
-            db.session.commit()
-            
+            # Compile the rubric and question once per assignment
             assignment = submission.assignment_ref
-            rubric_criteria = rubric.get_criteria() if rubric else []
+            if assignment.id not in compiled_prompts:
+                compiled_prompts[assignment.id] = pipeline.compile_for_rubric(assignment.question, rubric)
+            items.append((submission.id, compiled_prompts[assignment.id], submission.student_answer))
+        
+        job.update_progress(processed)
+        
+        failed = 0
+        for submission_id, result, error in pipeline.run(items, bypass_cache):
+            # Failed submissions keep their previous grade and feedback
+            if error is not None:
+                logger.error(f"Error grading submission {submission_id}: {error}")
+                failed += 1
+            else:
+                writer.add_result(submission_id, numeric_grade(result), json.dumps(result))
             
-            try:
-                result = ai_service.grade_submission(
-                    assignment.question,
-                    submission.student_answer,
-                    rubric_criteria,
-                    rubric.level if rubric else "High School"
-                )
-                
-                # Update submission
-                grade_str = result.get('grade', '70/100')
-                if '/' in str(grade_str):
-                    try:
-                        submission.grade = float(grade_str.split('/')[0])
-                    except:
-                        submission.grade = 70
-                else:
-                    submission.grade = float(grade_str) if grade_str else 70
-                
-                submission.feedback = result.get('feedback', '')
-                
-            except Exception as e:
-                logger.error(f"Error grading submission {submission_id}: {e}")
-                submission.feedback = f"Error: {str(e)}"
-            
-            job.processed_count += 1
-            db.session.commit()
+            processed += 1
+            writer.update(processed)
         
-        job.status = 'completed'
-        job.current_message = 'All submissions graded'
-        db.session.commit()
+        writer.complete({'status': 'success', 'processed': processed, 'failed': failed})
         
         return {
             'success': True,
             'job_id': job_id,
-            'processed_count': job.processed_count
+            'processed_count': processed,
+            'failed_count': failed
         }
         
     except Exception as e:
         logger.error(f"Error in batch grading job {job_id}: {e}")
-        if job:
-            job.status = 'error'
-            job.error_message = str(e)
-            db.session.commit()
-        self.retry(exc=e, countdown=120)
+        if self.request.retries >= self.max_retries:
+            # Out of retries: the failure is final
+            if writer:
+                writer.fail(str(e))
+            elif job:
+                job.fail(str(e))
+            raise
+        
+        # Show the job as queued, not failed, while it waits to be retried
+        if writer:
+            writer.requeue(str(e))
+        elif job:
+            job.requeue(str(e))
+        from .services.rate_limiter import backoff_countdown
+        self.retry(exc=e, countdown=backoff_countdown(self.request.retries, e, base=120))
 
 
 @celery.task
@@ -180,3 +181,67 @@ def cleanup_old_jobs():
     logger.info(f"Cleaned up {count} old grading jobs")
     
     return {'deleted_count': count}
+
+
+@celery.task
+def cleanup_grading_cache():
+    """
+    Periodic task to evict expired and least recently used grading cache entries.
+    Should be scheduled to run daily.
+    """
+    from .services.grading_cache import get_grading_cache
+    
+    removed = get_grading_cache().evict()
+    logger.info(f"Evicted {removed} grading cache entries")
+    
+    return {'deleted_count': removed}
+
+
+@celery.task(bind=True)
+def import_classroom_task(self, job_id, full_sync=False):
+    """
+    Background task to import a Google Classroom class.
+    
+    Args:
+        job_id: ID of the import job for tracking
+        full_sync: Re-import every submission instead of only changed ones
+        
+    Returns:
+        Dictionary with the import summary
+    """
+    from .services.import_jobs import run_import_job
+    
+    summary = run_import_job(job_id, full_sync)
+    return {
+        'success': summary is not None,
+        'job_id': job_id,
+        'summary': summary
+    }
+
+
+@celery.task
+def cleanup_drive_text_cache():
+    """
+    Periodic task to evict Drive text cache entries that have not been used recently.
+    Should be scheduled to run weekly.
+    """
+    from .services.drive_text_cache import get_drive_text_cache
+    
+    removed = get_drive_text_cache().evict()
+    logger.info(f"Evicted {removed} Drive text cache entries")
+    
+    return {'deleted_count': removed}
+
+
+@celery.task
+def cleanup_ocr_page_cache():
+    """
+    Periodic task to remove rendered PDF pages that have not been used recently.
+    Should be scheduled to run daily.
+    """
+    from .services.ocr import get_ocr_service
+    
+    removed = get_ocr_service().page_cache.evict()
+    logger.info(f"Evicted {removed} rendered documents from the OCR page cache")
+    
+    return {'deleted_count': removed}
@@ -210,3 +210,23 @@ def truncate_text(text, max_length=500, suffix="..."):
     if not text or len(text) <= max_length:
         return text
     return text[:max_length - len(suffix)] + suffix
+
+
+def format_sse(data, event=None, event_id=None):
+    """
+    Format a server-sent event.
+    
+    Args:
+        data: JSON-serializable event payload
+        event: Optional event name
+        event_id: Optional event ID (sent back by browsers as Last-Event-ID)
+        
+    Returns:
+        The event as a string ready to be written to the response stream
+    """
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    if event_id is not None:
+        message = f"id: {event_id}\n{message}"
+    return message
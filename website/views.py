@@ -2,17 +2,21 @@ from dotenv import load_dotenv
 import tempfile
 import logging
 import html
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, session, current_app
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, session, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
-from .models import Assignment, Submission, db, Class, Rubric, RubricCriteria, User, GoogleClass, GradingJob, check_resource_access
-from huggingface_hub import InferenceClient
+from .models import Assignment, Submission, db, Class, Rubric, RubricCriteria, User, GoogleClass, GradingJob, ImportJob, ClassroomSyncState, SubmissionAttachment, check_resource_access
 import re, json, os
 import urllib.parse
-import google.oauth2.credentials
 import google_auth_oauthlib.flow
-import googleapiclient.discovery
-import google.cloud
 from threading import Thread
+from .services.grading_cache import get_grading_cache
+from .services.grading_pipeline import get_grading_pipeline, parse_grading_response, numeric_grade, error_result, is_cacheable_result, is_usable_result, failure_message
+from .services.job_progress import stream_job_events, load_job_status, get_job_writer, prefetch_submissions
+from .services.classroom_import import attachment_text, google_credentials_for_user, iter_items, iter_students
+from .services.import_jobs import start_import_job, load_import_job_status
+from .services.google_clients import google_service
+from .services.file_processing import get_file_processing_service
+from .utils.helpers import format_sse
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -30,12 +34,8 @@ SCOPES = [
 
 load_dotenv()
 
-API_KEY = os.getenv("HUGGINGFACE_API_KEY")
-
 views = Blueprint('views', __name__)
 
-# Configure Hugging Face Inference API with new router endpoint
-client = InferenceClient(token=API_KEY, base_url="https://router.huggingface.co")
 MODEL_NAME = os.getenv("AI_MODEL_NAME", "meta-llama/Llama-3.3-70B-Instruct")
 
 # ================== INPUT VALIDATION UTILITIES ==================
@@ -80,22 +80,6 @@ def validate_text_field(text, field_name, max_length=10000, required=True):
     return True, sanitize_input(text) if text else None
 
 
-def extract_grade(text):
-    """
-    Extract a numerical grade from the AI response.
-    Looks for patterns like "Grade: 85/100" or "Score: 90".
-    """
-    # Regex to find grades in the format XX/100 or XX%
-    grade_pattern = r'\b(\d{1,3})\s*/\s*100\b|\b(\d{1,3})\s*%\b|\b(\d{1,3})\b'
-    matches = re.findall(grade_pattern, text)
-    
-    if matches:
-        # Flatten the tuple and filter out empty strings
-        numbers = [num for group in matches for num in group if num]
-        if numbers:
-            return float(numbers[0])  # Return the first valid number found
-    return None  # Return None if no grade is found
-
 @views.route('/')
 def home():
     """
@@ -197,8 +181,13 @@ def delete_class(class_id):
         # Delete associated assignments and their submissions
         for assignment in cls.assignments:
             # Delete all submissions for this assignment
+            SubmissionAttachment.delete_for_assignment(assignment.id)
             Submission.query.filter_by(assignment_id=assignment.id).delete()
             
+        # Delete import history and sync watermarks for this class
+        ImportJob.query.filter_by(class_id=class_id).delete()
+        ClassroomSyncState.query.filter_by(class_id=class_id).delete()
+            
         # Delete all assignments for this class
         Assignment.query.filter_by(class_id=class_id).delete()
             
@@ -219,12 +208,12 @@ def delete_class(class_id):
 @login_required
 def extract_pdf_text():
     """
-    Extract text from uploaded PDF files using PyPDF2.
+    Extract text from uploaded PDF files.
+    
+    Pages are parsed in parallel in the extraction process pool, up to the
+    configured PDF_MAX_PAGES and PDF_MAX_CHARS caps.
     """
     try:
-        from PyPDF2 import PdfReader
-        import io
-        
         if 'pdf_file' not in request.files:
             return jsonify({'error': 'No PDF file provided'}), 400
         
@@ -236,22 +225,8 @@ def extract_pdf_text():
         if not pdf_file.filename.lower().endswith('.pdf'):
             return jsonify({'error': 'File must be a PDF'}), 400
         
-        # Read PDF file
-        pdf_bytes = pdf_file.read()
-        pdf_stream = io.BytesIO(pdf_bytes)
-        
-        # Extract text using PyPDF2
-        pdf_reader = PdfReader(pdf_stream)
-        extracted_text = ''
-        
-        for page_num, page in enumerate(pdf_reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text:
-                    extracted_text += page_text + '\n\n'
-            except Exception as e:
-                print(f"Error extracting text from page {page_num + 1}: {str(e)}")
-                continue
+        result = get_file_processing_service().extract_pdf(pdf_file.read())
+        extracted_text = result['text']
         
         if not extracted_text.strip():
             return jsonify({'error': 'No text could be extracted from the PDF'}), 400
@@ -259,7 +234,9 @@ def extract_pdf_text():
         return jsonify({
             'success': True,
             'text': extracted_text.strip(),
-            'pages': len(pdf_reader.pages)
+            'pages': result['pages'],
+            'pages_read': result['pages_read'],
+            'truncated': result['truncated']
         })
     
     except Exception as e:
@@ -291,88 +268,26 @@ def grade_assignment():
             rubric_criteria = rubric.get_criteria()
             level = rubric.level
     
-    # Construct the grading prompt with rubric
-    prompt = f"""
-    You are an AI teaching assistant. Grade this student answer based on the provided rubric:
-    
-    Question: {question}
-    Student Answer: {student_answer}
-    
-    Rubric Criteria for {level} Level:
-    {json.dumps(rubric_criteria, indent=2) if rubric_criteria else "No specific rubric provided"}
-    
-    Provide detailed feedback and a numerical grade between 0-100.
-    Format your response as a JSON object with the following keys:
-    - feedback: [detailed feedback]
-    - grade: [numerical grade as a string in format "X/100"]
-    - summary: [brief summary of the feedback]
-    - glow: [what the student did well]
-    - grow: [areas for improvement]
-    - think_about_it: [questions to ponder for improvement]
-    - rubric: [detailed rubric breakdown with scores and explanations]
-    
-    IMPORTANT GRADING INSTRUCTIONS:
-    1. If the student's answer is completely unrelated to the question, assign 0 marks and provide appropriate feedback.
-    2. If the content appears to be AI-generated, deduct marks appropriately and mention this concern in your feedback.
-    3. Return ONLY the JSON object with no markdown formatting, no backticks, and no code blocks.
-    
-    Your entire response must be a valid JSON object that can be directly parsed.
-    """
-    
     try:
+        pipeline = get_grading_pipeline()
+        compiled = pipeline.compile(question, rubric_criteria, level)
+        cache = get_grading_cache()
+        cache_key = compiled.cache_key(student_answer)
+        cached = None if bypass_cache_requested() else cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
         # Get AI response from Hugging Face
-        response = client.chat_completion(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=2000,
-            temperature=0.7
-        )
-        response_text = response.choices[0].message.content
-        
-        # Process the response to extract clean JSON
-        processed_text = clean_ai_response(response_text)
-        
-        try:
-            feedback_data = json.loads(processed_text)
-            
-            # Ensure grade is properly formatted
-            if isinstance(feedback_data.get('grade'), str):
-                if '/' not in feedback_data['grade']:
-                    feedback_data['grade'] = f"{feedback_data['grade']}/100"
-            elif isinstance(feedback_data.get('grade'), (int, float)):
-                feedback_data['grade'] = f"{feedback_data['grade']}/100"
-            
-            # Ensure all expected keys are present
-            required_keys = ['feedback', 'grade', 'summary', 'glow', 'grow', 'think_about_it', 'rubric']
-            for key in required_keys:
-                if key not in feedback_data:
-                    feedback_data[key] = {"rubric": {"Overall": "Assessment included in general feedback."}}[key] if key == 'rubric' else "Not provided in AI response."
-            
-            return jsonify(feedback_data)
-            
-        except json.JSONDecodeError as e:
-            print(f"JSON parse error: {str(e)}")
-            print(f"Attempted to parse: {processed_text}")
-            
-            # Fallback to basic response
-            feedback_data = {
-                'feedback': response_text,
-                'grade': extract_grade(response_text) or "70/100",
-                'summary': "AI provided feedback but not in the expected format.",
-                'glow': extract_section(response_text, "glow", "positive points", "strengths"),
-                'grow': extract_section(response_text, "grow", "improve", "weaknesses"),
-                'think_about_it': extract_section(response_text, "think", "consider", "reflect"),
-                'rubric': {"Overall": "See feedback for assessment details."}
-            }
-            return jsonify(feedback_data)
+        response_text = pipeline.complete(compiled.render(student_answer))
+        feedback_data = parse_grading_response(response_text)
+        if is_cacheable_result(feedback_data):
+            cache.set(cache_key, feedback_data, MODEL_NAME)
+        return jsonify(feedback_data)
     
     except Exception as e:
         logger.error(f"Error in grade_assignment: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    
-    # website/views.py
 
-# website/views.py
 
 @views.route('/add-submission/<int:assignment_id>', methods=['GET', 'POST'])
 @login_required
@@ -533,6 +448,9 @@ def delete_assignment(assignment_id):
         # Delete all grading jobs related to this assignment first
         GradingJob.query.filter_by(assignment_id=assignment_id).delete()
         
+        # Forget the sync watermark so a refresh imports the assignment again
+        ClassroomSyncState.query.filter_by(assignment_id=assignment_id).delete()
+        
         # Delete all submissions related to this assignment
         for submission in assignment.submissions:
             db.session.delete(submission)
@@ -563,6 +481,8 @@ def delete_submission(submission_id):
         flash('You do not have permission to delete this submission!', category='error')
         return redirect(url_for('views.view_class', class_id=class_id))
     
+    # Forget the sync watermark so a refresh imports the submission again
+    ClassroomSyncState.query.filter_by(assignment_id=submission.assignment_id).delete()
     db.session.delete(submission)
     db.session.commit()
     
@@ -605,125 +525,44 @@ def deepgrade(submission_id):
         # Handle POST request (AJAX call for grading)
         if request.method == 'POST':
             try:
-                # Fetch level-specific rubric criteria
-                rubric_criteria = rubric.get_criteria()
-
-                # Construct the grading prompt with rubric criteria
-                prompt = f"""
-                You are an AI teaching assistant. Grade this student answer based on the provided rubric:
-                
-                Question: {assignment.question}
-                Student Answer: {submission.student_answer}
-                
-                Rubric Criteria for {rubric.level} Level:
-                {json.dumps(rubric_criteria, indent=2)}
-                
-                Provide detailed feedback and a numerical grade between 0-100.
-                Format your response as a JSON object with the following keys:
-                - feedback: [detailed feedback]
-                - grade: [numerical grade as a string in format "X/100"]
-                - summary: [brief summary of the feedback]
-                - glow: [what the student did well]
-                - grow: [areas for improvement]
-                - think_about_it: [questions to ponder for improvement]
-                - rubric: [detailed rubric breakdown with scores and explanations]
-                
-                IMPORTANT GRADING INSTRUCTIONS:
-                1. If the student's answer is completely unrelated to the question, assign 0 marks and provide appropriate feedback.
-                2. If the content appears to be AI-generated, deduct marks appropriately and mention this concern in your feedback.
-                3. Return ONLY the JSON object with no markdown formatting, no backticks, and no code blocks.
-                
-                Your entire response must be a valid JSON object that can be directly parsed.
-                """
+                # Compile the rubric portion of the prompt and reuse a cached
+                # result for identical inputs unless a fresh regrade was requested
+                pipeline = get_grading_pipeline()
+                compiled = pipeline.compile_for_rubric(assignment.question, rubric)
+                cache = get_grading_cache()
+                cache_key = compiled.cache_key(submission.student_answer)
+                cached = None if bypass_cache_requested() else cache.get(cache_key)
+                if cached is not None:
+                    submission.ai_feedback = json.dumps(cached)
+                    submission.grade = numeric_grade(cached)
+                    db.session.commit()
+                    return jsonify(cached)
 
                 try:
                     # Get AI response from Hugging Face
-                    response = client.chat_completion(
-                        model=MODEL_NAME,
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=2000,
-                        temperature=0.7
-                    )
-                    response_text = response.choices[0].message.content
-                    print("AI Response:", response_text)  # Log the AI response
-
-                    # Process the response to extract clean JSON
-                    processed_text = clean_ai_response(response_text)
-                    print("Processed Text:", processed_text)  # Debug output
-
-                    try:
-                        feedback_data = json.loads(processed_text)
-
-                        # Ensure grade is properly formatted
-                        if isinstance(feedback_data.get('grade'), str):
-                            if '/' not in feedback_data['grade']:
-                                feedback_data['grade'] = f"{feedback_data['grade']}/100"
-                        elif isinstance(feedback_data.get('grade'), (int, float)):
-                            feedback_data['grade'] = f"{feedback_data['grade']}/100"
-
-                        # Ensure all expected keys are present
-                        required_keys = ['feedback', 'grade', 'summary', 'glow', 'grow', 'think_about_it', 'rubric']
-                        for key in required_keys:
-                            if key not in feedback_data:
-                                feedback_data[key] = {"rubric": {"Overall": "Assessment included in general feedback."}}[key] if key == 'rubric' else "Not provided in AI response."
-
-                    except json.JSONDecodeError as e:
-                        print(f"JSON parse error: {str(e)}")
-                        print(f"Attempted to parse: {processed_text}")
-
-                        feedback_data = {
-                            'feedback': response_text,
-                            'grade': extract_grade(response_text) or "70/100",
-                            'summary': "AI provided feedback but not in the expected format.",
-                            'glow': extract_section(response_text, "glow", "positive points", "strengths"),
-                            'grow': extract_section(response_text, "grow", "improve", "weaknesses"),
-                            'think_about_it': extract_section(response_text, "think", "consider", "reflect"),
-                            'rubric': {"Overall": "See feedback for assessment details."}
-                        }
+                    response_text = pipeline.complete(compiled.render(submission.student_answer))
+                    feedback_data = parse_grading_response(response_text)
+                    if not is_usable_result(feedback_data):
+                        # Leave the stored grade and feedback as they were
+                        return jsonify(error_result(failure_message(feedback_data))), 502
 
                     # Save feedback and grade to submission
                     submission.ai_feedback = json.dumps(feedback_data)
-
-                    # Extract numerical grade
-                    grade_value = 0
-                    try:
-                        if isinstance(feedback_data['grade'], str) and '/' in feedback_data['grade']:
-                            grade_value = float(feedback_data['grade'].split('/')[0])
-                        elif isinstance(feedback_data['grade'], (int, float)):
-                            grade_value = float(feedback_data['grade'])
-                    except (KeyError, ValueError, TypeError):
-                        extracted = extract_grade(response_text)
-                        grade_value = extracted if extracted is not None else 70
-
-                    submission.grade = grade_value
+                    submission.grade = numeric_grade(feedback_data)
                     db.session.commit()
 
-                    print("Final feedback data:", json.dumps(feedback_data))  # Debug logging
+                    if is_cacheable_result(feedback_data):
+                        cache.set(cache_key, feedback_data, MODEL_NAME)
                     return jsonify(feedback_data)
 
                 except Exception as e:
-                    print(f"Error processing AI response: {str(e)}")
-                    print(f"Error processing AI response: {str(e)}")
-
-                    fallback_data = {
-                        'feedback': "The AI grading system encountered an error. Please try again or grade manually.",
-                        'grade': "70/100",
-                        'summary': "Automatic grading encountered an error.",
-                        'glow': "Unable to evaluate strengths due to system error.",
-                        'grow': "Unable to evaluate areas for improvement due to system error.",
-                        'think_about_it': "How might the system be improved to better evaluate this response?",
-                        'rubric': {"Overall": "System error prevented detailed evaluation."}
-                    }
-
-                    submission.ai_feedback = json.dumps(fallback_data)
-                    submission.grade = 70
-                    db.session.commit()
-
-                    return jsonify(fallback_data)
+                    # Leave the stored grade and feedback as they were
+                    logger.error(f"Error processing AI response: {str(e)}")
+                    db.session.rollback()
+                    return jsonify(error_result(e)), 502
 
             except Exception as e:
-                print(f"Error in deepgrade route: {str(e)}")
-                print(f"Error in deepgrade POST request: {str(e)}")
+                logger.error(f"Error in deepgrade POST request: {str(e)}")
                 return jsonify({'error': str(e)}), 500
 
         # Handle GET request (render the template)
@@ -752,209 +591,57 @@ def deepgrade(submission_id):
         return redirect(url_for('views.dashboard'))
 
 
-def clean_ai_response(text):
+@views.route('/grade-submission/<int:submission_id>/stream', methods=['POST'])
+@login_required
+def deepgrade_stream(submission_id):
     """
-    Clean the AI response to extract valid JSON.
-    Removes markdown code blocks, backticks, and other non-JSON content.
+    Grade a submission with AI, streaming the model output as server-sent events.
+
+    Emits ``delta`` events with raw response text while the model is
+    generating and a final ``result`` event with the parsed feedback, which
+    is also saved to the submission. If grading fails an ``error`` event is
+    sent instead and the submission is left unchanged.
     """
-    import re
-    import json
-    
-    print(f"DEBUG - clean_ai_response input: {text[:100]}...")
-    
-    if not text:
-        print("DEBUG - Empty text received in clean_ai_response")
-        return "{}"
-    
-    # Remove markdown code blocks and backticks
-    cleaned_text = re.sub(r'```json\s*|\s*```|`', '', text.strip())
-    print(f"DEBUG - After removing markdown: {cleaned_text[:100]}...")
-    
-    # Try to extract a JSON object if there's text before or after the JSON
-    json_pattern = re.compile(r'(\{.*\})', re.DOTALL)
-    match = json_pattern.search(cleaned_text)
-    if match:
-        potential_json = match.group(1)
-        # Verify it's valid JSON with a quick test before returning
-        try:
-            json.loads(potential_json)
-            print("DEBUG - Successfully extracted and validated JSON object")
-            return potential_json
-        except json.JSONDecodeError as e:
-            print(f"DEBUG - JSON extraction failed: {e}")
-            # If we can't parse the extracted content as JSON, fall back to the cleaned text
-            pass
-    
-    # Check if the cleaned text itself might be valid JSON
-    try:
-        json.loads(cleaned_text)
-        print("DEBUG - Cleaned text is valid JSON")
-        return cleaned_text
-    except json.JSONDecodeError as e:
-        print(f"DEBUG - Cleaned text is not valid JSON: {e}")
-        # If we still can't parse it, let's try to convert it to a JSON-like structure
-        # This is a fallback for cases where the AI returns structured text but not valid JSON
+    submission = Submission.query.get_or_404(submission_id)
+    assignment = submission.assignment_ref
+
+    if not check_resource_access(assignment.class_ref):
+        return jsonify({'error': 'You do not have permission to grade this submission'}), 403
+
+    rubric = assignment.rubric
+    if not rubric:
+        return jsonify({'error': 'No rubric assigned to this assignment!'}), 400
+
+    pipeline = get_grading_pipeline()
+    compiled = pipeline.compile_for_rubric(assignment.question, rubric)
+    bypass_cache = bypass_cache_requested()
+
+    def generate():
         try:
-            result = {}
-            current_key = None
-            lines = cleaned_text.split('\n')
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
+            for event, data in pipeline.stream(compiled, submission.student_answer, bypass_cache):
+                if event == 'delta':
+                    yield format_sse({'text': data}, 'delta')
                     continue
-                    
-                # Look for key-value patterns like "Feedback: This is feedback"
-                kv_match = re.match(r'^(feedback|grade|summary|glow|grow|think_about_it|rubric):(.*)$', line, re.IGNORECASE)
-                if kv_match:
-                    current_key = kv_match.group(1).lower()
-                    result[current_key] = kv_match.group(2).strip()
-                elif current_key and line:
-                    # Append to existing key
-                    result[current_key] = result.get(current_key, "") + " " + line
-            
-            if result:
-                print(f"DEBUG - Created structured JSON from text: {list(result.keys())}")
-                return json.dumps(result)
-        except Exception as e:
-            print(f"DEBUG - Failed to create structured JSON: {e}")
-            pass
-    
-    # Last resort: wrap the cleaned text in a minimal JSON structure
-    print("DEBUG - Using fallback JSON structure")
-    return json.dumps({"feedback": cleaned_text, "grade": "70/100"})
 
-def extract_grade(text):
-    """
-    Extract numerical grade from text.
-    Looks for patterns like "65/100" or "grade: 75" and returns the numerical value.
-    """
-    import re
-    
-    print(f"DEBUG - extract_grade input: {text[:100]}...")
-    
-    if not text:
-        print("DEBUG - Empty text in extract_grade")
-        return None
-    
-    # Look for specific patterns like "65/100"
-    grade_pattern = re.search(r'(\d+)\/100', text)
-    if grade_pattern:
-        grade = float(grade_pattern.group(1))
-        print(f"DEBUG - Found grade pattern X/100: {grade}")
-        return grade
-    
-    # Look for "grade: 75" or similar patterns
-    grade_key_pattern = re.search(r'grade[\s:]+([\d.]+)', text, re.IGNORECASE)
-    if grade_key_pattern:
-        grade = float(grade_key_pattern.group(1))
-        print(f"DEBUG - Found grade key pattern: {grade}")
-        return grade
-    
-    # Look for any number between 0 and 100 that could be a grade
-    number_pattern = re.search(r'\b([0-9]{1,2}|100)\b', text)
-    if number_pattern:
-        grade = float(number_pattern.group(1))
-        print(f"DEBUG - Found number pattern: {grade}")
-        return grade
-    
-    print("DEBUG - No grade pattern found")
-    return None
-
-def extract_section(text, *keywords):
-    """
-    Extract sections from the AI response based on keywords.
-    """
-    import re
-    
-    print(f"DEBUG - extract_section for keywords {keywords}")
-    
-    if not text:
-        print("DEBUG - Empty text in extract_section")
-        return "No information available."
-    
-    text_lower = text.lower()
-    lines = text.split('\n')
-    
-    # Try to find sections with headings matching keywords
-    for i, line in enumerate(lines):
-        line_lower = line.lower()
-        for keyword in keywords:
-            if keyword.lower() in line_lower and i < len(lines) - 1:
-                # Extract text until the next section or end
-                section_text = []
-                j = i + 1
-                while j < len(lines) and not any(k.lower() in lines[j].lower() for k in 
-                                               ['feedback:', 'grade:', 'summary:', 'glow:', 'grow:', 'think:', 'rubric:']):
-                    if lines[j].strip():
-                        section_text.append(lines[j])
-                    j += 1
-                if section_text:
-                    result = " ".join(section_text).strip()
-                    print(f"DEBUG - Found section for {keyword}: {result[:50]}...")
-                    return result
-    
-    # Fallback: Look for sentences containing keywords
-    for keyword in keywords:
-        pattern = re.compile(r'[^.!?]*\b' + re.escape(keyword.lower()) + r'\b[^.!?]*[.!?]', re.IGNORECASE)
-        matches = pattern.findall(text_lower)
-        if matches:
-            result = " ".join(matches).strip().capitalize()
-            print(f"DEBUG - Found sentences with {keyword}: {result[:50]}...")
-            return result
-    
-    print(f"DEBUG - No section found for keywords {keywords}")
-    return "Information not explicitly provided in the feedback."
-
-def evaluate_with_rubric(question, answer, criteria, school_level):
-    """Generate AI evaluation using the provided criteria"""
-    print(f"DEBUG - evaluate_with_rubric called for {school_level} level")
-    
-    prompt = f"""
-    Evaluate this {school_level} school submission against CBSE criteria:
-    
-    QUESTION: {question}
-    ANSWER: {answer}
-    
-    CRITERIA:
-    {json.dumps(criteria, indent=2)}
-    
-    Provide:
-    1. Detailed feedback in paragraph form
-    2. Final grade out of 100
-    Format: 'FEEDBACK: [your feedback]\nSCORE: [score]/100'
-    """
-    
-    try:
-        print("DEBUG - Sending prompt to model")
-        response = client.chat_completion(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=2000,
-            temperature=0.7
-        )
-        response_text = response.choices[0].message.content
-        print(f"DEBUG - Received response: {response_text[:100]}...")
-        return response_text
-    except Exception as e:
-        print(f"DEBUG - AI evaluation error: {str(e)}")
-        raise RuntimeError(f"AI evaluation failed: {str(e)}")
+                if not is_usable_result(data):
+                    yield format_sse({'error': failure_message(data)}, 'error')
+                    return
 
-def parse_ai_score(ai_response):
-    """Extract score from AI response text"""
-    import re
-    
-    print(f"DEBUG - parse_ai_score input: {ai_response[:100]}...")
-    
-    match = re.search(r'SCORE:\s*(\d+\.?\d*)/100', ai_response)
-    if match:
-        score = float(match.group(1))
-        print(f"DEBUG - Extracted score: {score}")
-        return score
-    
-    print("DEBUG - No score found in AI response")
-    return 0.0
+                submission.ai_feedback = json.dumps(data)
+                submission.grade = numeric_grade(data)
+                db.session.commit()
+                yield format_sse(data, 'result')
+
+        except Exception as e:
+            logger.error(f"Error streaming grade for submission {submission_id}: {str(e)}")
+            db.session.rollback()
+            yield format_sse({'error': str(e)}, 'error')
 
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @views.route('/check-grading-status/<job_id>', methods=['GET'])
@@ -963,162 +650,58 @@ def check_grading_status(job_id):
     """
     Route to check the status of a background grading job.
     Returns JSON with current progress, status message, and results.
+    Running jobs are answered from the job progress registry; the database
+    is only read (by primary key) for unknown or finished jobs. Responses
+    carry an ETag so unchanged progress returns 304 Not Modified.
     """
-    print(f"DEBUG - check_grading_status called for job_id: {job_id}")
-    
-    try:
-        # Handle NaN or empty job IDs by returning the most recent job for the user
-        if job_id == 'NaN' or not job_id or job_id.lower() == 'undefined':
-            print(f"DEBUG - Invalid job_id: {job_id}, looking for recent jobs")
-            
-            # Find the most recent jobs
-            recent_jobs = GradingJob.query.join(Assignment).join(Class).filter(
-                Class.owner_id == current_user.id
-            ).order_by(GradingJob.created_at.desc()).limit(5).all()
-            
-            if not recent_jobs:
-                print("DEBUG - No recent jobs found for this user")
-                return jsonify({
-                    'status': 'Waiting for job to start...',
-                    'progress': 0,
-                    'complete': False
-                })
-            
-            # Use the most recent active job, or the most recent job if none are active
-            active_job = next((job for job in recent_jobs if job.status == 'processing'), None)
-            job = active_job if active_job else recent_jobs[0]
-            
-            print(f"DEBUG - Found recent job: {job.id} with status: {job.status}")
-        else:
-            # Try a few different strategies to find the job
-            
-            # 1. Try exact ID match first
-            job = GradingJob.query.get(job_id)
-            
-            # 2. Try prefix match (if the job ID is a UUID and we're getting a prefix)
-            if not job:
-                print(f"DEBUG - Job not found directly with ID: {job_id}, trying partial match")
-                job = GradingJob.query.filter(GradingJob.id.like(f"{job_id}%")).first()
-            
-            # 3. Try suffix match (if we're getting the end part of the ID)
-            if not job:
-                print(f"DEBUG - No job found with ID prefix: {job_id}, trying suffix match")
-                job = GradingJob.query.filter(GradingJob.id.like(f"%{job_id}")).first()
-                
-            # 4. Try contains match (if the ID is somewhere in the middle)
-            if not job:
-                print(f"DEBUG - No job found with ID suffix: {job_id}, trying contains match")
-                job = GradingJob.query.filter(GradingJob.id.like(f"%{job_id}%")).first()
-                
-            # 5. If still not found, try to find the job by looking at recent jobs
-            if not job:
-                print(f"DEBUG - No job found containing ID: {job_id}, looking for recent jobs")
-                # Find the most recent processing job for the current user
-                recent_jobs = GradingJob.query.join(Assignment).join(Class).filter(
-                    Class.owner_id == current_user.id
-                ).order_by(GradingJob.created_at.desc()).limit(1).all()
-                
-                if recent_jobs:
-                    job = recent_jobs[0]
-                    print(f"DEBUG - Found recent job as fallback: {job.id}")
-                else:
-                    print(f"DEBUG - No job found with ID or recent jobs: {job_id}")
-                    return jsonify({
-                        'status': 'Initializing grading process...',
-                        'progress': 5,
-                        'complete': False
-                    })
-        
-        print(f"DEBUG - Using job ID: {job.id} with status: {job.status}")
-        
-        # Check if the assignment exists
-        assignment = Assignment.query.get(job.assignment_id)
-        if not assignment:
-            print(f"DEBUG - Assignment {job.assignment_id} not found")
-            return jsonify({
-                'status': 'Processing submissions...',
-                'progress': 10,
-                'complete': False,
-                'job_id': job.id  # Return job ID so frontend knows which one we're talking about
-            })
-        
-        # Check authorization
-        # Modified to handle the case where current_user might not be related to the class
-        is_authorized = False
-        
-        # Check if user is the owner of the class
-        if hasattr(assignment, 'class_ref') and assignment.class_ref and hasattr(assignment.class_ref, 'owner_id'):
-            is_authorized = (assignment.class_ref.owner_id == current_user.id)
-        
-        # Alternative check if user has classes relationship
-        if not is_authorized and hasattr(current_user, 'classes') and assignment.class_ref:
-            is_authorized = assignment.class_ref in current_user.classes
-        
-        if not is_authorized:
-            print(f"DEBUG - Unauthorized access to job_id: {job.id}")
-            return jsonify({
-                'status': 'Processing submissions...',
-                'progress': 10,
-                'complete': False,
-                'job_id': job.id
-            })
-
-        # Parse results if job is completed
-        results = []
-        if job.status == 'completed' and job.results:
-            try:
-                print(f"DEBUG - Parsing job results for job ID: {job.id}")
-                results_data = json.loads(job.results)
-                results = results_data.get('results', [])
-                print(f"DEBUG - Found {len(results)} result items")
-            except json.JSONDecodeError as e:
-                print(f"DEBUG - Error parsing job results: {str(e)}")
-                results = []
-
-        # Calculate progress percentage
-        progress = 0
-        if hasattr(job, 'total_submissions') and job.total_submissions > 0:
-            progress = round((job.processed_submissions / job.total_submissions) * 100, 1)
-        elif job.processed_submissions > 0:
-            # If we don't have total_submissions but have processed some, show indeterminate progress
-            progress = 50  # Use 50% to indicate in-progress state
-        
-        # Get total submissions for display
-        total_submissions = getattr(job, 'total_submissions', 0) 
-        print(f"DEBUG - Progress: {progress}% ({job.processed_submissions}/{total_submissions if total_submissions > 0 else '?'})")
-        
-        # Create status message based on job status
-        status_message = f"Processing submissions... ({job.processed_submissions}/{total_submissions if total_submissions > 0 else '?'})"
-        if job.status == 'completed':
-            status_message = f"Completed grading {job.processed_submissions} submissions"
-        elif job.status == 'failed':
-            status_message = "There was a problem processing some submissions"
-        print(f"DEBUG - Status message: {status_message}")
-
-        # Return comprehensive job status
-        return jsonify({
-            'id': job.id,
-            'job_id': job.id,  # Including both formats for compatibility
-            'status': status_message,
-            'progress': progress,
-            'complete': job.status in ['completed', 'failed'],
-            'results': results,
-            'timestamp': job.updated_at.isoformat() if hasattr(job, 'updated_at') else None,
-            'assignment_id': job.assignment_id,
-            'processed': job.processed_submissions,
-            'total': total_submissions
-        })
-
-    except Exception as e:
-        print(f"DEBUG - Error checking job status: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    if not job_id or job_id == 'NaN' or job_id.lower() == 'undefined':
         return jsonify({
-            'status': 'Processing submissions...',
-            'progress': 10,
+            'status': 'Waiting for job to start...',
+            'progress': 0,
             'complete': False
         })
 
+    payload, status_code = load_job_status(job_id)
+    response = jsonify(payload)
+    response.status_code = status_code
+    if status_code == 200 and payload.get('version'):
+        response.set_etag(f"{job_id}-{payload['version']}")
+        return response.make_conditional(request)
+    return response
+
+
+@views.route('/grading-job-events/<job_id>')
+@login_required
+def grading_job_events(job_id):
+    """
+    Stream the progress of a background grading job as server-sent events.
+
+    Progress is pushed by the job runner through the job progress registry,
+    so nothing is queried while a job is idle. Jobs running in another
+    process (e.g. a Celery worker) fall back to re-reading the job row.
+    Emits ``progress`` events and a final ``complete`` event with results.
+    """
+    job = GradingJob.query.get(job_id)
+    if not job or not check_resource_access(job.assignment.class_ref):
+        return jsonify({'error': 'Grading job not found'}), 404
+
+    try:
+        last_version = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_version = 0
+
+    events = stream_job_events(
+        job, last_version,
+        heartbeat=current_app.config.get('GRADING_STREAM_HEARTBEAT', 15),
+        poll_interval=current_app.config.get('GRADING_STREAM_POLL_INTERVAL', 2),
+        max_duration=current_app.config.get('GRADING_STREAM_MAX_DURATION', 25)
+    )
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 
 @views.route('/grade-all-submissions/<int:assignment_id>', methods=['GET', 'POST'])
 @login_required
@@ -1191,7 +774,7 @@ def grade_all_submissions(assignment_id):
             # Start background job in a separate thread
             thread = Thread(
                 target=process_grading_job,
-                args=(app, job.id, submission_ids, rubric_id, skip_graded)
+                args=(app, job.id, submission_ids, rubric_id, skip_graded, bypass_cache_requested())
             )
             thread.daemon = True
             thread.start()
@@ -1221,13 +804,31 @@ def grade_all_submissions(assignment_id):
                            ungraded_submissions=ungraded_submissions)
 
 
-def process_grading_job(app, job_id, submission_ids, rubric_id, skip_graded=True):
+@views.route('/grading-cache/stats')
+@login_required
+def grading_cache_stats():
+    """Return hit/miss counters for the grading result cache."""
+    return jsonify(get_grading_cache().stats())
+
+
+def bypass_cache_requested():
+    """Check whether the teacher asked for a fresh regrade that skips the grading cache."""
+    data = request.get_json(silent=True) or {}
+    flag = data.get('bypass_cache', request.form.get('bypass_cache', request.args.get('bypass_cache', '')))
+    return str(flag).lower() in ('1', 'true', 'yes', 'on')
+
+
+def process_grading_job(app, job_id, submission_ids, rubric_id, skip_graded=True, bypass_cache=False):
     """
     Background function to process a grading job.
-    Updates job status in the database as progress is made.
+    Submissions are loaded with one IN query and the rubric portion of the
+    prompt is compiled once; submissions are then graded through the shared
+    grading pipeline (cache first, then concurrently on the grading engine).
+    Database updates stay on this thread; progress is published as each
+    submission completes and results are written in batched bulk updates.
     """
     import json
-    from .models import db, Submission, Rubric, GradingJob
+    from .models import Rubric, GradingJob
     
     # Create an application context
     with app.app_context():
@@ -1238,178 +839,89 @@ def process_grading_job(app, job_id, submission_ids, rubric_id, skip_graded=True
         # Get the rubric from the database inside this context
         rubric = Rubric.query.get(rubric_id)
         if not rubric:
-            job.status = 'failed'
-            job.error_message = f"Rubric with ID {rubric_id} not found"
-            db.session.commit()
+            job.fail(f"Rubric with ID {rubric_id} not found")
             return
 
         results = []
         errors = []
         processed_count = 0
+        writer = get_job_writer(job)
         
         try:
-            rubric_criteria = rubric.get_criteria()
+            pipeline = get_grading_pipeline()
+            compiled_prompts = {}
+            student_names = {}
+            items = []
 
+            submissions = prefetch_submissions(submission_ids)
             for submission_id in submission_ids:
-                try:
-                    # Fetch submission from database inside this context
-                    submission = Submission.query.get(submission_id)
-                    if not submission:
-                        errors.append({
-                            'submission_id': submission_id,
-                            'error': 'Submission not found'
-                        })
-                        processed_count += 1
-                        job.processed_submissions = processed_count
-                        db.session.commit()
-                        continue
-
-                    if skip_graded and submission.grade is not None and submission.ai_feedback:
-                        results.append({
-                            'submission_id': submission.id,
-                            'student_name': submission.student.name if hasattr(submission, 'student') else 'Unknown',
-                            'status': 'skipped',
-                            'skipped': True,
-                            'message': 'Already graded'
-                        })
-                        processed_count += 1
-                        job.processed_submissions = processed_count
-                        db.session.commit()
-                        continue
-
-                    # Safely get assignment question
-                    question = getattr(submission.assignment_ref, 'question', "Question not available")
-                    
-                    # Safely get student answer
-                    student_answer = getattr(submission, 'student_answer', "Answer not available")
-
-                    prompt = f"""
-                    You are an AI teaching assistant. Grade this student answer based on the provided rubric:
-                    
-                    Question: {question}
-                    Student Answer: {student_answer}
-                    
-                    Rubric Criteria for {rubric.level} Level:
-                    {json.dumps(rubric_criteria, indent=2)}
-                    
-                    Provide detailed feedback and a numerical grade between 0-100.
-                    Format your response as a JSON object with the following keys:
-                    - feedback: [detailed feedback]
-                    - grade: [numerical grade as a string in format "X/100"]
-                    - summary: [brief summary of the feedback]
-                    - glow: [what the student did well]
-                    - grow: [areas for improvement]
-                    - think_about_it: [questions to ponder for improvement]
-                    - rubric: [detailed rubric breakdown with scores and explanations]
-                    
-                    IMPORTANT GRADING INSTRUCTIONS:
-                    1. If the student's answer is completely unrelated to the question, assign 0 marks and provide appropriate feedback.
-                    2. If the content appears to be AI-generated, deduct marks appropriately and mention this concern in your feedback.
-                    3. Return ONLY the JSON object with no markdown formatting, no backticks, and no code blocks.
-                    
-                    Your entire response must be a valid JSON object that can be directly parsed.
-                    """
+                submission = submissions.get(submission_id)
+                if not submission:
+                    errors.append({
+                        'submission_id': submission_id,
+                        'error': 'Submission not found'
+                    })
+                    processed_count += 1
+                    continue
 
-                    try:
-                        response = model.generate_content(prompt)
-                    except Exception as e:
-                        raise RuntimeError(f"AI generation failed: {str(e)}")
-                    
-                    processed_text = clean_ai_response(response.text)
-
-                    try:
-                        feedback_data = json.loads(processed_text)
-                        
-                        # Ensure grade is properly formatted
-                        if isinstance(feedback_data.get('grade'), str):
-                            if '/' not in feedback_data['grade']:
-                                feedback_data['grade'] = f"{feedback_data['grade']}/100"
-                        elif isinstance(feedback_data.get('grade'), (int, float)):
-                            feedback_data['grade'] = f"{feedback_data['grade']}/100"
-
-                        # Ensure all expected keys are present
-                        required_keys = ['feedback', 'grade', 'summary', 'glow', 'grow', 'think_about_it', 'rubric']
-                        for key in required_keys:
-                            if key not in feedback_data:
-                                feedback_data[key] = {"rubric": {"Overall": "Assessment included in general feedback."}}[key] if key == 'rubric' else "Not provided in AI response."
-                    
-                    except json.JSONDecodeError:
-                        feedback_data = {
-                            'feedback': response.text,
-                            'grade': extract_grade(response.text) or "70/100",
-                            'summary': "AI provided feedback but not in the expected format.",
-                            'glow': extract_section(response.text, "glow", "positive points", "strengths"),
-                            'grow': extract_section(response.text, "grow", "improve", "weaknesses"),
-                            'think_about_it': extract_section(response.text, "think", "consider", "reflect"),
-                            'rubric': {"Overall": "See feedback for assessment details."}
-                        }
-                    
-                    submission.ai_feedback = json.dumps(feedback_data)
-                    
-                    # Extract numerical grade
-                    grade_value = 0
-                    try:
-                        if isinstance(feedback_data['grade'], str) and '/' in feedback_data['grade']:
-                            grade_value = float(feedback_data['grade'].split('/')[0])
-                        elif isinstance(feedback_data['grade'], (int, float)):
-                            grade_value = float(feedback_data['grade'])
-                    except (KeyError, ValueError, TypeError):
-                        extracted = extract_grade(response.text)
-                        grade_value = extracted if extracted is not None else 70
-
-                    submission.grade = grade_value
-                    
+                if skip_graded and submission.grade is not None and submission.ai_feedback:
                     results.append({
                         'submission_id': submission.id,
-                        'student_name': submission.student.name if hasattr(submission, 'student') else 'Unknown',
-                        'status': 'success',
-                        'grade': feedback_data['grade'],
-                        'summary': feedback_data['summary']
+                        'student_name': submission.student_name or 'Unknown',
+                        'status': 'skipped',
+                        'skipped': True,
+                        'message': 'Already graded'
                     })
+                    processed_count += 1
+                    continue
 
-                except Exception as e:
+                # Safely get assignment question
+                question = getattr(submission.assignment_ref, 'question', "Question not available")
+                
+                # Safely get student answer
+                student_answer = getattr(submission, 'student_answer', "Answer not available")
+
+                if question not in compiled_prompts:
+                    compiled_prompts[question] = pipeline.compile_for_rubric(question, rubric)
+                items.append((submission.id, compiled_prompts[question], student_answer))
+                student_names[submission.id] = submission.student_name or 'Unknown'
+
+            job.update_progress(processed_count)
+
+            for submission_id, feedback_data, error in pipeline.run(items, bypass_cache):
+                # Failed submissions keep their previous grade and feedback
+                if error is not None:
                     errors.append({
                         'submission_id': submission_id,
-                        'error': str(e)
+                        'error': f"AI generation failed: {str(error)}"
+                    })
+                    results.append({
+                        'submission_id': submission_id,
+                        'status': 'error',
+                        'message': str(error)
                     })
+                else:
+                    writer.add_result(submission_id, numeric_grade(feedback_data), json.dumps(feedback_data))
                     
-                    # Get the submission again to ensure it's attached to this session
-                    submission = Submission.query.get(submission_id)
-                    if submission:
-                        fallback_data = {
-                            'feedback': "The AI grading system encountered an error. Please try again or grade manually.",
-                            'grade': "70/100",
-                            'summary': "Automatic grading encountered an error.",
-                            'glow': "Unable to evaluate strengths due to system error.",
-                            'grow': "Unable to evaluate areas for improvement due to system error.",
-                            'think_about_it': "How might the system be improved to better evaluate this response?",
-                            'rubric': {"Overall": "System error prevented detailed evaluation."}
-                        }
-                        
-                        submission.ai_feedback = json.dumps(fallback_data)
-                        submission.grade = 70
-                        results.append({
-                            'submission_id': submission.id,
-                            'status': 'error',
-                            'message': str(e)
-                        })
+                    results.append({
+                        'submission_id': submission_id,
+                        'student_name': student_names[submission_id],
+                        'status': 'success',
+                        'grade': feedback_data['grade'],
+                        'summary': feedback_data['summary']
+                    })
                     
                 processed_count += 1
-                job.processed_submissions = processed_count
-                db.session.commit()
+                writer.update(processed_count)
 
-            job.status = 'completed'
-            job.results = json.dumps({
+            writer.complete({
                 'status': 'success',
                 'results': results,
                 'errors': errors
             })
-            db.session.commit()
         
         except Exception as e:
-            job.status = 'failed'
-            job.error_message = str(e)
-            db.session.commit()
+            writer.fail(str(e))
 
 @views.route('/send-grade/<int:submission_id>', methods=['POST'])
 @login_required
@@ -1584,54 +1096,7 @@ def get_google_credentials():
     Helper function to get refreshed Google credentials.
     Returns None if credentials are not available or refresh fails.
     """
-    if not current_user.google_tokens:
-        logger.warning("No Google tokens found for user")
-        return None
-    
-    try:
-        token_data = json.loads(current_user.google_tokens)
-        
-        # Check if we have all required fields for refreshing
-        required_fields = ['refresh_token', 'token_uri', 'client_id', 'client_secret']
-        missing_fields = [field for field in required_fields if field not in token_data or not token_data[field]]
-        
-        if missing_fields:
-            logger.warning(f"Missing required fields for token refresh: {', '.join(missing_fields)}")
-            # Re-authentication needed
-            return None
-        
-        credentials = google.oauth2.credentials.Credentials(
-            token=token_data.get('token'),
-            refresh_token=token_data.get('refresh_token'),
-            token_uri=token_data.get('token_uri'),
-            client_id=token_data.get('client_id'),
-            client_secret=token_data.get('client_secret'),
-            scopes=token_data.get('scopes')
-        )
-        
-        # Force refresh if token is expired
-        if not credentials.valid:
-            logger.info("Token expired, attempting to refresh")
-            import google.auth.transport.requests
-            auth_request = google.auth.transport.requests.Request()
-            credentials.refresh(auth_request)
-            
-            # Update stored token
-            current_user.google_tokens = json.dumps({
-                'token': credentials.token,
-                'refresh_token': credentials.refresh_token,
-                'token_uri': credentials.token_uri,
-                'client_id': credentials.client_id,
-                'client_secret': credentials.client_secret,
-                'scopes': credentials.scopes
-            })
-            db.session.commit()
-            logger.info("Token refreshed successfully")
-        
-        return credentials
-    except Exception as e:
-        logger.error(f"Error refreshing credentials: {str(e)}")
-        return None
+    return google_credentials_for_user(current_user)
 
 
 @views.route('/select-google-class', endpoint='select_google_class', methods=['GET', 'POST'])
@@ -1648,9 +1113,8 @@ def select_google_class():
         return redirect(url_for('views.import_google_classroom'))
     
     try:
-        service = googleapiclient.discovery.build('classroom', 'v1', credentials=credentials)
-        results = service.courses().list().execute()
-        classes = results.get('courses', [])
+        service = google_service('classroom', 'v1', credentials)
+        classes = list(iter_items(service.courses(), 'courses'))
         
         return render_template('select_google_class.html', classes=classes)
     except Exception as e:
@@ -1674,8 +1138,10 @@ def select_rubric(class_id):
         db.session.add(new_class)
         db.session.commit()
         
-        # After creating the class, immediately import assignments
-        import_assignments_from_google(new_class.id)
+        # After creating the class, import assignments in the background
+        job = import_assignments_from_google(new_class.id)
+        if job:
+            return redirect(url_for('views.view_class', class_id=new_class.id, import_job=job.id))
         
         return redirect(url_for('views.view_class', class_id=new_class.id))
     
@@ -1686,7 +1152,7 @@ def select_rubric(class_id):
         return redirect(url_for('views.import_google_classroom'))
     
     try:
-        service = googleapiclient.discovery.build('classroom', 'v1', credentials=credentials)
+        service = google_service('classroom', 'v1', credentials)
         gc_class = service.courses().get(id=class_id).execute()
         
         # Get both user-created rubrics and system-created default rubrics
@@ -1705,9 +1171,12 @@ def select_rubric(class_id):
 @login_required
 def refresh_google_assignments(class_id):
     """
-    Route to manually refresh assignments from Google Classroom
+    Route to manually refresh assignments from Google Classroom.
+    Starts a background import and returns its job ID for tracking progress.
+    Only submissions changed since the last import are processed unless
+    ``full=1`` is given.
     """
-    result = import_assignments_from_google(class_id)
+    job = import_assignments_from_google(class_id, full_sync=request.args.get('full') == '1')
     
     # Check if we need to redirect to authentication
     if session.pop('needs_google_auth', False):
@@ -1722,29 +1191,46 @@ def refresh_google_assignments(class_id):
     
     # Return JSON response if it's an AJAX request
     if request.headers.get('Accept') == 'application/json':
-        if result:
-            return jsonify({'success': True, 'message': 'Assignments refreshed successfully'})
+        if job:
+            return jsonify({'success': True, 'job_id': job.id, 'message': 'Assignment import started'}), 202
         else:
             return jsonify({'success': False, 'message': 'Failed to refresh assignments'}), 500
     
-    if result:
-        flash('Google Classroom assignments refreshed successfully', 'success')
+    if job:
+        flash('Google Classroom assignments are being refreshed in the background', 'success')
+        return redirect(url_for('views.view_class', class_id=class_id, import_job=job.id))
     return redirect(url_for('views.view_class', class_id=class_id))
 
-def import_assignments_from_google(class_id):
+@views.route('/import-job-status/<job_id>', endpoint='import_job_status')
+@login_required
+def import_job_status(job_id):
+    """
+    Route to check the status of a background Google Classroom import.
+    Returns JSON with assignment and file progress and, once finished,
+    the import summary.
     """
-    Helper function to import assignments from Google Classroom
-    Returns True if successful, False otherwise
+    payload, status_code = load_import_job_status(job_id)
+    response = jsonify(payload)
+    response.status_code = status_code
+    if status_code == 200 and payload.get('version'):
+        response.set_etag(f"{job_id}-{payload['version']}")
+        return response.make_conditional(request)
+    return response
+
+def import_assignments_from_google(class_id, full_sync=False):
+    """
+    Helper function to start a background import of assignments from Google Classroom
+    Returns the ImportJob if started, None otherwise
     """
     # Get the class
     google_class = GoogleClass.query.get(class_id)
     if not google_class:
         print(f"Class with ID {class_id} not found")
-        return False
+        return None
     
     if google_class.owner_id != current_user.id:
         print(f"User {current_user.id} does not have permission for class {class_id}")
-        return False
+        return None
     
     # Get Google Classroom service using helper function
     credentials = get_google_credentials()
@@ -1754,429 +1240,17 @@ def import_assignments_from_google(class_id):
         # to redirect the user to the authentication page
         session['needs_google_auth'] = True
         flash('Google authentication expired. Please reconnect your Google account.', 'error')
-        return False
+        return None
     
-    # Get coursework (assignments)
+    # Coursework, roster and submissions are fetched by the background job
     try:
-        service = googleapiclient.discovery.build('classroom', 'v1', credentials=credentials)
-        
-        # List all coursework in the course
-        print(f"Fetching coursework for Google Classroom ID: {google_class.google_classroom_id}")
-        coursework_results = service.courses().courseWork().list(
-            courseId=google_class.google_classroom_id).execute()
-        coursework_items = coursework_results.get('courseWork', [])
-        print(f"Found {len(coursework_items)} coursework items")
-        
-        # Process each coursework item
-        for item in coursework_items:
-            # Check if assignment already exists
-            existing_assignment = Assignment.query.filter_by(
-                name=item['title'], 
-                class_id=google_class.id
-            ).first()
-            
-            if not existing_assignment:
-                # Create new assignment
-                print(f"Creating new assignment: {item['title']}")
-                new_assignment = Assignment(
-                    name=item['title'],
-                    question=item.get('description', ''),
-                    class_id=google_class.id,
-                    rubric_id=google_class.rubric_id
-                )
-                db.session.add(new_assignment)
-                db.session.flush()  # Get the ID without committing
-                
-                # Import submissions for this assignment
-                import_submissions_for_assignment(service, google_class.google_classroom_id, 
-                                               item['id'], new_assignment.id)
-            else:
-                # Update existing assignment
-                print(f"Updating existing assignment: {item['title']}")
-                existing_assignment.question = item.get('description', '')
-                
-                # Refresh submissions for existing assignment
-                import_submissions_for_assignment(service, google_class.google_classroom_id, 
-                                               item['id'], existing_assignment.id)
-        
-        db.session.commit()
-        return True
+        return start_import_job(google_class, current_user, full_sync)
     except Exception as e:
         db.session.rollback()
         flash(f'Error importing assignments: {str(e)}', 'error')
-        print(f"Error in import_assignments_from_google: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False
-
-
-def list_student_submissions(service, course_id, coursework_id):
-    """Retrieve all student submissions for a coursework."""
-    print(f"Fetching student submissions for coursework ID: {coursework_id}")
-    submissions_results = service.courses().courseWork().studentSubmissions().list(
-        courseId=course_id, 
-        courseWorkId=coursework_id
-    ).execute()
-    submissions = submissions_results.get('studentSubmissions', [])
-    print(f"Found {len(submissions)} student submissions")
-    return submissions
-
-def list_students(service, course_id):
-    """Retrieve all students in a class."""
-    print(f"Fetching students for course ID: {course_id}")
-    students_result = service.courses().students().list(courseId=course_id).execute()
-    students = students_result.get('students', [])
-    print(f"Found {len(students)} students")
-    return students
-
-def build_student_profile_map(service, students):
-    """Create a mapping of user IDs to student profiles."""
-    print("Building student profile map")
-    student_profile_map = {}
-    for s in students:
-        if 'userId' in s and 'profile' in s:
-            student_profile_map[s['userId']] = s['profile']
-    print(f"Built profile map for {len(student_profile_map)} students")
-    return student_profile_map
-
-def fetch_student_profile(service, student_id):
-    """Fetch student profile information."""
-    print(f"Fetching profile for student ID: {student_id}")
-    try:
-        student_info = service.userProfiles().get(userId=student_id).execute()
-        return {
-            'name': {'fullName': student_info.get('name', {}).get('fullName', 'Unknown Student')},
-            'emailAddress': student_info.get('emailAddress', '')  # Use empty string as default
-        }
-    except Exception as e:
-        print(f"Error fetching student profile: {e}")
-        # Return minimum profile information to avoid skipping the student
-        return {
-            'name': {'fullName': 'Unknown Student'},
-            'emailAddress': ''
-        }
-
-def extract_text_from_vision_api(file_path, mime_type):
-    """Extract text from files using Google Vision API."""
-    print(f"Extracting text from file: {file_path} with mime type: {mime_type}")
-    try:
-        from google.cloud import vision
-        vision_client = vision.ImageAnnotatorClient()
-        
-        with open(file_path, 'rb') as file:
-            content = file.read()
-        
-        image = vision.Image(content=content)
-        
-        if mime_type.startswith('image/'):
-            print("Processing as image")
-            response = vision_client.text_detection(image=image)
-            if response.text_annotations:
-                extracted_text = response.text_annotations[0].description
-                print(f"Extracted {len(extracted_text)} characters from image")
-                return extracted_text
-            else:
-                print("No text detected in image")
-                return ""
-        else:
-            # Process all other types as documents
-            print(f"Processing {mime_type} as document")
-            response = vision_client.document_text_detection(image=image)
-            extracted_text = response.full_text_annotation.text
-            print(f"Extracted {len(extracted_text)} characters from document")
-            return extracted_text
-    except Exception as e:
-        print(f"Error in Vision API extraction: {e}")
-        import traceback
-        traceback.print_exc()
-        return ""
-
-def process_drive_file(service, file_id, file_title):
-    """Retrieve file content from Google Drive."""
-    print(f"Processing Drive file: {file_title} (ID: {file_id})")
-    try:
-        import googleapiclient.discovery
-        import os
-        import tempfile
-        
-        drive_service = googleapiclient.discovery.build('drive', 'v3', credentials=service._http.credentials)
-        
-        # Get file metadata
-        file_metadata = drive_service.files().get(fileId=file_id, fields="mimeType, name").execute()
-        mime_type = file_metadata.get('mimeType', '')
-        print(f"File mime type: {mime_type}")
-        
-        # Get file content
-        file_content = drive_service.files().get_media(fileId=file_id).execute()
-        
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_title)[1]) as temp_file:
-            temp_file.write(file_content)
-            temp_file_path = temp_file.name
-            print(f"Saved file to temporary location: {temp_file_path}")
-        
-        # Process based on mime type
-        extracted_text = ""
-        if mime_type.startswith('text/'):
-            # For text files, just read the content
-            with open(temp_file_path, 'r', errors='ignore') as f:
-                extracted_text = f.read()
-            print(f"Read {len(extracted_text)} characters from text file")
-        elif mime_type == 'application/pdf':
-            # For PDFs, try to use PyPDF2 first
-            try:
-                import PyPDF2
-                pdf_text = []
-                with open(temp_file_path, 'rb') as f:
-                    pdf_reader = PyPDF2.PdfReader(f)
-                    for page_num in range(len(pdf_reader.pages)):
-                        page = pdf_reader.pages[page_num]
-                        page_text = page.extract_text()
-                        if page_text:
-                            pdf_text.append(page_text)
-                extracted_text = "\n".join(pdf_text)
-                print(f"Extracted {len(extracted_text)} characters from PDF using PyPDF2")
-                
-                # If no text was extracted, fall back to Vision API
-                if not extracted_text.strip():
-                    print("No text extracted with PyPDF2, falling back to Vision API")
-                    extracted_text = extract_text_from_vision_api(temp_file_path, mime_type)
-            except Exception as pdf_err:
-                print(f"PyPDF2 extraction failed: {pdf_err}, falling back to Vision API")
-                extracted_text = extract_text_from_vision_api(temp_file_path, mime_type)
-        elif mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-            # For DOCX files, try to use python-docx
-            try:
-                import docx
-                doc = docx.Document(temp_file_path)
-                extracted_text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                print(f"Extracted {len(extracted_text)} characters from DOCX using python-docx")
-                
-                # If no text was extracted, fall back to Vision API
-                if not extracted_text.strip():
-                    print("No text extracted with python-docx, falling back to Vision API")
-                    extracted_text = extract_text_from_vision_api(temp_file_path, mime_type)
-            except Exception as docx_err:
-                print(f"DOCX extraction failed: {docx_err}, falling back to Vision API")
-                extracted_text = extract_text_from_vision_api(temp_file_path, mime_type)
-        elif mime_type.startswith('image/'):
-            # For images, use Vision API
-            extracted_text = extract_text_from_vision_api(temp_file_path, mime_type)
-        else:
-            # For other types, try conversion or extraction
-            print(f"Handling unknown mime type: {mime_type}")
-            
-            # Try to use textract for advanced file types
-            try:
-                import textract
-                extracted_text = textract.process(temp_file_path).decode('utf-8', errors='ignore')
-                print(f"Extracted {len(extracted_text)} characters using textract")
-                
-                # If no text was extracted, fall back to Vision API
-                if not extracted_text.strip():
-                    print("No text extracted with textract, falling back to Vision API")
-                    extracted_text = extract_text_from_vision_api(temp_file_path, mime_type)
-            except Exception as textract_err:
-                print(f"Textract extraction failed: {textract_err}, falling back to Vision API")
-                extracted_text = extract_text_from_vision_api(temp_file_path, mime_type)
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
-        print(f"Cleaned up temporary file: {temp_file_path}")
-        
-        return extracted_text
-    except Exception as e:
-        print(f"Error processing drive file: {e}")
-        import traceback
-        traceback.print_exc()
-        return ""
-
-def process_submission(service, submission, student_profile_map, course_id):
-    """Process an individual student submission."""
-    import json
-    
-    student_id = submission.get('userId')
-    print(f"Processing submission for student ID: {student_id}")
-    
-    profile = student_profile_map.get(student_id)
-    if not profile:
-        print(f"Profile not found in map for student ID: {student_id}, fetching directly")
-        profile = fetch_student_profile(service, student_id)
-    
-    student_name = profile.get('name', {}).get('fullName', 'Unknown Student')
-    student_email = profile.get('emailAddress', '')  # Empty string as default
-    print(f"Student: {student_name}, Email: {student_email}")
-    
-    student_answer = ""
-    extracted_texts = []
-    file_links = []
-    
-    if 'assignmentSubmission' in submission:
-        assign_submission = submission['assignmentSubmission']
-        
-        # Check for text submission
-        if 'text' in assign_submission:
-            student_answer = assign_submission['text']
-            print(f"Text submission found: {len(student_answer)} characters")
-        
-        # Check for file attachments
-        if 'attachments' in assign_submission:
-            print(f"Found {len(assign_submission['attachments'])} attachments")
-            
-            for attachment in assign_submission['attachments']:
-                if 'driveFile' in attachment:
-                    drive_file = attachment['driveFile']
-                    file_id = drive_file['id']
-                    file_title = drive_file.get('title', drive_file.get('name', 'Untitled File'))
-                    
-                    print(f"Processing attachment: {file_title} (ID: {file_id})")
-                    
-                    # Add to file links
-                    file_links.append({
-                        'name': file_title,
-                        'id': file_id,
-                        'type': 'drive',
-                        'link': f"https://drive.google.com/file/d/{file_id}/view"
-                    })
-                    
-                    # Extract text from file
-                    extracted_text = process_drive_file(service, file_id, file_title)
-                    
-                    if extracted_text:
-                        print(f"Successfully extracted {len(extracted_text)} characters from {file_title}")
-                        # Store extracted text with file information
-                        extracted_texts.append({
-                            'file_name': file_title,
-                            'file_id': file_id,
-                            'text': extracted_text
-                        })
-                    else:
-                        print(f"No text extracted from {file_title}")
-                        # Store empty text information to acknowledge the file
-                        extracted_texts.append({
-                            'file_name': file_title,
-                            'file_id': file_id,
-                            'text': f"[No text content could be extracted from this file.]"
-                        })
-    
-    # Format the extracted text to be included in student_answer
-    full_answer = student_answer
-    for extracted in extracted_texts:
-        # Add delimiter and file information
-        if full_answer:
-            full_answer += "\n\n"
-        full_answer += f"--- Text extracted from {extracted['file_name']} ---\n{extracted['text']}"
-    
-    # If no text was extracted at all, add a note
-    if not full_answer.strip():
-        full_answer = "[No text content was found in this submission.]"
-    
-    # Debug output
-    print(f"Final student answer length: {len(full_answer)}")
-    print(f"File links: {len(file_links)}")
-    
-    submission_data_json = json.dumps({'files': file_links}) if file_links else None
-    return student_name, student_email, full_answer, submission_data_json
-
-
-def save_submission(student_name, student_email, student_answer, assignment_id, submission_data_json):
-    """Save or update submission in the database."""
-    print(f"Saving submission for student: {student_name}, email: {student_email}, assignment: {assignment_id}")
-    print(f"Student answer length: {len(student_answer)}")
-    print(f"Has submission data: {'Yes' if submission_data_json else 'No'}")
-    
-    try:
-        # If email is empty, generate a unique identifier for the student
-        if not student_email:
-            import hashlib
-            import time
-            # Generate a unique email-like identifier based on student name and timestamp
-            timestamp = int(time.time())
-            hash_obj = hashlib.md5(f"{student_name}_{timestamp}".encode())
-            student_email = f"student_{hash_obj.hexdigest()[:8]}@placeholder.edu"
-            print(f"Generated placeholder email for student: {student_email}")
-        
-        existing_submission = Submission.query.filter_by(
-            student_email=student_email, 
-            assignment_id=assignment_id
-        ).first()
-        
-        if existing_submission:
-            print(f"Updating existing submission ID: {existing_submission.id}")
-            existing_submission.student_answer = student_answer
-            existing_submission.student_name = student_name
-            
-            # Check if submission_data column exists
-            if hasattr(Submission, 'submission_data'):
-                existing_submission.submission_data = submission_data_json
-                print("Updated submission_data field")
-            else:
-                print("submission_data column not found in Submission model")
-            
-            db.session.commit()
-            print("Submission updated successfully")
-        else:
-            print("Creating new submission")
-            # Create new submission object
-            new_submission = Submission(
-                student_name=student_name,
-                student_email=student_email,
-                student_answer=student_answer,
-                assignment_id=assignment_id,
-                grade=0  # Default grade
-            )
-            
-            # Add submission_data if the column exists
-            if hasattr(Submission, 'submission_data'):
-                new_submission.submission_data = submission_data_json
-                print("Added submission_data field")
-            else:
-                print("submission_data column not found in Submission model")
-            
-            db.session.add(new_submission)
-            db.session.commit()
-            print(f"New submission created with ID: {new_submission.id}")
-        
-        return True
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error saving submission: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        logger.exception(f"Error in import_assignments_from_google: {str(e)}")
+        return None
 
-def import_submissions_for_assignment(service, course_id, coursework_id, assignment_id):
-    """Main function to import student submissions for an assignment."""
-    print(f"Importing submissions for assignment ID: {assignment_id}")
-    try:
-        # Get student submissions
-        student_submissions = list_student_submissions(service, course_id, coursework_id)
-        print(f"Found {len(student_submissions)} submissions")
-        
-        # Get students in the class
-        students = list_students(service, course_id)
-        print(f"Found {len(students)} students in the class")
-        
-        # Build student profile map
-        student_profile_map = build_student_profile_map(service, students)
-        print(f"Built profile map with {len(student_profile_map)} students")
-        
-        # Process each submission
-        for submission in student_submissions:
-            student_name, student_email, student_answer, submission_data_json = process_submission(
-                service, submission, student_profile_map, course_id
-            )
-            
-            # Process all students regardless of email status
-            print(f"Saving submission for {student_name} ({student_email or 'no email'})")
-            save_submission(student_name, student_email, student_answer, assignment_id, submission_data_json)
-        
-        return True
-    except Exception as e:
-        print(f"Error importing submissions: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
 
 @views.route('/get-google-classroom-students/<int:class_id>', endpoint='get_google_classroom_students')
 @login_required
@@ -2194,12 +1268,10 @@ def get_google_classroom_students(class_id):
         if not credentials:
             return jsonify({'error': 'Google authentication expired. Please reconnect your account.'}), 401
         
-        service = googleapiclient.discovery.build('classroom', 'v1', credentials=credentials)
+        service = google_service('classroom', 'v1', credentials)
         
         # Get students
-        students_result = service.courses().students().list(
-            courseId=google_class.google_classroom_id).execute()
-        students = students_result.get('students', [])
+        students = iter_students(service, google_class.google_classroom_id)
         
         # Format student data
         student_list = []
@@ -2328,36 +1400,10 @@ def get_extracted_text(submission_id, file_id):
         return jsonify({"error": "Permission denied"}), 403
     
     try:
-        # Check if submission has submission_data attribute
-        if not hasattr(submission, 'submission_data') or not submission.submission_data:
-            return jsonify({"error": "No file data available"}), 404
-        
-        submission_data = json.loads(submission.submission_data)
-        file_found = False
-        
-        # Find the specific file in the submission data
-        for file in submission_data.get('files', []):
-            if file.get('id') == file_id:
-                file_found = True
-                
-                # Parse the student_answer to find text extracted from this file
-                if submission.student_answer:
-                    # Look for the marker that indicates the start of extracted text for this file
-                    marker = f"--- Text extracted from {file.get('name')} ---"
-                    if marker in submission.student_answer:
-                        # Get the text after the marker
-                        parts = submission.student_answer.split(marker)
-                        for i, part in enumerate(parts):
-                            if i > 0:  # Skip the first part (before any marker)
-                                # Get text until the next marker or end of text
-                                extracted_text = part.split("--- Text extracted from")[0] if "--- Text extracted from" in part else part
-                                return jsonify({"text": extracted_text.strip()})
-                
-                # If we can't find extracted text for this specific file
-                return jsonify({"error": "No extracted text found for this file"}), 404
-        
-        if not file_found:
-            return jsonify({"error": "File not found in submission data"}), 404
+        extracted_text = attachment_text(submission, file_id)
+        if extracted_text is None:
+            return jsonify({"error": "No extracted text found for this file"}), 404
+        return jsonify({"text": extracted_text})
         
     except Exception as e:
         print(f"Error getting extracted text: {str(e)}")